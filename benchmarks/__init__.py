@@ -0,0 +1,3 @@
+"""
+Benchmarks for measuring how markdoc2 scales with the size of a wiki.
+"""
@@ -0,0 +1,204 @@
+"""
+Run the same pages through every installed markdown engine, timing each one
+and reporting where its html differs from the reference engine's. Run it from
+the project root with `python -m benchmarks.engines`.
+
+Usage: engines [options]
+
+Options:
+    --pages=N               The number of pages to generate [Default: 200]
+    --paragraphs=N          Paragraphs per page [Default: 5]
+    --code-blocks=N         Average code blocks per page [Default: 1]
+    --seed=N                Random seed for the generated pages [Default: 0]
+    --repeat=N              How many times to time each engine (the fastest
+                                run is kept) [Default: 3]
+    --reference=NAME        The engine to compare the others against
+                                [Default: markdown]
+    --extensions=LIST       Comma separated Python-Markdown extensions to
+                                use (the other engines ignore them)
+                                [Default: ]
+    --diffs=N               How many differences to show for each engine
+                                [Default: 1]
+    -o=FILE --output=FILE   Save the results (as JSON) to this file
+    -h --help               Show this help text
+"""
+
+import sys
+import json
+import time
+import random
+import difflib
+
+import docopt
+
+from markdoc2 import engines
+from markdoc2.metadata import split_front_matter
+
+from .wikigen import WikiShape, page_text
+
+
+# Snippets covering the markdown which every engine should agree on, plus a
+# few places where they're known to differ
+SAMPLES = {
+    'headings': '# One\n\n## Two\n\nThree\n=====\n\nFour\n----\n',
+    'emphasis': 'Some *emphasis*, **strong** and `code` text.\n',
+    'lists': '- one\n- two\n- three\n\n1. first\n2. second\n',
+    'nested lists': '- one\n\n    - nested\n\n- two\n',
+    'links': '[a link](http://example.com "Title") and '
+             '![an image](image.png)\n',
+    'blockquotes': '> quoted\n> text\n',
+    'code blocks': 'Code:\n\n    indented = True\n',
+    'fenced code': '```python\nfenced = True\n```\n',
+    'html': '<div class="note">raw html</div>\n\nafter\n',
+    'entities': 'A & B < C, &copy; &amp;\n',
+    'rules': 'above\n\n---\n\nbelow\n',
+    'line breaks': 'line  \nbreak\n',
+    'tables': '| a | b |\n|---|---|\n| 1 | 2 |\n',
+}
+
+
+def corpus(shape):
+    """
+    Get every document to run through the engines, as `(name, text)`
+    tuples: the samples followed by generated pages.
+    """
+    docs = sorted(SAMPLES.items())
+    rng = random.Random(shape.seed)
+    for i in range(shape.pages):
+        _, _, text = split_front_matter(
+                page_text(rng, shape, 'Page {}'.format(i)))
+        docs.append(('page {}'.format(i), text))
+    return docs
+
+
+def time_engine(name, docs, extensions, repeat):
+    """
+    Convert every document with an engine, returning the html and the
+    fastest time it took.
+    """
+    engine = engines.get_engine(name)
+
+    # Warm up (imports, creating converters, etc.) before timing anything
+    engine.convert('warm *up*', extensions)
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        html = [engine.convert(text, extensions) for _, text in docs]
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return html, best
+
+
+def differences(docs, reference, html):
+    """
+    Get the names of the documents whose (normalised) html differs from the
+    reference's, along with a diff for each.
+    """
+    diffs = []
+    for (name, _), expected, got in zip(docs, reference, html):
+        expected = engines.normalise_html(expected)
+        got = engines.normalise_html(got)
+        if expected != got:
+            diff = difflib.unified_diff(_lines(expected), _lines(got),
+                                        'reference', 'engine', lineterm='')
+            diffs.append((name, '\n'.join(diff)))
+    return diffs
+
+
+def _lines(html):
+    # One tag per line, so diffs point at the element which differs
+    return html.replace('><', '>\n<').splitlines()
+
+
+def run(shape, reference, extensions, repeat):
+    """
+    Run the corpus through every available engine, returning the results as
+    a dict.
+    """
+    docs = corpus(shape)
+    size = sum(len(text.encode('utf-8')) for _, text in docs)
+
+    names = engines.available_engines()
+    if reference not in names:
+        raise engines.UnsupportedEngine(
+            'The reference engine {!r} is not available'.format(reference))
+    names.remove(reference)
+    names.insert(0, reference)
+
+    outputs = {}
+    results = {}
+    for name in names:
+        html, seconds = time_engine(name, docs, extensions, repeat)
+        outputs[name] = html
+        diffs = differences(docs, outputs[reference], html)
+        results[name] = {
+                'seconds': seconds,
+                'docs_per_second': len(docs) / seconds,
+                'mb_per_second': size / seconds / 1e6,
+                'different': len(diffs),
+                'diffs': diffs,
+                }
+
+    return {
+            'meta': {
+                'shape': shape.as_dict(),
+                'docs': len(docs),
+                'bytes': size,
+                'reference': reference,
+                'extensions': extensions,
+                'repeat': repeat,
+                },
+            'engines': results,
+            }
+
+
+def print_results(results, show_diffs):
+    meta = results['meta']
+    print('{} documents ({} bytes), compared against {}'.format(
+        meta['docs'], meta['bytes'], meta['reference']))
+    print()
+    print('{:<14} {:>10} {:>12} {:>10} {:>12}'.format(
+        'engine', 'seconds', 'docs/second', 'MB/second', 'different'))
+
+    for name, result in results['engines'].items():
+        print('{:<14} {:>10.4f} {:>12.1f} {:>10.2f} {:>12}'.format(
+            name, result['seconds'], result['docs_per_second'],
+            result['mb_per_second'], result['different']))
+
+    for name, result in results['engines'].items():
+        for doc, diff in result['diffs'][:show_diffs]:
+            print()
+            print('{}: {}'.format(name, doc))
+            print(diff)
+
+
+def main():
+    args = docopt.docopt(__doc__)
+
+    shape = WikiShape(pages=int(args['--pages']),
+                      paragraphs=int(args['--paragraphs']),
+                      code_blocks=float(args['--code-blocks']),
+                      seed=int(args['--seed']))
+    extensions = [ext.strip() for ext in args['--extensions'].split(',')
+                  if ext.strip()]
+
+    try:
+        results = run(shape, args['--reference'], extensions,
+                      int(args['--repeat']))
+    except engines.UnsupportedEngine as e:
+        print(e)
+        return 1
+
+    if args['--output']:
+        with open(args['--output'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    print_results(results, int(args['--diffs']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
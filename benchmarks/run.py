@@ -0,0 +1,239 @@
+"""
+Time each phase of a markdoc2 build against a synthetic wiki. Run it from
+the project root with `python -m benchmarks.run`.
+
+Usage: run [options]
+       run compare <baseline> <results> [options]
+
+Options:
+    --pages=N               The number of pages to generate [Default: 1000]
+    --depth=N               How deep the directory tree goes [Default: 3]
+    --fanout=N              Sub-directories per directory [Default: 4]
+    --paragraphs=N          Paragraphs per page [Default: 5]
+    --code-blocks=N         Average code blocks per page [Default: 1]
+    --seed=N                Random seed for the generated wiki [Default: 0]
+    --repeat=N              How many times to time each phase (the fastest
+                                run is kept) [Default: 3]
+    -o=FILE --output=FILE   Save the results (as JSON) to this file
+    --baseline=FILE         Compare the results against a previous run
+    --threshold=PCT         How much slower (in percent) a phase can get
+                                before it counts as a regression
+                                [Default: 10]
+    -h --help               Show this help text
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+from collections import OrderedDict
+
+import docopt
+
+import markdoc2
+from markdoc2.metadata import read_metadata
+from markdoc2.middleware import relative_paths
+
+from .wikigen import WikiShape, generate
+
+
+PHASES = [
+        'walk',
+        'paths_to_pages',
+        'metadata',
+        'render',
+        'relative_paths',
+        'write',
+        'build_page',
+        'build',
+        'build_unchanged',
+        'iter_build',
+        'pipelined_build',
+        ]
+
+
+class Timer:
+    """
+    Keeps the fastest time seen for each phase.
+    """
+
+    def __init__(self):
+        self.times = OrderedDict((phase, None) for phase in PHASES)
+
+    def time(self, phase, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+
+        best = self.times.get(phase)
+        if best is None or elapsed < best:
+            self.times[phase] = elapsed
+        return result
+
+
+def run_once(timer, wiki_dir, scratch_dir):
+    output_dir = tempfile.mkdtemp(dir=scratch_dir)
+    b = markdoc2.Builder({'wiki-dir': wiki_dir, 'output-dir': output_dir})
+
+    timer.time('walk', lambda: list(b.walk()))
+    directories, pages = timer.time('paths_to_pages', b.paths_to_pages)
+    timer.time('metadata', lambda: [read_metadata(page.fullpath)
+                                    for page in pages])
+    things = pages + list(directories.values())
+
+    rendered = timer.time('render',
+                          lambda: [thing.render() for thing in things])
+    rewritten = timer.time('relative_paths', lambda: [
+        relative_paths(thing, html) for thing, html in zip(things, rendered)])
+    timer.time('write', lambda: [
+        b.write_page(thing, html) for thing, html in zip(things, rewritten)])
+
+    shutil.rmtree(output_dir)
+    b.output.reset()
+    timer.time('build_page', lambda: [b.build_page(thing) for thing in things])
+
+    shutil.rmtree(output_dir)
+    b.output.reset()
+    timer.time('build', b.build)
+    timer.time('build_unchanged', b.build)
+
+    shutil.rmtree(output_dir)
+    b.output.reset()
+    timer.time('iter_build', lambda: list(b.iter_build()))
+
+    shutil.rmtree(output_dir)
+    b.output.reset()
+    b.pipeline = True
+    timer.time('pipelined_build', b.build)
+    b.pipeline = False
+
+    shutil.rmtree(output_dir)
+
+
+def run(shape, repeat):
+    """
+    Generate a wiki and time each phase of building it, returning the
+    results as a dict.
+    """
+    scratch_dir = tempfile.mkdtemp(prefix='markdoc2-bench-')
+    try:
+        wiki_dir = os.path.join(scratch_dir, 'wiki')
+        names = generate(wiki_dir, shape)
+
+        timer = Timer()
+        for _ in range(repeat):
+            run_once(timer, wiki_dir, scratch_dir)
+    finally:
+        shutil.rmtree(scratch_dir)
+
+    return {
+            'meta': {
+                'markdoc2': markdoc2.__version__,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'shape': shape.as_dict(),
+                'pages': len(names),
+                'repeat': repeat,
+                },
+            'phases': {
+                phase: {
+                    'seconds': seconds,
+                    'per_page': seconds / max(1, len(names)),
+                    }
+                for phase, seconds in timer.times.items()
+                },
+            }
+
+
+def compare(baseline, results, threshold):
+    """
+    Compare two sets of results, returning the phases which got more than
+    `threshold` percent slower as `(phase, old, new)` tuples.
+    """
+    if baseline['meta'].get('shape') != results['meta'].get('shape'):
+        print('Warning: the baseline was run against a different wiki shape')
+
+    regressions = []
+    for phase in PHASES:
+        old = baseline['phases'].get(phase, {}).get('seconds')
+        new = results['phases'].get(phase, {}).get('seconds')
+        if old is None or new is None:
+            continue
+        if new > old * (1 + threshold / 100):
+            regressions.append((phase, old, new))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print('{:<18} {:>12} {:>14} {:>10}'.format(
+        'phase', 'seconds', 'ms per page', 'change'))
+
+    for phase in PHASES:
+        timing = results['phases'].get(phase)
+        if timing is None:
+            continue
+
+        change = ''
+        if baseline is not None:
+            old = baseline['phases'].get(phase, {}).get('seconds')
+            if old:
+                change = '{:+.1f}%'.format(
+                    (timing['seconds'] - old) / old * 100)
+
+        print('{:<18} {:>12.4f} {:>14.4f} {:>10}'.format(
+            phase, timing['seconds'], timing['per_page'] * 1000, change))
+
+
+def report(baseline, results, threshold):
+    print_results(results, baseline)
+
+    regressions = compare(baseline, results, threshold)
+    if not regressions:
+        return 0
+
+    print()
+    print('Regressions (more than {}% slower):'.format(threshold))
+    for phase, old, new in regressions:
+        print('    {}: {:.4f}s -> {:.4f}s'.format(phase, old, new))
+    return 1
+
+
+def load(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def main():
+    args = docopt.docopt(__doc__)
+    threshold = float(args['--threshold'])
+
+    if args['compare']:
+        return report(load(args['<baseline>']), load(args['<results>']),
+                      threshold)
+
+    shape = WikiShape(pages=int(args['--pages']),
+                      depth=int(args['--depth']),
+                      fanout=int(args['--fanout']),
+                      paragraphs=int(args['--paragraphs']),
+                      code_blocks=float(args['--code-blocks']),
+                      seed=int(args['--seed']))
+
+    print('Benchmarking {}'.format(shape))
+    results = run(shape, int(args['--repeat']))
+
+    if args['--output']:
+        with open(args['--output'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args['--baseline']:
+        return report(load(args['--baseline']), results, threshold)
+
+    print_results(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
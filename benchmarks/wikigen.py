@@ -0,0 +1,151 @@
+"""
+Generate synthetic wikis of a particular shape for benchmarking.
+"""
+
+import os
+import random
+
+
+WORDS = '''
+    lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod
+    tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam
+    quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo
+    consequat duis aute irure in reprehenderit voluptate velit esse cillum
+    fugiat nulla pariatur excepteur sint occaecat cupidatat non proident sunt
+    culpa qui officia deserunt mollit anim id est laborum
+    '''.split()
+
+CODE_SAMPLES = [
+    ('python', '''def fib(n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+'''),
+    ('c', '''int main(int argc, char **argv) {
+    printf("Hello, World!\\n");
+    return 0;
+}
+'''),
+    ('bash', '''for f in *.md; do
+    echo "$f"
+done
+'''),
+]
+
+
+class WikiShape:
+    """
+    The parameters describing a synthetic wiki.
+    """
+
+    def __init__(self, pages=1000, depth=3, fanout=4, paragraphs=5,
+                 code_blocks=1.0, seed=0):
+        """
+        Parameters
+        ----------
+        pages: int
+            The total number of pages to generate.
+        depth: int
+            How many levels of sub-directories to create.
+        fanout: int
+            How many sub-directories each directory has.
+        paragraphs: int
+            The number of paragraphs on each page.
+        code_blocks: float
+            The average number of code blocks on each page.
+        seed: int
+            Seed for the random number generator, so the same shape always
+            generates the same wiki.
+        """
+        self.pages = pages
+        self.depth = depth
+        self.fanout = fanout
+        self.paragraphs = paragraphs
+        self.code_blocks = code_blocks
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __repr__(self):
+        return '<{}: {}>'.format(
+                self.__class__.__name__,
+                ', '.join('{}={}'.format(k, v)
+                          for k, v in sorted(self.as_dict().items())))
+
+
+def directories(shape):
+    """
+    Get every directory in the wiki (relative to its root), parents first.
+    """
+    dirs = ['']
+    level = ['']
+    for _ in range(shape.depth):
+        next_level = []
+        for parent in level:
+            for i in range(shape.fanout):
+                next_level.append(os.path.join(parent, 'dir_{}'.format(i)))
+        dirs.extend(next_level)
+        level = next_level
+    return dirs
+
+
+def page_text(rng, shape, title):
+    lines = [
+            '---',
+            'title: {}'.format(title),
+            'tags: [{}]'.format(', '.join(rng.sample(WORDS, 3))),
+            'date: 2020-01-{:02}'.format(rng.randint(1, 28)),
+            '---',
+            title, '=' * len(title), '',
+            ]
+
+    # Spread the code blocks out so the average is right
+    code_blocks = int(shape.code_blocks)
+    if rng.random() < shape.code_blocks - code_blocks:
+        code_blocks += 1
+    code_after = set(rng.sample(range(shape.paragraphs),
+                                min(code_blocks, shape.paragraphs)))
+
+    for i in range(shape.paragraphs):
+        words = rng.choices(WORDS, k=rng.randint(40, 120))
+        lines.append(' '.join(words).capitalize() + '.')
+        lines.append('')
+
+        if i % 3 == 0:
+            lines.append('Heading {}'.format(i))
+            lines.append('-' * len(lines[-1]))
+            lines.append('')
+            lines.append('See the [home page](/index.html) for more.')
+            lines.append('')
+
+        if i in code_after:
+            lang, code = rng.choice(CODE_SAMPLES)
+            lines.append('    :::{}'.format(lang))
+            lines.extend('    ' + line for line in code.splitlines())
+            lines.append('')
+
+    return '\n'.join(lines)
+
+
+def generate(root, shape):
+    """
+    Generate a wiki with the given `WikiShape` in the `root` directory,
+    returning the (relative) names of every page created.
+    """
+    rng = random.Random(shape.seed)
+    dirs = directories(shape)
+    names = []
+
+    for i in range(shape.pages):
+        directory = dirs[i % len(dirs)]
+        name = os.path.join(directory, 'page_{}.md'.format(i))
+        full_name = os.path.join(root, name)
+
+        os.makedirs(os.path.dirname(full_name), exist_ok=True)
+        with open(full_name, 'w') as f:
+            f.write(page_text(rng, shape, 'Page {}'.format(i)))
+        names.append(name)
+
+    return names
@@ -3,24 +3,48 @@ A Python 3 version of `Markdoc <http://markdoc.org/>`.
 """
 
 import os
+import importlib
 
 # Put definitions for constants above to prevent circular imports
 PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
 STATIC_DIR = os.path.join(PROJECT_ROOT, 'static')
 TEMPLATE_DIR = os.path.join(STATIC_DIR, 'templates')
 
+__version__ = '0.2.0'
+
 # flake8: NOQA
-from .builder import Builder, Crumb
-from .render import Page, Directory
-from .exceptions import MarkdocError, InvalidFileName
+from .exceptions import (MarkdocError, InvalidFileName, UnsupportedEngine,
+                         WatcherError)
+
+# These pull in markdown and jinja2 (which take far longer to import than
+# running something like `markdoc2 --version`), so they're only imported the
+# first time they're used
+_LAZY = {
+    'Builder': 'builder',
+    'Crumb': 'builder',
+    'Page': 'render',
+    'Directory': 'render',
+    }
 
 
 __all__ = [
     'PROJECT_ROOT', 'STATIC_DIR', 'TEMPLATE_DIR',
     'Builder', 'Crumb',
     'Page', 'Directory',
-    'MarkdocError', 'InvalidFileName',
+    'MarkdocError', 'InvalidFileName', 'UnsupportedEngine', 'WatcherError',
     ]
 
-__version__ = '0.2.0'
 
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(
+            __name__, name))
+
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
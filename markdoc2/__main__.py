@@ -5,14 +5,48 @@ project.
 Usage: markdoc2 build [options]
        markdoc2 init <path>
        markdoc2 watch [options]
+       markdoc2 serve [options]
 
 Options:
     -o=OUTDIR --output-dir=OUTDIR   The directory to put all rendered html
-                                        into [Default: _html]
+                                        into, or an archive to write it to
+                                        (.tar, .tar.gz, .zip or .sqlite)
+                                        [Default: _html]
     -s=SRC --source-dir=SRC         The directory containing the wiki's
                                         source files [Default: wiki]
+    -c=DIR --cache-dir=DIR          A directory to keep caches in between
+                                        builds (e.g. compiled templates)
+    -j=N --jobs=N                   The number of processes to render pages
+                                        with [Default: 1]
+    -f --force                      Rebuild every page, even if it hasn't
+                                        changed since the last build
+    -z --compress                   Write gzipped (and brotli compressed,
+                                        if available) copies of every page
+    -m=NAME --markdown-engine=NAME  The markdown engine to render pages
+                                        with (markdown, markdown-it, mistune
+                                        or cmark) [Default: markdown]
+    --search                        Build a full-text search index in the
+                                        output directory
+    --pipeline                      Read, render and write pages at the
+                                        same time in separate threads, and
+                                        show how busy each stage was
+    --trace=FILE                    Record how long each stage of every
+                                        page takes (in Chrome's trace event
+                                        format) and show the slowest pages
     -b --browser                    Open the wiki up in your browser after
                                         building
+    -d=SECS --debounce=SECS         When watching, how long to wait for
+                                        changes to settle before rebuilding
+                                        [Default: 0.2]
+    -w=NAME --watcher=NAME          How to watch for changes: inotify,
+                                        poll (for network drives or huge
+                                        wikis) or auto [Default: auto]
+    -p=PORT --port=PORT             The port to serve the wiki on
+                                        [Default: 8000]
+    --host=HOST                     The address to serve the wiki on
+                                        [Default: 127.0.0.1]
+    --lazy                          Don't build anything up front, render
+                                        pages when they are requested
     -h --help                       Show this help text
     -V --version                    Print the version number and exit
 """
@@ -20,28 +54,53 @@ Options:
 import os
 import sys
 import shutil
-import subprocess
 import docopt
 import markdoc2
 
 
-def build(args):
+# Command line option -> (config key, how to convert its value), for the
+# options which only go in the config when they're given
+CONFIG_OPTIONS = {
+    '--cache-dir': ('cache-dir', str),
+    '--jobs': ('jobs', int),
+    '--force': ('force', bool),
+    '--trace': ('trace', bool),
+    '--markdown-engine': ('markdown-engine', str),
+    '--search': ('search', bool),
+    '--compress': ('compress', bool),
+    '--pipeline': ('pipeline', bool),
+    }
+
+
+def make_config(args):
     """
-    Build all html files.
+    Turn the command line arguments into a `Builder` config dict.
     """
     config = {
             'wiki-dir': args['--source-dir'],
             'output-dir': args['--output-dir'],
             }
 
+    for option, (key, convert) in CONFIG_OPTIONS.items():
+        if args.get(option):
+            config[key] = convert(args[option])
+
+    return config
+
+
+def build(args):
+    """
+    Build all html files.
+    """
+    config = make_config(args)
+
     if not os.path.exists(args['--source-dir']):
         print('No wiki found at {}'.format(args['--source-dir']))
         print('Aborting...')
         return 1
 
-    b = markdoc2.Builder(config)
-
     try:
+        b = markdoc2.Builder(config)
         b.build()
     except markdoc2.MarkdocError as e:
         print('Error encountered while building!')
@@ -49,7 +108,18 @@ def build(args):
         print(e)
         return 1
 
+    if b.pipeline_stats is not None:
+        print(b.pipeline_stats.summary())
+
+    if args.get('--trace'):
+        b.tracer.save(args['--trace'])
+        print(b.tracer.summary())
+        print()
+        print('Trace written to {}'.format(args['--trace']))
+
     if args['--browser']:
+        import subprocess
+
         index_page = os.path.join(b.output_dir, 'index.html')
         subprocess.Popen('xdg-open "{}"'.format(index_page), shell=True)
 
@@ -90,12 +160,45 @@ def watch(args):
 
     from . import notify
 
-    config = {
-            'wiki-dir': args['--source-dir'],
-            'output-dir': args['--output-dir'],
-            }
+    config = make_config(args)
     b = markdoc2.Builder(config)
-    notify.auto_build(b)
+    try:
+        notify.auto_build(b, debounce=float(args.get('--debounce') or 0.2),
+                          backend=args.get('--watcher') or 'auto')
+    except markdoc2.MarkdocError as e:
+        print(e)
+        return 1
+
+
+def serve(args):
+    """
+    Serve the wiki locally, rebuilding pages and reloading the browser when
+    they are edited.
+    """
+    from . import server
+
+    host = args.get('--host') or '127.0.0.1'
+    port = int(args.get('--port') or 8000)
+
+    if args.get('--lazy'):
+        if not os.path.exists(args['--source-dir']):
+            print('No wiki found at {}'.format(args['--source-dir']))
+            print('Aborting...')
+            return 1
+
+        b = markdoc2.Builder(make_config(args))
+        server.serve_lazy(b, host=host, port=port)
+        return 0
+
+    print('Doing initial build...')
+    if build(args) != 0:
+        return 1
+
+    b = markdoc2.Builder(make_config(args))
+    server.serve(b, host=host, port=port,
+                 debounce=float(args.get('--debounce') or 0.2),
+                 watcher=args.get('--watcher') or 'auto')
+    return 0
 
 
 def main():
@@ -107,6 +210,8 @@ def main():
         sys.exit(init(args))
     elif args['watch']:
         sys.exit(watch(args))
+    elif args['serve']:
+        sys.exit(serve(args))
 
 
 if __name__ == "__main__":
@@ -1,14 +1,26 @@
 from collections import namedtuple
+import copy
 import os
 
-from . import TEMPLATE_DIR
-from .render import Page, Directory
+from . import TEMPLATE_DIR, engines, search, trace
+from .render import BasePage, Page, Directory, PageContext
+from .templating import TemplateEngine
+from .manifest import Manifest, MANIFEST_NAME, fingerprint
+from .metadata import MetadataCache, CACHE_NAME as METADATA_CACHE
+from .output import open_output
 from .exceptions import InvalidFileName
-from .middleware import relative_paths
+from .ignore import IgnoreRules, IGNORE_FILE
+from .middleware import (relative_paths, relative_paths_soup,
+                         relative_paths_tree, is_tree_middleware, parse)
 
 
 Crumb = namedtuple('Crumb', ['name', 'href'])
 
+CODEHILITE = 'markdown.extensions.codehilite'
+
+# Keep in sync with markdoc2.highlight (which imports markdown)
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
 
 class Builder:
     """
@@ -22,62 +34,270 @@ class Builder:
         self.template_dir = os.path.abspath(self.config.get('template-dir',
                                                             TEMPLATE_DIR))
 
-        self.output_dir = os.path.abspath(
-                self.config.get('output-dir', '_html'))
+        self.output = self._open_output()
+        self.output_dir = self.output.root
+
+        # The output files whose contents changed during the last build
+        self.written = []
+
+        # Where to keep things which can be reused between builds
+        cache_dir = self.config.get('cache-dir')
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+
+        # Every page shares the one template engine so templates only get
+        # compiled once per build
+        template_cache = None
+        if self.cache_dir:
+            template_cache = os.path.join(self.cache_dir, 'templates')
+        self.templates = TemplateEngine(self.template_dir, template_cache)
+
+        # Each page's front matter, kept until the page changes
+        metadata_cache = None
+        if self.cache_dir:
+            metadata_cache = os.path.join(self.cache_dir, METADATA_CACHE)
+        self.metadata = MetadataCache(metadata_cache)
 
         # Make sure we can handle at least markdown documents
         if 'document-extensions' not in self.config:
             self.config['document-extensions'] = ['md']
+        self._suffixes = frozenset('.' + ext.lstrip('.') for ext in
+                                   self.config['document-extensions'])
+
+        # Patterns from the wiki's .markdocignore (loaded on demand)
+        self._ignore = None
+        self._ignore_mtime = None
 
         self.middleware = self.config.get('middleware', [])
-        self.middleware.append(relative_paths)
+        self.middleware.append(self._link_rewriter())
+
+        self.md_extensions = list(self.config.get('markdown-extensions',
+                                                  BasePage.MD_EXTENSIONS))
+        self.md_extension_configs = {}
+
+        # What turns markdown into html (see markdoc2.engines)
+        self.md_engine = self.config.get('markdown-engine',
+                                         engines.DEFAULT_ENGINE)
+        engines.check_engine(self.md_engine)
+
+        # Highlighted code blocks can be reused between builds
+        if self.cache_dir and CODEHILITE in self.md_extensions:
+            self._use_highlight_cache()
+
+        # How many processes to render pages with
+        self.jobs = max(1, int(self.config.get('jobs', 1)))
+
+        # Rebuild everything, even if the manifest says it's up to date
+        self.force = self.config.get('force', False)
+
+        # Keep a full-text search index in the output directory
+        self.search = bool(self.config.get('search', False))
+
+        # Search documents for pages rendered since the index was updated
+        self._extracted = {}
+
+        # Read, render and write pages in separate stages running at the
+        # same time (see markdoc2.pipeline). Either true or a dict of options
+        # for the `Pipeline`, e.g. {'readers': 4, 'queue-size': 64}.
+        self.pipeline = self.config.get('pipeline', False)
+
+        # Queue and stage statistics from the last pipelined build
+        self.pipeline_stats = None
+
+        # Breadcrumbs for each directory, shared by everything inside it
+        self._crumbs = {}
+        self._context = None
+        self._context_key = None
+
+        # Record how long each stage of rendering every page takes
+        if self.config.get('trace'):
+            self.tracer = trace.Tracer()
+        else:
+            self.tracer = trace.NullTracer()
+
+    def _open_output(self):
+        # Where the html goes. Usually a directory, but output-dir can also
+        # be an archive (e.g. "wiki.tar.gz") or the sink can be given as-is
+        output = self.config.get('output')
+        if output is None:
+            output = open_output(os.path.abspath(
+                    self.config.get('output-dir', '_html')))
+
+        # Write precompressed (.gz and, if possible, .br) copies of each page
+        # as it's written. Either true or a list of formats.
+        compress = self.config.get('compress')
+        if compress:
+            from .compress import CompressedOutput
+            formats = None if compress is True else compress
+            output = CompressedOutput(output, formats)
+        return output
+
+    def _link_rewriter(self):
+        if self.config.get('link-rewriter') == 'soup':
+            return relative_paths_soup
+        if any(is_tree_middleware(m) for m in self.middleware):
+            # The page is getting parsed anyway, so rewrite links on the tree
+            return relative_paths_tree
+        return relative_paths
+
+    def _use_highlight_cache(self):
+        # Swap codehilite for the same extension with a persistent cache
+        i = self.md_extensions.index(CODEHILITE)
+        self.md_extensions[i] = 'markdoc2.highlight'
+        self.md_extension_configs['markdoc2.highlight'] = {
+                'cache_dir': os.path.join(self.cache_dir, 'highlight'),
+                'cache_size': int(self.config.get(
+                    'highlight-cache-size', DEFAULT_CACHE_SIZE)),
+                }
 
     def _valid_extension(self, filename):
         """
         Check if a file is part of the wiki.
         """
-        return any(filename.endswith(ext)
-                   for ext in self.config['document-extensions'])
+        i = filename.rfind('.')
+        return i != -1 and filename[i:] in self._suffixes
+
+    @property
+    def ignore(self):
+        """
+        The `IgnoreRules` from the wiki's `.markdocignore`, reloaded whenever
+        the file changes.
+        """
+        filename = os.path.join(self.wiki_dir, IGNORE_FILE)
+        try:
+            mtime = os.stat(filename).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        if self._ignore is None or mtime != self._ignore_mtime:
+            self._ignore = IgnoreRules.load(filename)
+            self._ignore_mtime = mtime
+        return self._ignore
+
+    def _scan(self, dirs, ignore):
+        """
+        List a directory (given the names of the directories leading to it),
+        skipping anything hidden or ignored. Returns a list of sub-directory
+        names and a list of `os.DirEntry`s for the documents.
+
+        Symlinked directories aren't followed.
+        """
+        subdirs = []
+        documents = []
+
+        try:
+            it = os.scandir(os.path.join(self.wiki_dir, *dirs))
+        except OSError:
+            return subdirs, documents
+
+        with it:
+            for entry in it:
+                is_dir = self._scan_entry(entry, dirs, ignore)
+                if is_dir is None:
+                    continue
+                if is_dir:
+                    subdirs.append(entry.name)
+                else:
+                    documents.append(entry)
+
+        return subdirs, documents
+
+    def _scan_entry(self, entry, dirs, ignore):
+        """
+        Check whether an entry in a directory belongs in the wiki, returning
+        `True` for a sub-directory, `False` for a document or `None` if it
+        should be skipped.
+        """
+        name = entry.name
+        if name.startswith('.'):
+            return None
+
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            return None
+        if not is_dir and not self._valid_extension(name):
+            return None
+
+        if ignore and ignore.match('/'.join(dirs + (name,)), is_dir):
+            return None
+        if is_dir and entry.is_symlink():
+            return None
+        return is_dir
 
     def walk(self):
         """
         Walk through the wiki, yielding info for each document.
 
         For each document encountered, a `(filename, crumbs)` tuple will be
-        yielded.
+        yielded. Hidden and ignored directories are never descended into.
         """
-        for dirpath, subdirs, files in os.walk(self.wiki_dir):
-            # Skip hidden files
-            files = filter(lambda d: not d.startswith('.'), files)
+        ignore = self.ignore
+        stack = [()]
 
-            # skip this directory if it is hidden too
-            if os.path.basename(dirpath).startswith('.'):
-                continue
+        while stack:
+            dirs = stack.pop()
+            subdirs, documents = self._scan(dirs, ignore)
+
+            # Every document in a directory shares the same parent crumbs
+            trail = self._trail(dirs)
 
-            for filename in filter(self._valid_extension, files):
-                full_filename = os.path.join(dirpath, filename)
-                rel_name = os.path.relpath(full_filename, start=self.wiki_dir)
-                name = os.path.basename(rel_name)
-                dirs = rel_name.split('/')[:-1]
+            for entry in documents:
+                filename = entry.name
 
                 # Make sure there are no index.* files
-                if os.path.splitext(os.path.basename(full_filename))[0] == 'index':
-                    raise InvalidFileName(full_filename)
+                if filename.rpartition('.')[0] == 'index':
+                    raise InvalidFileName(entry.path)
 
-                crumbs = []
+                # Then add the page itself
+                crumbs = list(trail)
+                crumbs.append(Crumb(filename, None))
+                yield filename, crumbs
 
-                # Add the root dir
-                crumbs.append(Crumb('index', '/'))
+            # Visit sub-directories in the order they were found
+            stack.extend(dirs + (name,) for name in reversed(subdirs))
 
-                # Add all other parent directories
-                for d in dirs:
-                    href = os.path.join(crumbs[-1].href, d) + '/'
-                    temp = Crumb(d, href)
-                    crumbs.append(temp)
+    def directory_crumbs(self, dirs):
+        """
+        Get the breadcrumbs leading from the wiki root to a directory, given
+        the names of its parent directories.
+        """
+        return list(self._trail(tuple(dirs)))
 
-                # Then add the page itself
-                crumbs.append(Crumb(name, None))
-                yield name, crumbs
+    def _trail(self, dirs):
+        """
+        Get the (cached) tuple of breadcrumbs for a directory. Each crumb is
+        only created once and shared with every sub-directory.
+        """
+        trail = self._crumbs.get(dirs)
+        if trail is None:
+            if dirs:
+                parent = self._trail(dirs[:-1])
+                href = os.path.join(parent[-1].href, dirs[-1]) + '/'
+                trail = parent + (Crumb(dirs[-1], href),)
+            else:
+                trail = (Crumb('index', '/'),)
+            self._crumbs[dirs] = trail
+        return trail
+
+    @property
+    def page_context(self):
+        """
+        The `PageContext` shared by every page. It gets replaced if any of the
+        settings it holds are swapped out.
+        """
+        key = (self.template_dir, self.wiki_dir, id(self.templates),
+               id(self.md_extensions), id(self.md_extension_configs),
+               self.md_engine, id(self.metadata))
+        if self._context is None or key != self._context_key:
+            self._context = PageContext(
+                    self.template_dir, self.wiki_dir,
+                    md_extensions=self.md_extensions,
+                    engine=self.templates,
+                    md_extension_configs=self.md_extension_configs,
+                    md_engine=self.md_engine,
+                    metadata=self.metadata)
+            self._context_key = key
+        return self._context
 
     def paths_to_pages(self):
         directories = {}
@@ -86,66 +306,99 @@ class Builder:
         for filename, crumbs in self.walk():
             # Construct the page's path using the crumbs
             path = '/'.join(c.name for c in crumbs[1:])
-            page = Page(path, crumbs, self.template_dir, self.wiki_dir)
+            page = Page(path, crumbs, context=self.page_context)
 
             pages.append(page)
 
             # Add the page to it's parent directory
             # If we're in the root directory, then set it to "."
             parent_directory = os.path.dirname(path) or '.'
+            parent = self._get_directory(directories,
+                                         parent_directory,
+                                         crumbs[:-1])
+            parent.add_child(page)
 
-            if parent_directory not in directories:
-                parent_crumbs = crumbs[:-1]
-                d = Directory(parent_directory,
-                              parent_crumbs,
-                              TEMPLATE_DIR,
-                              self.wiki_dir)
+        return directories, pages
 
-                # Add the new directory to the directories dictionary
-                directories[parent_directory] = d
+    def _get_directory(self, directories, path, crumbs):
+        """
+        Get the `Directory` for `path`, creating it (and any parent
+        directories which don't contain documents themselves) if necessary.
+        """
+        if path in directories:
+            return directories[path]
 
-                # If this is a sub-directory, add the new directory to its
-                # parent
-                if parent_directory != '.':
-                    parent_parent = os.path.dirname(parent_directory) or '.'
-                    directories[parent_parent].add_child(d)
+        # Make sure parents always come before their sub-directories
+        parent = None
+        if path != '.':
+            parent_path = os.path.dirname(path) or '.'
+            parent = self._get_directory(directories, parent_path, crumbs[:-1])
 
-            directories[parent_directory].add_child(page)
+        d = Directory(path, crumbs, context=self.page_context)
 
-        return directories, pages
+        # Add the new directory to the directories dictionary
+        directories[path] = d
 
-    def build_page(self, page):
+        # If this is a sub-directory, add the new directory to its parent
+        if parent is not None:
+            parent.add_child(d)
+
+        return d
+
+    def output_filename(self, page):
+        """
+        Get the absolute path of the html file a page will be rendered to.
+        """
         full_path = os.path.join(self.output_dir, page.path)
         full_path = os.path.abspath(full_path)
 
-        # First make sure the page's directory exists
-        parent_dir = os.path.dirname(full_path)
-        try:
-            os.makedirs(parent_dir)
-        except FileExistsError:
-            pass
-
-        # Get the output file's path
         if isinstance(page, Directory):
-            # Create the directory then add a _listing.html file to it
-            try:
-                os.mkdir(full_path)
-            except FileExistsError:
-                pass
-            filename = os.path.join(full_path, 'index.html')
+            # Directories get an index.html file inside them
+            return os.path.join(full_path, 'index.html')
         else:
             # Convert the file name from *.md to *.html
             filename, ext = os.path.splitext(full_path)
-            filename = filename + '.html'
+            return filename + '.html'
 
-        html = page.render()
-        html = self.apply_middleware(page, html)
+    def render_page(self, page, text=None):
+        """
+        Render a page to html and run it through the middleware. A page's
+        markdown source is read from disk unless it's given as `text`.
+        """
+        with trace.span('render_page', 'page', page=page.path):
+            if isinstance(page, Page) and (self.search or text is not None):
+                content = page.render_markdown(text)
+                if self.search:
+                    # Index the page's content while we've got it
+                    with trace.span('search', 'stage', page=page.path):
+                        self._extracted[page.path] = search.extract(
+                                page, content)
+                html = page.render(content)
+            else:
+                html = page.render()
+            return self.apply_middleware(page, html)
 
-        with open(filename, 'w') as f:
-            f.write(html)
+    def write_page(self, page, html):
+        """
+        Write a page's rendered html to the output directory, returning the
+        file name it was written to.
+
+        If the file already contains exactly the same html it isn't touched.
+        """
+        filename = self.output_filename(page)
+
+        with trace.span('write', 'stage', page=page.path):
+            changed = self.output.write(filename, html.encode('utf-8'))
+        if changed:
+            self.written.append(filename)
 
         return filename
 
+    def build_page(self, page):
+        with trace.span('build_page', 'page', page=page.path):
+            html = self.render_page(page)
+            return self.write_page(page, html)
+
     def apply_middleware(self, page, html):
         """
         Apply all the middlewares, allowing the user to make alterations to
@@ -153,19 +406,625 @@ class Builder:
 
         A `middleware` is defined as a callable with the signature:
         middleware(page, html) -> processed_html
+
+        Tree middlewares (see `markdoc2.middleware.tree_middleware`) instead
+        alter a parsed version of the page in-place. Consecutive tree
+        middlewares all share the one tree, which is only turned back into
+        html when a string middleware needs it (or at the end).
         """
+        soup = None
+
         for middleware in self.middleware:
-            html = middleware(page, html)
+            name = getattr(middleware, '__name__', type(middleware).__name__)
+
+            if is_tree_middleware(middleware):
+                if soup is None:
+                    with trace.span('parse', 'stage', page=page.path):
+                        soup = parse(html)
+                with trace.span(name, 'stage', page=page.path):
+                    middleware(page, soup)
+                continue
+
+            if soup is not None:
+                with trace.span('serialise', 'stage', page=page.path):
+                    html = str(soup)
+                soup = None
+
+            with trace.span(name, 'stage', page=page.path):
+                html = middleware(page, html)
+
+        if soup is not None:
+            with trace.span('serialise', 'stage', page=page.path):
+                html = str(soup)
         return html
 
+    def load_manifest(self, force=None):
+        """
+        Load the manifest recording what the last build wrote. If `force` is
+        set (it defaults to the builder's `force`), an empty manifest is used
+        so everything gets rebuilt.
+        """
+        if force is None:
+            force = self.force
+        filename = os.path.join(self.output_dir, MANIFEST_NAME)
+        fp = fingerprint(self.template_dir, self.md_extensions,
+                         self.middleware, self.md_engine)
+
+        if force or not self.output.incremental:
+            return Manifest(filename, self.wiki_dir, fp)
+        return Manifest.load(filename, self.wiki_dir, fp)
+
+    def _save_manifest(self, manifest):
+        # Only sinks which keep their contents between builds need one
+        if self.output.incremental:
+            manifest.save()
+        self.metadata.save()
+
+    def _manifest_key(self, page):
+        return os.path.relpath(self.output_filename(page), self.output_dir)
+
+    def load_search_index(self, force=None):
+        """
+        Load the search index from the last build, or `None` if search is
+        turned off. If `force` is set (it defaults to the builder's `force`),
+        an empty index is used.
+        """
+        if not self.search:
+            return None
+
+        self._extracted = {}
+        if force is None:
+            force = self.force
+        if force or not self.output.incremental:
+            return search.SearchIndex(self.output_dir)
+        return search.SearchIndex.load(self.output_dir)
+
+    def _update_search_index(self, index):
+        """
+        Add every page extracted since the last update to the search index.
+        """
+        if index is None:
+            return
+
+        # Pages can finish rendering in any order (e.g. in a pipelined
+        # build), so new pages get their ids in a fixed order
+        for path, document in sorted(self._extracted.items()):
+            index.update(path, document)
+        self._extracted = {}
+
+    def _save_search_index(self, index):
+        if index is not None:
+            self._update_search_index(index)
+            self.written.extend(index.save(self.output))
+
+    def is_fresh(self, page, manifest, index=None):
+        """
+        Check whether a page's output is already up to date. If a search
+        index is given, pages which are missing from it aren't fresh either.
+        """
+        if (index is not None and isinstance(page, Page) and
+                page.path not in index):
+            return False
+
+        key = self._manifest_key(page)
+
+        # A listing only depends on its crumbs and direct children
+        if isinstance(page, Directory):
+            fresh = manifest.has_digest(key, page.fingerprint())
+        else:
+            fresh = manifest.is_fresh(key, page.path)
+
+        return fresh and self.output.exists(self.output_filename(page))
+
     def build(self):
-        directories, pages = self.paths_to_pages()
+        """
+        Build the wiki, skipping any pages which haven't changed since the
+        last build.
+
+        Returns the names of every output file, whether it needed to be
+        rebuilt or not.
+        """
+        with trace.activate(self.tracer):
+            return self._build()
+
+    def _build(self):
+        with trace.span('paths_to_pages'):
+            directories, pages = self.paths_to_pages()
         to_build = pages + list(directories.values())
 
+        self.output.reset()
+        self.written = []
+
+        manifest = self.load_manifest()
+        index = self.load_search_index()
+        self._build_stale(to_build, manifest, index)
+
+        manifest.prune(self._manifest_key(thing) for thing in to_build)
+        self.metadata.prune(page.fullpath for page in pages)
+        self._save_manifest(manifest)
+
+        if index is not None:
+            index.prune(page.path for page in pages)
+            self._save_search_index(index)
+        self.output.close()
+
+        return [self.output_filename(thing) for thing in to_build]
+
+    def _build_stale(self, to_build, manifest, index=None):
+        """
+        Build everything in `to_build` which isn't already up to date,
+        recording it in the manifest (and search index).
+        """
+        stale = [thing for thing in to_build
+                 if not self.is_fresh(thing, manifest, index)]
+        snapshots = [self._snapshot(thing, manifest) for thing in stale]
+
+        if self.pipeline and stale:
+            self._build_pipelined(stale)
+        elif self.jobs > 1 and len(stale) > 1:
+            self._build_parallel(stale)
+        else:
+            for thing in stale:
+                self.build_page(thing)
+
+        for thing, snapshot in zip(stale, snapshots):
+            self._record(thing, manifest, snapshot)
+        self._update_search_index(index)
+
+    def _snapshot(self, thing, manifest):
+        # The state of a page's inputs, taken before it's built so anything
+        # which changes in the meantime gets rebuilt next time
+        if isinstance(thing, Directory):
+            return thing.fingerprint()
+        return manifest.snapshot(thing.path)
+
+    def _record(self, thing, manifest, snapshot):
+        key = self._manifest_key(thing)
+        if isinstance(thing, Directory):
+            manifest.record_digest(key, thing.path, snapshot)
+        else:
+            manifest.record(key, thing.path, snapshot)
+
+    def iter_build(self):
+        """
+        Build the wiki while walking it, yielding the name of each output file
+        as soon as it has been written (or found to be up to date).
+
+        Unlike `build()`, the `Page` and `Directory` objects for the whole
+        wiki are never held in memory at once. Pages are rendered as they are
+        found and each directory's listing is rendered once everything
+        beneath it is done, so only the directories on the current path (and
+        their direct children) are kept around. The bookkeeping still grows
+        with the number of pages, though: the manifest (and search index, if
+        any) is loaded in full, and the name of every output file is kept so
+        stale manifest entries can be pruned at the end. Pages are always
+        rendered in this process, regardless of `jobs`.
+        """
+        with trace.activate(self.tracer):
+            self.output.reset()
+            self.written = []
+
+            manifest = self.load_manifest()
+            index = self.load_search_index()
+            keys = set()
+            paths = set()
+
+            for thing in self._iter_tree('.'):
+                key = self._manifest_key(thing)
+                keys.add(key)
+                if isinstance(thing, Page):
+                    paths.add(thing.path)
+
+                if not self.is_fresh(thing, manifest, index):
+                    snapshot = self._snapshot(thing, manifest)
+                    self.build_page(thing)
+                    self._record(thing, manifest, snapshot)
+                    self._update_search_index(index)
+
+                yield self.output_filename(thing)
+
+            manifest.prune(keys)
+            self._save_manifest(manifest)
+
+            if index is not None:
+                index.prune(paths)
+                self._save_search_index(index)
+            self.output.close()
+
+    def _iter_tree(self, rel_dir):
+        """
+        Yield every page in a directory (relative to the wiki root) and its
+        sub-directories, followed by the `Directory` itself if it contains any
+        documents.
+
+        The `Directory` is also the generator's return value. Sub-directories
+        are added to their parent without their own children, so finished
+        subtrees can be garbage collected.
+        """
+        dirs = _split(rel_dir)
+        d = Directory(rel_dir, self.directory_crumbs(dirs),
+                      context=self.page_context)
+
+        subdirs, documents = self._scan(dirs, self.ignore)
+        entries = sorted([(name, None) for name in subdirs] +
+                         [(entry.name, entry) for entry in documents],
+                         key=lambda item: item[0])
+
+        for name, entry in entries:
+            if entry is None:
+                child_path = os.path.normpath(os.path.join(rel_dir, name))
+                child = yield from self._iter_tree(child_path)
+                if child is not None:
+                    child = copy.copy(child)
+                    child.children = []
+                    d.add_child(child)
+            else:
+                page = self.page_for(entry.path)
+                d.add_child(page)
+                yield page
+
+        if not d.children:
+            return None
+
+        yield d
+        return d
+
+    def rebuild(self, modified=(), created=(), deleted=()):
+        """
+        Rebuild only the parts of the wiki affected by a set of changed
+        source files (absolute paths), e.g. after a file watcher noticed
+        something.
+
+        Modified and created documents are re-rendered, the html for deleted
+        documents (or directories) is removed, and the listings of any
+        directories which gained or lost children are regenerated. The
+        builder's `force` setting is ignored, since the rest of the wiki's
+        outputs still need to be known.
+
+        Returns the output files which were written or removed.
+        """
+        with trace.activate(self.tracer):
+            return self._rebuild(modified, created, deleted)
+
+    def _rebuild(self, modified, created, deleted):
+        # Sinks which don't keep their contents can only do full builds
+        if not self.output.incremental:
+            self._build()
+            return self.written
+
+        self.output.reset()
+        self.written = []
+        # Only part of the wiki gets rebuilt, so even with `force` set the
+        # rest of it has to stay in the manifest and search index
+        manifest = self.load_manifest(force=False)
+        index = self.load_search_index(force=False)
+
+        to_build, listings = self._changed_pages(set(modified) |
+                                                 set(created))
+        for path in set(created) | set(deleted):
+            if not self.is_ignored(path):
+                listings.add(self._parent_dir(path))
+        for path in deleted:
+            self._remove_deleted(path, manifest, index)
+
+        to_build.extend(self._affected_listings(listings, manifest))
+        self._build_stale(to_build, manifest, index)
+        self._save_manifest(manifest)
+        self._save_search_index(index)
+        self.output.close()
+
+        return self.written
+
+    def _parent_dir(self, path):
+        # The directory (relative to the wiki root) containing a source path
+        return os.path.dirname(os.path.relpath(path, self.wiki_dir)) or '.'
+
+    def _changed_pages(self, paths):
+        """
+        Get the pages to render for a set of modified or created source
+        paths, along with the directories whose listings may be affected.
+        """
+        pages = []
+        listings = set()
+
+        for path in paths:
+            if os.path.isdir(path):
+                # A whole directory was moved into the wiki
+                if not self.is_ignored(path):
+                    rel = os.path.relpath(path, self.wiki_dir)
+                    for entry in self._documents_under(_split(rel)):
+                        pages.append(self.page_for(entry.path))
+                        # Directories between here and the page are new
+                        # too, so `_affected_listings()` adds those
+                        listings.add(self._parent_dir(entry.path))
+                listings.add(self._parent_dir(path))
+            elif self.is_document(path):
+                pages.append(self.page_for(path))
+                # Its listing only gets rebuilt if its front matter changed
+                listings.add(self._parent_dir(path))
+
+        return pages, listings
+
+    def _remove_deleted(self, path, manifest, index):
+        """
+        Remove the output (and search index entries) for a deleted document,
+        or for everything under a deleted directory.
+        """
+        rel = os.path.relpath(path, self.wiki_dir)
+        if self.is_document(path):
+            filename, _ = os.path.splitext(rel)
+            self._remove_output(filename + '.html', manifest)
+            if index is not None:
+                index.remove(rel)
+            return
+
+        # It may have been a directory, remove everything under it
+        prefix = rel + os.sep
+        for output in [o for o in manifest.entries if o.startswith(prefix)]:
+            self._remove_output(output, manifest)
+        if index is not None:
+            for source in [s for s in index.docs if s.startswith(prefix)]:
+                index.remove(source)
+
+    def _affected_listings(self, listings, manifest):
+        """
+        Get the `Directory` for each directory whose children may have
+        changed. Directories which no longer contain any documents have their
+        listing removed, and a directory appearing or disappearing means its
+        parent's listing needs updating too.
+        """
+        pending = set(listings)
+        seen = set()
+        directories = []
+
+        while pending:
+            rel_dir = pending.pop()
+            if rel_dir in seen:
+                continue
+            seen.add(rel_dir)
+
+            key = os.path.join(rel_dir, 'index.html')
+            if rel_dir == '.':
+                key = 'index.html'
+            existed = key in manifest.entries
+
+            d = self.directory_for(rel_dir)
+            if d is None:
+                self._remove_output(key, manifest)
+            else:
+                directories.append(d)
+
+            if rel_dir != '.' and existed == (d is None):
+                pending.add(os.path.dirname(rel_dir) or '.')
+
+        return directories
+
+    def _remove_output(self, output, manifest):
+        filename = os.path.join(self.output_dir, output)
+        if self.output.remove(filename):
+            self.written.append(filename)
+        manifest.forget(output)
+
+    def is_ignored(self, path, ignore=None, is_dir=None):
+        """
+        Check whether a path (absolute) is outside the wiki, hidden or
+        ignored. When checking lots of paths, pass in the `ignore` rules and
+        whether each one `is_dir` so they aren't looked up every time.
+        """
+        rel = os.path.relpath(path, self.wiki_dir)
+        if rel == os.curdir:
+            return False
+        if (rel.startswith(os.pardir) or
+                any(part.startswith('.') for part in rel.split(os.sep))):
+            return True
+
+        if ignore is None:
+            ignore = self.ignore
+        if not ignore:
+            return False
+        if is_dir is None:
+            is_dir = os.path.isdir(path)
+        return ignore.match_path(rel.replace(os.sep, '/'), is_dir)
+
+    def is_document(self, path, ignore=None):
+        """
+        Check whether a source file (absolute path) is part of the wiki.
+        """
+        return (self._valid_extension(path) and
+                not self.is_ignored(path, ignore, is_dir=False))
+
+    def _documents_under(self, dirs):
+        """
+        Yield an `os.DirEntry` for every document in a directory (given the
+        names of the directories leading to it), at any depth.
+        """
+        ignore = self.ignore
+        stack = [tuple(dirs)]
+
+        while stack:
+            dirs = stack.pop()
+            subdirs, documents = self._scan(dirs, ignore)
+            yield from documents
+            stack.extend(dirs + (name,) for name in reversed(subdirs))
+
+    def _has_documents(self, dirs):
+        """
+        Check whether a directory contains any documents, at any depth.
+        """
+        return any(True for _ in self._documents_under(dirs))
+
+    def page_for_href(self, href):
+        """
+        Find the `Page` or `Directory` which would be rendered to `href`
+        (e.g. "/subdir/stuff.html" or "/subdir/"), or `None` if there isn't
+        one.
+        """
+        href = href.split('?', 1)[0].split('#', 1)[0]
+        if href.endswith('/'):
+            href += 'index.html'
+        if not href.endswith('.html'):
+            return None
+
+        rel = os.path.normpath(href.lstrip('/'))
+        if rel.startswith(os.pardir) or os.path.isabs(rel):
+            return None
+
+        rel_dir, name = os.path.split(rel)
+        if name == 'index.html':
+            rel_dir = rel_dir or '.'
+            if self.is_ignored(os.path.join(self.wiki_dir, rel_dir)):
+                return None
+            return self.directory_for(rel_dir)
+
+        return self._page_for_output(rel)
+
+    def _page_for_output(self, rel):
+        """
+        Find the `Page` for the document which is rendered to an html file
+        (relative to the output directory), or `None` if there isn't one.
+        """
+        stem = os.path.join(self.wiki_dir, rel[:-len('.html')])
+        for ext in self.config['document-extensions']:
+            source = '{}.{}'.format(stem, ext.lstrip('.'))
+            if os.path.isfile(source) and self.is_document(source):
+                return self.page_for(source)
+
+        return None
+
+    def page_for(self, path):
+        """
+        Create the `Page` for a single source file (absolute path).
+        """
+        rel_name = os.path.relpath(path, self.wiki_dir)
+        name = os.path.basename(rel_name)
+
+        # Make sure there are no index.* files
+        if os.path.splitext(name)[0] == 'index':
+            raise InvalidFileName(path)
+
+        crumbs = self.directory_crumbs(rel_name.split(os.sep)[:-1])
+        crumbs.append(Crumb(name, None))
+
+        return Page(rel_name, crumbs, context=self.page_context)
+
+    def directory_for(self, rel_dir):
+        """
+        Create the `Directory` (and its direct children) for a directory
+        relative to the wiki root, or `None` if it doesn't contain any
+        documents.
+        """
+        if self.is_ignored(os.path.join(self.wiki_dir, rel_dir)):
+            return None
+
+        dirs = _split(rel_dir)
+        d = Directory(rel_dir, self.directory_crumbs(dirs),
+                      context=self.page_context)
+
+        subdirs, documents = self._scan(dirs, self.ignore)
+
+        for name in subdirs:
+            if self._has_documents(dirs + (name,)):
+                child_path = os.path.join(*dirs, name)
+                child = Directory(child_path,
+                                  self.directory_crumbs(dirs + (name,)),
+                                  context=self.page_context)
+                d.add_child(child)
+
+        for entry in documents:
+            d.add_child(self.page_for(entry.path))
+
+        return d if d.children else None
+
+    def _build_parallel(self, to_build):
+        """
+        Render pages using a pool of worker processes, writing them out (in
+        order) as they come back.
+
+        Because the builder and its pages get sent to other processes, any
+        custom middleware needs to be picklable (i.e. a module-level
+        function).
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        to_send = [_detached(thing) for thing in to_build]
+        chunksize = max(1, len(to_send) // (self.jobs * 4))
+
         filenames = []
-        for thing in to_build:
-            temp = self.build_page(thing)
-            filenames.append(temp)
+        with ProcessPoolExecutor(self.jobs,
+                                 initializer=_init_worker,
+                                 initargs=(self,)) as pool:
+            rendered = pool.map(_render_in_worker, to_send,
+                                chunksize=chunksize)
+
+            for thing, (html, events, document) in zip(to_build, rendered):
+                self.tracer.extend(events)
+                if document is not None:
+                    self._extracted[thing.path] = document
+                filenames.append(self.write_page(thing, html))
 
         return filenames
 
+    def _build_pipelined(self, to_build):
+        """
+        Build pages with a `markdoc2.pipeline.Pipeline`, keeping its
+        statistics in `pipeline_stats`.
+        """
+        from .pipeline import Pipeline
+
+        options = self.pipeline if isinstance(self.pipeline, dict) else {}
+        pipeline = Pipeline(self,
+                            readers=options.get('readers'),
+                            renderers=options.get('renderers'),
+                            writers=options.get('writers'),
+                            queue_size=options.get('queue-size'))
+        try:
+            return pipeline.run(to_build)
+        finally:
+            self.pipeline_stats = pipeline.stats
+
+
+def _split(rel_dir):
+    """
+    Split a directory relative to the wiki root into a tuple of names.
+    """
+    if rel_dir == os.curdir:
+        return ()
+    return tuple(rel_dir.split(os.sep))
+
+
+def _detached(page):
+    """
+    Get a copy of a page which is cheap to send to another process.
+
+    A directory only needs its direct children's names and links to render a
+    listing, so grandchildren are left behind instead of pickling the entire
+    tree for every directory.
+    """
+    if not isinstance(page, Directory):
+        return page
+
+    detached = copy.copy(page)
+    detached.children = []
+    for child in page.children:
+        if isinstance(child, Directory):
+            child = copy.copy(child)
+            child.children = []
+        detached.children.append(child)
+    return detached
+
+
+# The builder used by the current worker process
+_worker_builder = None
+
+
+def _init_worker(builder):
+    global _worker_builder
+    _worker_builder = builder
+    trace.set_tracer(builder.tracer)
+
+
+def _render_in_worker(page, text=None):
+    # Send back whatever got traced or indexed along with the html
+    html = _worker_builder.render_page(page, text)
+    document = _worker_builder._extracted.pop(page.path, None)
+    return html, trace.get_tracer().drain(), document
@@ -0,0 +1,174 @@
+"""
+Writing precompressed copies of each output file (e.g. `page.html.gz`) next
+to the original, for web servers like nginx's `gzip_static` to serve as-is.
+
+Compressing happens on a thread pool (zlib and brotli both release the GIL)
+using the bytes which were just written, so there's no need for a separate
+pass re-reading the output afterwards. The compressed files are then written
+by whichever thread is writing the originals, so output sinks never get
+used from more than one thread.
+"""
+
+import os
+import gzip
+from collections import deque
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# Only text files are worth compressing
+COMPRESSIBLE = ('.html', '.json', '.css', '.js', '.svg', '.txt', '.xml')
+
+
+def gzip_compress(data):
+    # A fixed mtime means the same html always compresses to the same bytes,
+    # so unchanged pages don't get rewritten
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def brotli_compress(data):
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+# extension -> compression function
+FORMATS = {'gz': gzip_compress}
+if brotli is not None:
+    FORMATS['br'] = brotli_compress
+
+
+def available_formats():
+    """
+    Get the extensions of every compression format which can be used.
+    """
+    return list(FORMATS)
+
+
+class CompressedOutput:
+    """
+    Wraps another output sink, writing a compressed sibling of each file
+    whose contents changed (or whose siblings are missing).
+    """
+
+    def __init__(self, output, formats=None, threads=None):
+        """
+        Parameters
+        ----------
+        output:
+            The output sink to write everything to.
+        formats: list(str)
+            The compressed formats to write (defaults to every one which is
+            available, i.e. "gz" and "br" if brotli is installed).
+        threads: int
+            How many threads to compress files with (defaults to the number
+            of CPUs).
+        """
+        if formats is None:
+            formats = available_formats()
+        unknown = set(formats) - set(FORMATS)
+        if unknown:
+            raise ValueError('Unsupported compression formats: {}'.format(
+                ', '.join(sorted(unknown))))
+
+        self.output = output
+        self.formats = list(formats)
+        self.threads = threads or os.cpu_count() or 1
+
+        self._pool = None
+        self._pending = deque()
+
+    @property
+    def root(self):
+        return self.output.root
+
+    @property
+    def incremental(self):
+        return self.output.incremental
+
+    def _compressible(self, filename):
+        name = os.path.basename(filename)
+        return not name.startswith('.') and name.endswith(COMPRESSIBLE)
+
+    def _siblings(self, filename):
+        return [filename + '.' + fmt for fmt in self.formats]
+
+    def write(self, filename, data):
+        changed = self.output.write(filename, data)
+
+        if self._compressible(filename):
+            formats = [fmt for fmt in self.formats
+                       if changed or not self.output.exists(filename + '.' +
+                                                            fmt)]
+            if formats:
+                self._submit(filename, data, formats)
+
+        return changed
+
+    def _submit(self, filename, data, formats):
+        if self._pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._pool = ThreadPoolExecutor(self.threads)
+
+        for fmt in formats:
+            future = self._pool.submit(FORMATS[fmt], data)
+            self._pending.append((filename + '.' + fmt, future))
+
+        # Don't let too much compressed data pile up in memory
+        while len(self._pending) > self.threads * 4:
+            self._write_next()
+
+    def _write_next(self):
+        filename, future = self._pending.popleft()
+        self.output.write(filename, future.result())
+
+    def flush(self):
+        """
+        Wait for every file to be compressed and written.
+        """
+        while self._pending:
+            self._write_next()
+
+    def remove(self, filename):
+        for sibling in self._siblings(filename):
+            self.output.remove(sibling)
+        return self.output.remove(filename)
+
+    def exists(self, filename):
+        # A file whose compressed siblings are missing isn't up to date, so
+        # the builder writes it again (and the siblings with it)
+        if not self.output.exists(filename):
+            return False
+        if not self._compressible(filename):
+            return True
+        return all(self.output.exists(sibling)
+                   for sibling in self._siblings(filename))
+
+    def read(self, filename):
+        return self.output.read(filename)
+
+    def reset(self):
+        self._discard()
+        self.output.reset()
+
+    def _discard(self):
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+
+    def close(self):
+        try:
+            self.flush()
+        except BaseException:
+            self._discard()
+            raise
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+        self.output.close()
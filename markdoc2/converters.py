@@ -0,0 +1,86 @@
+"""
+A pool of reusable `markdown.Markdown` converters.
+
+Creating a `Markdown` object means importing and initialising every
+extension it uses, which is far more expensive than converting a typical
+page. Instead, converters are created once per process for each set of
+extensions and reset between documents.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+
+class ConverterPool:
+    """
+    Idle `Markdown` converters, keyed by the extensions they were created
+    with.
+
+    A converter is only ever handed to one caller at a time, so the pool is
+    safe to share between threads. Each process gets its own converters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def _key(self, extensions, extension_configs):
+        configs = extension_configs or {}
+        return (tuple(extensions),
+                tuple(sorted((name, tuple(sorted(cfg.items())))
+                             for name, cfg in configs.items())))
+
+    @contextmanager
+    def converter(self, extensions, extension_configs=None):
+        """
+        Borrow a converter for the given extensions, creating a new one if
+        none are idle.
+        """
+        key = self._key(extensions, extension_configs)
+
+        with self._lock:
+            idle = self._idle.get(key)
+            md = idle.pop() if idle else None
+
+        if md is None:
+            # markdown is slow to import, so wait until it's actually needed
+            import markdown
+            md = markdown.Markdown(extensions=list(extensions),
+                                   extension_configs=extension_configs or {})
+
+        try:
+            yield md
+        finally:
+            md.reset()
+            with self._lock:
+                self._idle.setdefault(key, []).append(md)
+
+    def convert(self, text, extensions, extension_configs=None):
+        """
+        Convert some markdown text to html.
+        """
+        with self.converter(extensions, extension_configs) as md:
+            return md.convert(text)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+
+    def _after_fork(self):
+        # The lock may have been held by another thread when we forked
+        self._lock = threading.Lock()
+
+
+_pool = ConverterPool()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_pool._after_fork)
+
+
+def convert(text, extensions, extension_configs=None):
+    """
+    Convert some markdown text to html using this process's shared
+    converter pool.
+    """
+    return _pool.convert(text, extensions, extension_configs)
@@ -0,0 +1,196 @@
+"""
+The markdown engines pages can be rendered with, chosen with the builder's
+`markdown-engine` setting:
+
+- `markdown`: Python-Markdown (the default), which is the only engine the
+  `markdown-extensions` setting applies to
+- `markdown-it`: markdown-it-py, CommonMark plus tables
+- `mistune`: mistune (version 2 or later), plus tables
+- `cmark`: cmarkgfm, a binding to GitHub's C implementation of CommonMark,
+  plus tables, strikethrough and autolinks
+
+Apart from Python-Markdown, each engine's library is optional and only gets
+imported the first time a page is rendered with it. The engines don't all
+produce exactly the same html; `python -m benchmarks.engines` shows where
+they differ, and how fast each one is, for a given set of pages.
+"""
+
+import re
+import importlib.util
+from html import escape, unescape
+
+from . import converters
+from .exceptions import UnsupportedEngine
+
+
+DEFAULT_ENGINE = 'markdown'
+
+_TAG = re.compile(r'(<[^>]*>)')
+_SELF_CLOSING = re.compile(r'\s*/>$')
+_BETWEEN_TAGS = re.compile(r'>\s+<')
+_SPACE = re.compile(r'\s+')
+_BEFORE_CLOSE = re.compile(r'\s+</')
+_START_TAG = re.compile(r'<(\w+)((?:\s+[^\s=>]+(?:="[^"]*")?)+)\s*>$')
+_ATTRIBUTE = re.compile(r'[^\s=>]+(?:="[^"]*")?')
+
+
+class MarkdownEngine:
+    """
+    Turns markdown into html. Subclasses set `name` and `module` (the library
+    which needs to be installed), and implement `convert()`.
+
+    Engines get shared between threads, so `convert()` mustn't keep any
+    per-document state on the engine itself.
+    """
+
+    name = None
+    module = None
+
+    @classmethod
+    def available(cls):
+        """
+        Check whether the engine's library is installed, without importing
+        it.
+        """
+        return importlib.util.find_spec(cls.module) is not None
+
+    def convert(self, text, extensions=(), extension_configs=None):
+        """
+        Convert some markdown text to html.
+
+        Parameters
+        ----------
+        text: str
+            The markdown to convert.
+        extensions: list(str)
+            Python-Markdown extensions. Other engines ignore them.
+        extension_configs: dict
+            Options for the extensions, keyed by extension name.
+        """
+        raise NotImplementedError
+
+
+class PythonMarkdown(MarkdownEngine):
+    name = 'markdown'
+    module = 'markdown'
+
+    def convert(self, text, extensions=(), extension_configs=None):
+        return converters.convert(text, extensions, extension_configs)
+
+
+class MarkdownIt(MarkdownEngine):
+    name = 'markdown-it'
+    module = 'markdown_it'
+
+    def __init__(self):
+        self._md = None
+
+    def convert(self, text, extensions=(), extension_configs=None):
+        if self._md is None:
+            from markdown_it import MarkdownIt
+            self._md = MarkdownIt('commonmark').enable('table')
+        return self._md.render(text)
+
+
+class Mistune(MarkdownEngine):
+    name = 'mistune'
+    module = 'mistune'
+
+    def __init__(self):
+        self._md = None
+
+    def convert(self, text, extensions=(), extension_configs=None):
+        if self._md is None:
+            import mistune
+            self._md = mistune.create_markdown(escape=False,
+                                               plugins=['table'])
+        return self._md(text)
+
+
+class CMark(MarkdownEngine):
+    name = 'cmark'
+    module = 'cmarkgfm'
+
+    GFM_EXTENSIONS = ['table', 'strikethrough', 'autolink']
+
+    def convert(self, text, extensions=(), extension_configs=None):
+        import cmarkgfm
+        from cmarkgfm.cmark import Options
+
+        # Raw html is allowed, the same as every other engine
+        return cmarkgfm.markdown_to_html_with_extensions(
+                text, options=Options.CMARK_OPT_UNSAFE,
+                extensions=self.GFM_EXTENSIONS)
+
+
+ENGINES = {engine.name: engine for engine in
+           [PythonMarkdown, MarkdownIt, Mistune, CMark]}
+
+# name -> engine, so each process only sets up an engine once
+_engines = {}
+
+
+def available_engines():
+    """
+    Get the names of every engine whose library is installed.
+    """
+    return [name for name, engine in ENGINES.items() if engine.available()]
+
+
+def check_engine(name):
+    """
+    Make sure an engine exists and can be used, raising `UnsupportedEngine`
+    if it can't.
+    """
+    engine = ENGINES.get(name)
+    if engine is None:
+        raise UnsupportedEngine('Unknown markdown engine {!r} (expected one '
+                                'of {})'.format(name, ', '.join(ENGINES)))
+    if not engine.available():
+        raise UnsupportedEngine('The {!r} markdown engine needs {} to be '
+                                'installed'.format(name, engine.module))
+
+
+def get_engine(name=DEFAULT_ENGINE):
+    """
+    Get this process's instance of an engine.
+    """
+    engine = _engines.get(name)
+    if engine is None:
+        check_engine(name)
+        engine = _engines.setdefault(name, ENGINES[name]())
+    return engine
+
+
+def convert(text, engine=DEFAULT_ENGINE, extensions=(),
+            extension_configs=None):
+    """
+    Convert some markdown text to html with the named engine.
+    """
+    return get_engine(engine).convert(text, extensions, extension_configs)
+
+
+def normalise_html(html):
+    """
+    Smooth over differences in how engines lay out equivalent html (e.g.
+    `<br />` vs `<br>`, `&copy;` vs `&#169;`, the order of attributes, or
+    whitespace between tags), so the output of two engines can be compared.
+    """
+    # Split into text and tags, which come at the odd indices
+    parts = _TAG.split(html.strip())
+    for i, part in enumerate(parts):
+        if i % 2:
+            part = _SELF_CLOSING.sub('>', part)
+            parts[i] = _START_TAG.sub(_sort_attributes, part)
+        else:
+            parts[i] = escape(unescape(part), quote=False)
+
+    html = ''.join(parts)
+    html = _BEFORE_CLOSE.sub('</', html)
+    html = _BETWEEN_TAGS.sub('><', html)
+    return _SPACE.sub(' ', html)
+
+
+def _sort_attributes(match):
+    attributes = sorted(_ATTRIBUTE.findall(match.group(2)))
+    return '<{} {}>'.format(match.group(1), ' '.join(attributes))
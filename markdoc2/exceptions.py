@@ -6,3 +6,15 @@ class InvalidFileName(MarkdocError):
     """
     Error raised when someone names a file "index.*"
     """
+
+
+class UnsupportedEngine(MarkdocError):
+    """
+    Error raised when a markdown engine doesn't exist or isn't installed
+    """
+
+
+class WatcherError(MarkdocError):
+    """
+    Error raised when a file watcher backend can't be used
+    """
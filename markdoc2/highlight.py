@@ -0,0 +1,206 @@
+"""
+A drop-in replacement for the `codehilite` markdown extension which keeps
+highlighted code blocks in a persistent, content-addressed cache.
+
+The same snippets tend to turn up on lots of pages and rarely change, so
+there is no point getting Pygments to lex and format them on every build.
+"""
+
+import os
+import hashlib
+import threading
+
+import markdown
+from markdown.extensions.codehilite import (CodeHiliteExtension,
+                                            HiliteTreeprocessor)
+
+try:
+    import pygments
+    PYGMENTS_VERSION = pygments.__version__
+except ImportError:
+    PYGMENTS_VERSION = None
+
+
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+
+class HighlightCache:
+    """
+    Highlighted html stored on disk, one file per code block, named after a
+    hash of everything which affects the output.
+
+    Once the cache grows beyond `max_bytes`, the least recently used entries
+    are evicted (using each file's mtime, which gets bumped on every hit).
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + '.html')
+
+    def get(self, key):
+        filename = self._filename(key)
+        try:
+            with open(filename, encoding='utf-8') as f:
+                html = f.read()
+        except OSError:
+            return None
+
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+        return html
+
+    def set(self, key, html):
+        filename = self._filename(key)
+        data = html.encode('utf-8')
+
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        temp = '{}.{}.{}.tmp'.format(filename, os.getpid(),
+                                     threading.get_ident())
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, filename)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += len(data)
+
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for dirpath, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.html'):
+                    continue
+                filename = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                yield st.st_mtime_ns, st.st_size, filename
+
+    def _disk_usage(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # Clear out a bit more than strictly necessary so we don't end up
+        # evicting on every single write
+        target = self.max_bytes * 0.9
+        entries = sorted(self._entries())
+        size = sum(entry[1] for entry in entries)
+
+        for _, entry_size, filename in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            size -= entry_size
+
+        self._size = size
+
+
+_caches = {}
+
+
+def get_cache(directory, max_bytes=DEFAULT_CACHE_SIZE):
+    """
+    Get the `HighlightCache` for a directory. Caches are shared within a
+    process.
+    """
+    key = (directory, max_bytes)
+    if key not in _caches:
+        _caches[key] = HighlightCache(directory, max_bytes)
+    return _caches[key]
+
+
+class CachedHiliteTreeprocessor(HiliteTreeprocessor):
+    """
+    Codehilite's tree processor, except code blocks are looked up in a
+    `HighlightCache` first. Only the blocks which aren't in the cache are
+    left for codehilite to highlight, and its html is then cached.
+    """
+
+    cache = None
+
+    def cache_key(self, text):
+        """
+        Hash a block's code along with every option which affects how it
+        gets highlighted (codehilite's config and the library versions).
+        """
+        h = hashlib.sha256()
+        h.update(repr((PYGMENTS_VERSION, markdown.__version__,
+                       self.md.tab_length,
+                       sorted(self.config.items()))).encode())
+        h.update(text.encode('utf-8'))
+        return h.hexdigest()
+
+    def run(self, root):
+        if self.cache is None:
+            return super().run(root)
+
+        misses = []
+        for block in root.iter('pre'):
+            if (len(block) != 1 or block[0].tag != 'code' or
+                    block[0].text is None):
+                continue
+
+            key = self.cache_key(block[0].text)
+            html = self.cache.get(key)
+            if html is None:
+                misses.append(key)
+            else:
+                self._replace(block, html)
+
+        # Codehilite skips the blocks which were replaced, so whatever it
+        # stashes from here on belongs to the misses, in the same order
+        stash = self.md.htmlStash.rawHtmlBlocks
+        first = len(stash)
+        super().run(root)
+
+        for key, html in zip(misses, stash[first:]):
+            self.cache.set(key, html)
+
+    def _replace(self, block, html):
+        # The same as codehilite: swap the block for a placeholder, which
+        # gets turned back into the html at the very end
+        placeholder = self.md.htmlStash.store(html)
+        block.clear()
+        block.tag = 'p'
+        block.text = placeholder
+
+
+class HighlightExtension(CodeHiliteExtension):
+    """
+    Accepts all of `codehilite`'s options, plus `cache_dir` (where to keep
+    the cache, leave empty to disable caching) and `cache_size` (in bytes).
+    """
+
+    def __init__(self, **kwargs):
+        self.cache_dir = kwargs.pop('cache_dir', None)
+        self.cache_size = int(kwargs.pop('cache_size', DEFAULT_CACHE_SIZE))
+        super().__init__(**kwargs)
+
+    def extendMarkdown(self, md):
+        hiliter = CachedHiliteTreeprocessor(md)
+        hiliter.config = self.getConfigs()
+        if self.cache_dir:
+            hiliter.cache = get_cache(self.cache_dir, self.cache_size)
+        md.treeprocessors.register(hiliter, 'hilite', 30)
+
+        md.registerExtension(self)
+
+
+def makeExtension(**kwargs):
+    return HighlightExtension(**kwargs)
@@ -0,0 +1,161 @@
+"""
+Support for `.markdocignore` files, which keep files and directories out of
+the wiki using the same kind of patterns as a `.gitignore`.
+
+Only the `.markdocignore` in the root of the wiki is used. Patterns are
+matched against paths relative to the wiki root, and the usual `.gitignore`
+rules apply:
+
+- Blank lines and lines starting with `#` are skipped
+- A leading `!` re-includes anything matched by an earlier pattern
+- A trailing `/` means the pattern only matches directories
+- A pattern containing a `/` (other than at the end) is anchored to the
+  wiki root, otherwise it matches a name at any depth
+- `*` and `?` don't match `/`, `**` matches any number of directories
+"""
+
+import re
+
+
+IGNORE_FILE = '.markdocignore'
+
+
+def translate(pattern):
+    """
+    Translate a single glob pattern into a regular expression.
+    """
+    i = 0
+    out = []
+    while i < len(pattern):
+        regex, i = _translate_part(pattern, i)
+        out.append(regex)
+    return ''.join(out)
+
+
+def _translate_part(pattern, i):
+    # Translate the piece of a pattern starting at `i`, returning its regex
+    # and where the next piece starts
+    c = pattern[i]
+    if c == '*':
+        return _translate_star(pattern, i)
+    if c == '?':
+        return '[^/]', i + 1
+    if c == '[':
+        return _translate_class(pattern, i)
+    if c == '\\' and i + 1 < len(pattern):
+        return re.escape(pattern[i + 1]), i + 2
+    return re.escape(c), i + 1
+
+
+def _translate_star(pattern, i):
+    if pattern.startswith('**/', i):
+        return '(?:.*/)?', i + 3
+    if pattern.startswith('**', i):
+        return '.*', i + 2
+    return '[^/]*', i + 1
+
+
+def _translate_class(pattern, i):
+    end = pattern.find(']', i + 2)
+    if end == -1:
+        return re.escape('['), i + 1
+
+    body = pattern[i + 1:end].replace('\\', '\\\\')
+    if body.startswith('!'):
+        body = '^' + body[1:]
+    return '[{}]'.format(body), end + 1
+
+
+class IgnoreRules:
+    """
+    A set of ignore patterns, compiled into a single regular expression for
+    files and another for directories.
+    """
+
+    def __init__(self, patterns=()):
+        """
+        Parameters
+        ----------
+        patterns: iterable(str)
+            The lines of a `.markdocignore` file.
+        """
+        # (regex, negated, directories only)
+        self.rules = []
+
+        for line in patterns:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            negated = line.startswith('!')
+            if negated:
+                line = line[1:]
+
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            anchored = '/' in line
+            line = line.lstrip('/')
+            if not line:
+                continue
+
+            regex = translate(line)
+            if not anchored:
+                regex = '(?:.*/)?' + regex
+            self.rules.append((regex, negated, dir_only))
+
+        self._files = self._compile(
+                [rule for rule in self.rules if not rule[2]])
+        self._dirs = self._compile(self.rules)
+
+    @staticmethod
+    def _compile(rules):
+        """
+        Combine rules into one regex. The later rules come first so the
+        alternative which matches is always the last matching rule, and its
+        group tells us whether it was negated.
+        """
+        if not rules:
+            return None, []
+
+        rules = list(reversed(rules))
+        regex = '|'.join('(?P<r{}>{})'.format(i, rule[0])
+                         for i, rule in enumerate(rules))
+        return re.compile(regex), [rule[1] for rule in rules]
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Read the rules from a file, getting no rules if it doesn't exist.
+        """
+        try:
+            with open(filename) as f:
+                return cls(f.read().splitlines())
+        except OSError:
+            return cls()
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match(self, rel, is_dir=False):
+        """
+        Check whether a path (relative to the wiki root, separated by `/`)
+        is ignored. Its parent directories aren't checked.
+        """
+        regex, negated = self._dirs if is_dir else self._files
+        if regex is None:
+            return False
+
+        m = regex.fullmatch(rel)
+        if m is None:
+            return False
+        return not negated[int(m.lastgroup[1:])]
+
+    def match_path(self, rel, is_dir=False):
+        """
+        Check whether a path, or any of the directories it is in, is ignored.
+        """
+        parts = rel.split('/')
+        for i in range(1, len(parts)):
+            if self.match('/'.join(parts[:i]), True):
+                return True
+        return self.match(rel, is_dir)
@@ -0,0 +1,100 @@
+"""
+Rendering pages on demand instead of building the whole wiki up front.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from .render import Directory
+
+
+class LazyRenderer:
+    """
+    Renders pages the first time they are asked for, keeping the results in
+    a size-bounded LRU cache.
+
+    Cached pages are checked against their source before being reused (the
+    source file's mtime and size for a page, the listing fingerprint for a
+    directory), so edits show up on the next request without needing a file
+    watcher. Pages go through exactly the same rendering and middleware as
+    `Builder.build`.
+    """
+
+    def __init__(self, builder, max_bytes=64 * 1024 * 1024):
+        """
+        Parameters
+        ----------
+        builder: Builder
+            The builder used to find and render pages.
+        max_bytes: int
+            The most rendered html (in bytes) to keep cached.
+        """
+        self.builder = builder
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, href):
+        """
+        Get the rendered html (as bytes) for `href`, or `None` if there is no
+        such page.
+        """
+        page = self.builder.page_for_href(href)
+        if page is None:
+            return None
+
+        key = self.builder.output_filename(page)
+        validator = self._validator(page)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == validator:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        data = self.builder.render_page(page).encode('utf-8')
+        self._store(key, validator, data)
+        return data
+
+    def _validator(self, page):
+        if isinstance(page, Directory):
+            return page.fingerprint()
+
+        st = os.stat(page.fullpath)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _store(self, key, validator, data):
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+
+            if len(data) > self.max_bytes:
+                return
+
+            self._cache[key] = (validator, data)
+            self._size += len(data)
+
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __repr__(self):
+        return '<{}: {} pages, {} bytes>'.format(
+                self.__class__.__name__, len(self._cache), self._size)
@@ -0,0 +1,182 @@
+"""
+A record of what went into each output file, so later builds can skip
+anything whose inputs haven't changed.
+"""
+
+import os
+import json
+import hashlib
+
+from . import __version__
+
+
+MANIFEST_NAME = '.markdoc2-manifest.json'
+
+
+def file_digest(filename):
+    """
+    Get the sha1 hash of a file's contents.
+    """
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint(template_dir, md_extensions, middleware=(), md_engine=None):
+    """
+    Hash everything which affects every single page in a build (the
+    templates, markdown engine and extensions, and middleware). If any of
+    these change, the whole wiki needs to be rebuilt.
+    """
+    h = hashlib.sha1()
+
+    for dirpath, subdirs, files in os.walk(template_dir):
+        subdirs.sort()
+        for name in sorted(files):
+            filename = os.path.join(dirpath, name)
+            h.update(os.path.relpath(filename, template_dir).encode())
+            h.update(file_digest(filename).encode())
+
+    if md_engine is not None:
+        h.update(md_engine.encode())
+
+    for ext in md_extensions:
+        h.update(str(ext).encode())
+
+    for m in middleware:
+        name = '{}.{}'.format(getattr(m, '__module__', ''),
+                              getattr(m, '__qualname__', repr(m)))
+        h.update(name.encode())
+
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    The build manifest, mapping each output file (relative to the output
+    directory) to the state of the source file (relative to `source_dir`)
+    it was rendered from.
+
+    A manifest written by a different version of markdoc2, or with a
+    different template/extension fingerprint, is treated as empty.
+    """
+
+    def __init__(self, filename, source_dir, fingerprint, entries=None):
+        self.filename = filename
+        self.source_dir = source_dir
+        self.fingerprint = fingerprint
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, filename, source_dir, fingerprint):
+        try:
+            with open(filename) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(filename, source_dir, fingerprint)
+
+        if (not isinstance(data, dict) or
+                data.get('version') != __version__ or
+                data.get('fingerprint') != fingerprint):
+            return cls(filename, source_dir, fingerprint)
+
+        return cls(filename, source_dir, fingerprint, data.get('outputs'))
+
+    def is_fresh(self, output, source):
+        """
+        Check whether `output` was last built from the current contents of
+        the `source` file.
+        """
+        entry = self.entries.get(output)
+        if entry is None or entry.get('source') != source:
+            return False
+
+        full_source = os.path.join(self.source_dir, source)
+        try:
+            st = os.stat(full_source)
+        except OSError:
+            return False
+
+        if st.st_size != entry.get('size'):
+            return False
+        if st.st_mtime_ns == entry.get('mtime'):
+            return True
+
+        # The file was touched (e.g. by a checkout), but its contents may
+        # still be the same
+        if file_digest(full_source) != entry.get('sha1'):
+            return False
+
+        entry['mtime'] = st.st_mtime_ns
+        return True
+
+    def snapshot(self, source):
+        """
+        Get the current state of a source file, as `record()` stores it.
+
+        Take the snapshot before the source is read. If the file changes
+        while its output is being built, the manifest then holds the older
+        state and the output counts as stale next time, rather than the new
+        state getting recorded next to html rendered from the old text.
+        """
+        full_source = os.path.join(self.source_dir, source)
+        st = os.stat(full_source)
+        return {
+                'source': source,
+                'mtime': st.st_mtime_ns,
+                'size': st.st_size,
+                'sha1': file_digest(full_source),
+                }
+
+    def record(self, output, source, snapshot=None):
+        """
+        Remember that `output` was just built from `source`, as it was when
+        `snapshot` was taken (defaults to its current state).
+        """
+        if snapshot is None:
+            snapshot = self.snapshot(source)
+        self.entries[output] = snapshot
+
+    def has_digest(self, output, digest):
+        """
+        Check whether `output` was last built from inputs with the given
+        digest (for outputs which aren't rendered from a single file).
+        """
+        entry = self.entries.get(output)
+        return entry is not None and entry.get('digest') == digest
+
+    def record_digest(self, output, source, digest):
+        """
+        Remember that `output` was just built from inputs with this digest.
+        """
+        self.entries[output] = {
+                'source': source,
+                'digest': digest,
+                }
+
+    def forget(self, output):
+        self.entries.pop(output, None)
+
+    def prune(self, outputs):
+        """
+        Drop every entry which isn't in `outputs`.
+        """
+        outputs = set(outputs)
+        for output in list(self.entries):
+            if output not in outputs:
+                del self.entries[output]
+
+    def save(self):
+        data = {
+                'version': __version__,
+                'fingerprint': self.fingerprint,
+                'outputs': self.entries,
+                }
+
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        temp = self.filename + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(temp, self.filename)
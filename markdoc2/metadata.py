@@ -0,0 +1,285 @@
+"""
+Metadata (a title, tags, a date, ...) from the front matter block at the top
+of a page:
+
+    ---
+    title: Getting Started
+    tags: [setup, install]
+    date: 2024-01-31
+    ---
+
+YAML front matter goes between `---` lines and TOML between `+++` lines.
+
+Listings show the title of every page in a directory, so reading metadata
+needs to be far cheaper than rendering. Only the front matter is ever read
+(never the rest of the page), and each file's metadata is cached until its
+mtime changes.
+
+YAML is parsed with PyYAML and TOML with tomllib (or tomli) if they're
+installed. Otherwise only simple `key: value` (or `key = value`) lines are
+understood, with `[a, b]` for lists.
+"""
+
+import os
+import json
+import threading
+import datetime
+
+
+# Opening line -> the lines which can close it
+DELIMITERS = {
+    '---': ('---', '...'),
+    '+++': ('+++',),
+    }
+
+# Give up looking for the end of the front matter after this many characters
+MAX_FRONT_MATTER = 64 * 1024
+
+CACHE_NAME = 'metadata.json'
+VERSION = 1
+
+
+def split_front_matter(text):
+    """
+    Split a page's source into its front matter and the rest of the page,
+    returning `(delimiter, front matter, body)`. If there is no front matter,
+    you get `(None, None, text)` back.
+    """
+    first, newline, rest = text.partition('\n')
+    delimiter = first.strip()
+    if delimiter not in DELIMITERS or not newline:
+        return None, None, text
+
+    lines = []
+    offset = len(first) + 1
+    for line in rest.splitlines(True):
+        offset += len(line)
+        if line.strip() in DELIMITERS[delimiter]:
+            return delimiter, ''.join(lines), text[offset:]
+        lines.append(line)
+
+    return None, None, text
+
+
+def strip_front_matter(text):
+    """
+    Remove the front matter from the top of a page's source. A block which
+    doesn't parse into any metadata (e.g. a page which just starts with a
+    horizontal rule) is part of the page, so it gets left alone.
+    """
+    delimiter, front_matter, body = split_front_matter(text)
+    if front_matter is None or not parse(front_matter, delimiter):
+        return text
+    return body
+
+
+def read_front_matter(filename):
+    """
+    Read just the front matter from the top of a file, returning
+    `(delimiter, front matter)`, or `(None, None)` if it doesn't have any.
+    """
+    # Lines are decoded one at a time, so nothing after the front matter
+    # ever gets decoded
+    with open(filename, 'rb') as f:
+        delimiter = f.readline(64).decode('utf-8').strip()
+        if delimiter not in DELIMITERS:
+            return None, None
+
+        lines = []
+        size = 0
+        for line in f:
+            line = line.decode('utf-8')
+            if line.strip() in DELIMITERS[delimiter]:
+                return delimiter, ''.join(lines)
+
+            size += len(line)
+            if size > MAX_FRONT_MATTER:
+                break
+            lines.append(line)
+
+    return None, None
+
+
+def parse(front_matter, delimiter='---'):
+    """
+    Parse a block of front matter into a dict. Anything which can't be
+    parsed gives you an empty dict, rather than stopping the build.
+    """
+    try:
+        if delimiter == '+++':
+            metadata = _parse_toml(front_matter)
+        else:
+            metadata = _parse_yaml(front_matter)
+    except ValueError:
+        return {}
+
+    if not isinstance(metadata, dict):
+        return {}
+    return {str(key): _plain(value) for key, value in metadata.items()}
+
+
+def _parse_yaml(text):
+    try:
+        import yaml
+    except ImportError:
+        return _parse_simple(text, ':')
+
+    # libyaml's loader is many times faster, if PyYAML was built with it
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    try:
+        return yaml.load(text, Loader=loader)
+    except yaml.YAMLError as e:
+        raise ValueError(str(e))
+
+
+def _parse_toml(text):
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            return _parse_simple(text, '=')
+
+    # TOMLDecodeError is a ValueError
+    return tomllib.loads(text)
+
+
+def _parse_simple(text, separator):
+    metadata = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        key, found, value = line.partition(separator)
+        if not found:
+            raise ValueError('Expected "key{} value": {}'.format(separator,
+                                                                 line))
+        metadata[key.strip()] = _simple_value(value.strip())
+    return metadata
+
+
+def _simple_value(value):
+    if value.startswith('[') and value.endswith(']'):
+        return [_simple_value(item.strip())
+                for item in value[1:-1].split(',') if item.strip()]
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '\'"':
+        return value[1:-1]
+    return value
+
+
+def _plain(value):
+    # Keep metadata JSON-friendly, so it can be cached
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def read_metadata(filename):
+    """
+    Read a file's metadata, getting an empty dict if it has none.
+    """
+    delimiter, front_matter = read_front_matter(filename)
+    if front_matter is None:
+        return {}
+    return parse(front_matter, delimiter)
+
+
+class MetadataCache:
+    """
+    The metadata for every page, kept until the page's mtime (or size)
+    changes. If given a filename, the cache is loaded from there when first
+    used and written back by `save()`, so it's reused between builds.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+
+        # full path -> [mtime_ns, size, metadata]
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # Worker processes start with an empty cache instead of a copy of
+        # every entry, and never save it
+        return (MetadataCache, ())
+
+    def _load(self):
+        entries = {}
+        if self.filename is not None:
+            try:
+                with open(self.filename) as f:
+                    data = json.load(f)
+                if data.get('version') == VERSION:
+                    entries = data['entries']
+            except (OSError, ValueError, KeyError):
+                pass
+        return entries
+
+    def _loaded(self):
+        # The cache is only loaded once something is looked up in it
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    self._entries = self._load()
+        return self._entries
+
+    def get(self, filename):
+        """
+        Get the metadata for a file, reading it again if it has changed.
+        """
+        entries = self._loaded()
+
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return {}
+
+        entry = entries.get(filename)
+        if (entry is not None and entry[0] == st.st_mtime_ns and
+                entry[1] == st.st_size):
+            return entry[2]
+
+        try:
+            metadata = read_metadata(filename)
+        except (OSError, UnicodeDecodeError):
+            metadata = {}
+
+        entries[filename] = [st.st_mtime_ns, st.st_size, metadata]
+        self._dirty = True
+        return metadata
+
+    def prune(self, filenames):
+        """
+        Forget every file which isn't in `filenames`.
+        """
+        if self._entries is None:
+            return
+
+        keep = set(filenames)
+        for filename in [f for f in self._entries if f not in keep]:
+            del self._entries[filename]
+            self._dirty = True
+
+    def save(self):
+        """
+        Write the cache to its file, if it has one and anything changed.
+        """
+        if self.filename is None or not self._dirty:
+            return
+
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        temp = '{}.{}.tmp'.format(self.filename, os.getpid())
+        with open(temp, 'w') as f:
+            json.dump({'version': VERSION, 'entries': self._entries}, f,
+                      separators=(',', ':'))
+        os.replace(temp, self.filename)
+        self._dirty = False
@@ -1,7 +1,27 @@
-# TODO: Test this entire module!!!
 import os
+import re
+import functools
+from html import escape, unescape
 from urllib.parse import urlparse
-from bs4 import BeautifulSoup
+
+
+# The only parts of a page `relative_paths` cares about. Comments and the
+# contents of <script>/<style> elements are matched too, so anything which
+# merely looks like a link inside them is passed through untouched.
+_TAG_PATTERN = re.compile(r'''
+    <!--.*?-->
+  | <(?P<raw>script|style)\b.*?</(?P=raw)\s*>
+  | <(?P<tag>a|link)\b(?:[^>"']|"[^"]*"|'[^']*')*>
+''', re.IGNORECASE | re.DOTALL | re.VERBOSE)
+
+# A single attribute inside a tag, so something which looks like an href in
+# another attribute's value (e.g. title="see href=/x") is never mistaken for
+# the real thing
+_ATTRIBUTE_PATTERN = re.compile(r'''
+    (?P<name>[^\s"'>/=]+)
+    (?:(?P<equals>\s*=\s*)
+       (?:"(?P<double>[^"]*)"|'(?P<single>[^']*)'|(?P<bare>[^\s"'>]+)))?
+''', re.VERBOSE)
 
 
 def relative_paths(page, html):
@@ -9,10 +29,98 @@ def relative_paths(page, html):
     A middleware function that will transform all links from being absolute
     (starting with "/") to relative.
 
-    Behind the scenes, this goes through all anchor tags, images, iframes,
-    script tags,
+    Behind the scenes, this scans the page for anchor and link tags and only
+    rewrites their `href` attributes. Everything else is passed through
+    exactly as it was.
+    """
+    start = os.path.dirname(page.href)
+
+    def rewrite_tag(match):
+        tag = match.group(0)
+        if match.group('tag') is None:
+            return tag
+
+        href = _find_href(tag, match.end('tag') - match.start())
+        if href is None:
+            return tag
+
+        value, quote = _attribute_value(href)
+        rel_path = _rewrite(start, unescape(value))
+        if rel_path is None:
+            return tag
+
+        return '{}{}{}{}{}{}{}'.format(
+                tag[:href.start()], href.group('name'), href.group('equals'),
+                quote, escape(rel_path), quote, tag[href.end():])
+
+    return _TAG_PATTERN.sub(rewrite_tag, html)
+
+
+def _find_href(tag, start):
+    # The `href` attribute in a tag, starting from the end of its name
+    for attr in _ATTRIBUTE_PATTERN.finditer(tag, start):
+        if attr.group('equals') and attr.group('name').lower() == 'href':
+            return attr
+    return None
+
+
+def _attribute_value(attr):
+    # An attribute's (still escaped) value, and the quote around it
+    if attr.group('double') is not None:
+        return attr.group('double'), '"'
+    if attr.group('single') is not None:
+        return attr.group('single'), "'"
+    return attr.group('bare'), ''
+
+
+def relative_paths_soup(page, html):
+    """
+    The original, BeautifulSoup-based version of `relative_paths`.
+
+    This re-parses the entire page and pretty-prints the result, so it is
+    a lot slower than `relative_paths`. It's kept as a fallback for anyone
+    who relies on the prettified output.
+    """
+    soup = parse(html)
+    relative_paths_tree(page, soup)
+    return soup.prettify()
+
+
+def tree_middleware(func):
+    """
+    Mark a function as a tree middleware.
+
+    Instead of taking and returning a string, a tree middleware has the
+    signature `middleware(page, soup)` and alters the page's parsed
+    `BeautifulSoup` tree in-place. The builder parses each page once, runs
+    every tree middleware in a row over the same tree, and only turns it
+    back into html afterwards. Plain string middlewares can be mixed in
+    freely, although each switch between the two kinds costs an extra
+    parse or serialise.
+    """
+    func.tree = True
+    return func
+
+
+def is_tree_middleware(middleware):
+    return getattr(middleware, 'tree', False)
+
+
+def parse(html):
+    """
+    Parse a page into the tree that tree middlewares work on.
+    """
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, 'html.parser')
+
+
+@tree_middleware
+def relative_paths_tree(page, soup):
+    """
+    The tree middleware version of `relative_paths`, which the builder uses
+    instead when there are other tree middlewares (so links get rewritten
+    on the tree which has already been parsed).
     """
-    soup = BeautifulSoup(html, 'html.parser')
     combos = [
             ('a', 'href'),
             ('link', 'href'),
@@ -21,35 +129,52 @@ def relative_paths(page, html):
     for tag, attr in combos:
         _relative_tag(soup, tag, attr, page)
 
-    return soup.prettify()
-
 
 def _relative_tag(soup, tag, attr, page):
     """
     Alters the `attr` attribute for each `tag` tag in `soup` to be relative
     instead of absolute. The `soup` object is changed in-place.
     """
+    start = os.path.dirname(page.href)
+
     for element in soup.find_all(tag):
         if attr not in element.attrs:
             continue
 
-        href = element[attr]
+        rel_path = _rewrite(start, element[attr])
+        if rel_path is not None:
+            element[attr] = rel_path
 
-        parsed = urlparse(href)
 
-        if parsed.netloc or parsed.scheme:
-            # Skip all external elements
-            continue
+def _rewrite(start, href):
+    """
+    Get the relative version of a link found on a page in the `start`
+    directory, or `None` if it should be left alone.
+    """
+    parsed = urlparse(href)
+
+    if parsed.netloc or parsed.scheme:
+        # Skip all external elements
+        return None
+    if not parsed.path:
+        # Links within the same page (e.g. "#heading")
+        return None
+
+    return _relative_to_dir(start, parsed.path)
 
-        rel_path =_relative(page.href, parsed.path)
-        element[attr] = rel_path
 
 def _relative(src, dest):
     """
     Get the path to go from `src` to `dest`.
     """
-    rel_path = os.path.relpath(dest, start=os.path.dirname(src))
+    return _relative_to_dir(os.path.dirname(src), dest)
+
+
+@functools.lru_cache(maxsize=4096)
+def _relative_to_dir(start, dest):
+    # Every page in a directory links to the same handful of places, so
+    # these are memoised
+    rel_path = os.path.relpath(dest, start=start)
     if rel_path.endswith('.'):
         rel_path += '/index.html'
     return rel_path
-
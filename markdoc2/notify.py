@@ -1,43 +1,593 @@
 """
 The module allowing a user to watch for changes and rebuild pages
 automatically.
+
+Changes are noticed by a watcher backend:
+
+- `InotifyWatcher` (`inotify`) uses Linux's inotify through `pyinotify`, so
+  changes are seen straight away without any polling
+- `PollingWatcher` (`poll`) works anywhere, including network mounts and
+  containers which have run out of inotify watches, by comparing snapshots
+  of the wiki taken with `os.scandir()`
+
+Both pass what they see to a `ChangeCollector`, which merges it into a
+`ChangeSet` and rebuilds once things have been quiet for a moment.
 """
-import sys
 import os
-from .render import Page
+import time
+from collections import deque
+
+from .exceptions import MarkdocError, WatcherError
+
 try:
     import pyinotify
 except ImportError:
-    print('To use this functionality, you need to be using')
-    print('Linux and install `pyinotify`')
-    sys.exit(1)
+    pyinotify = None
+
+
+class ChangeSet:
+    """
+    The source files which were created, modified or deleted since the last
+    rebuild.
+
+    Several events for the same file are merged, so (for example) a file
+    which gets created and then deleted again within the same window doesn't
+    need anything rebuilt at all.
+    """
+
+    def __init__(self):
+        self.created = set()
+        self.modified = set()
+        self.deleted = set()
+
+    def add(self, kind, path):
+        if kind == 'created':
+            if path in self.deleted:
+                # Deleted then re-created (e.g. an editor saving by
+                # replacing the file)
+                self.deleted.discard(path)
+                self.modified.add(path)
+            else:
+                self.created.add(path)
+        elif kind == 'modified':
+            if path not in self.created:
+                self.modified.add(path)
+        elif kind == 'deleted':
+            self.modified.discard(path)
+            if path in self.created:
+                self.created.discard(path)
+            else:
+                self.deleted.add(path)
+        else:
+            raise ValueError('Unknown kind of change: {}'.format(kind))
+
+    def clear(self):
+        self.created.clear()
+        self.modified.clear()
+        self.deleted.clear()
+
+    def __len__(self):
+        return len(self.created) + len(self.modified) + len(self.deleted)
+
+    def __repr__(self):
+        return '<{}: {} created, {} modified, {} deleted>'.format(
+                self.__class__.__name__,
+                len(self.created),
+                len(self.modified),
+                len(self.deleted))
 
 
-class OnWriteHandler(pyinotify.ProcessEvent):
-    def my_init(self, builder):
+class ChangeCollector:
+    """
+    Collects changes to the wiki's source files from a watcher, and rebuilds
+    whatever they affect once there haven't been any for `debounce` seconds.
+    """
+
+    def __init__(self, builder, debounce=0.2, on_rebuild=None):
+        """
+        Parameters
+        ----------
+        builder: Builder
+            The builder for the wiki being watched.
+        debounce: float
+            How long to wait for changes to settle before rebuilding.
+        on_rebuild: callable
+            Called with the output files which changed after each rebuild.
+        """
         self.builder = builder
+        self.debounce = debounce
+        self.on_rebuild = on_rebuild
+        self.changes = ChangeSet()
+        self.last_event = None
+
+    def record(self, kind, path, is_dir=False):
+        """
+        Record that a file (or directory) was "created", "modified" or
+        "deleted". Anything which isn't part of the wiki is skipped.
+        """
+        if self.builder.is_ignored(path):
+            return
+        if not is_dir and not self.builder.is_document(path):
+            return
+        self.changes.add(kind, path)
+        self.last_event = time.monotonic()
+
+    def _build(self):
+        changes = self.changes
+        paths = sorted(changes.created | changes.modified | changes.deleted)
+        names = ', '.join(os.path.relpath(p, self.builder.wiki_dir)
+                          for p in paths)
+        print('files altered, rebuilding ({})'.format(names))
+
+        try:
+            written = self.builder.rebuild(modified=changes.modified,
+                                           created=changes.created,
+                                           deleted=changes.deleted)
+        except MarkdocError as e:
+            print('Error encountered while building!')
+            print(e)
+            written = []
+        finally:
+            changes.clear()
+            self.last_event = None
+
+        if written and self.on_rebuild is not None:
+            self.on_rebuild(written)
+
+        return written
+
+    def flush(self, now=None):
+        """
+        Rebuild everything affected by the changes seen so far, as long as
+        nothing else has happened in the last `debounce` seconds.
+        """
+        if not self.changes or self.last_event is None:
+            return None
+
+        now = time.monotonic() if now is None else now
+        if now - self.last_event < self.debounce:
+            return None
+
+        return self._build()
+
+
+class InotifyEvents:
+    """
+    Turns pyinotify events into changes for `self.collector`.
+
+    Instances are called with each event (the same as a
+    `pyinotify.ProcessEvent`), which is passed on to the matching
+    `process_<MASKNAME>` method.
+    """
+
+    def __call__(self, event):
+        method = getattr(self, 'process_' + event.maskname.split('|')[0],
+                         None)
+        if method is not None:
+            method(event)
+
+    def _record(self, kind, event):
+        self.collector.record(kind, event.pathname, event.dir)
+
+    def process_IN_CREATE(self, event):
+        # New files are (usually) followed by a IN_CLOSE_WRITE, but new
+        # directories need their parent listing updated
+        if event.dir:
+            self._record('created', event)
+
+    def process_IN_MOVED_TO(self, event):
+        self._record('created', event)
+
+    def process_IN_CLOSE_WRITE(self, event):
+        kind = 'modified' if self._has_output(event.pathname) else 'created'
+        self._record(kind, event)
+
+    def process_IN_DELETE(self, event):
+        self._record('deleted', event)
+
+    def process_IN_MOVED_FROM(self, event):
+        self._record('deleted', event)
+
+    def _has_output(self, path):
+        builder = self.collector.builder
+        rel = os.path.relpath(path, builder.wiki_dir)
+        filename, _ = os.path.splitext(rel)
+        return os.path.exists(
+                os.path.join(builder.output_dir, filename + '.html'))
+
+
+class OnWriteHandler(InotifyEvents, ChangeCollector):
+    """
+    A `ChangeCollector` which can be given pyinotify events directly.
+    """
+
+    @property
+    def collector(self):
+        return self
+
+
+class Watcher:
+    """
+    The interface for watcher backends. A watcher is started, then `wait()`
+    is called over and over again, and finally it is stopped.
+    """
+
+    name = None
+
+    def __init__(self, collector):
+        """
+        Parameters
+        ----------
+        collector: ChangeCollector
+            Where to send any changes to.
+        """
+        self.collector = collector
+        self.root = collector.builder.wiki_dir
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def start(self):
+        """
+        Start watching, raising a `WatcherError` if that isn't possible.
+        """
+
+    def wait(self, timeout):
+        """
+        Wait up to `timeout` seconds, passing any changes seen in the
+        meantime to the collector.
+        """
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+
+class InotifyWatcher(InotifyEvents, Watcher):
+    """
+    Watches every directory in the wiki with inotify.
+    """
+
+    name = 'inotify'
+
+    def __init__(self, collector):
+        super().__init__(collector)
+        self._manager = None
+        self._notifier = None
 
-    def _build(self, filename):
-        path = os.path.relpath(filename, self.builder.wiki_dir)
-        print('file altered, rebuilding wiki ({})'.format(path))
-        self.builder.build()
+    @classmethod
+    def available(cls):
+        return pyinotify is not None
 
-    def process_default(self, event):
-        if all(not event.pathname.endswith(ext) for ext
-               in self.builder.config['document-extensions']):
+    def start(self):
+        if pyinotify is None:
+            raise WatcherError('The inotify watcher needs pyinotify (and '
+                               'Linux)')
+
+        mask = (pyinotify.IN_CREATE | pyinotify.IN_CLOSE_WRITE |
+                pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM |
+                pyinotify.IN_MOVED_TO)
+
+        self._manager = pyinotify.WatchManager()
+        try:
+            self._manager.add_watch(self.root, mask, rec=True, auto_add=True,
+                                    quiet=False)
+        except pyinotify.WatchManagerError as e:
+            # Usually because fs.inotify.max_user_watches has run out
+            self._manager.close()
+            raise WatcherError('Unable to watch every directory in {} with '
+                               'inotify ({})'.format(self.root, e))
+
+        # The timeout is given to each wait() instead
+        self._notifier = pyinotify.Notifier(self._manager, self, timeout=0)
+
+    def wait(self, timeout):
+        self._notifier.process_events()
+        if self._notifier.check_events(int(timeout * 1000)):
+            self._notifier.read_events()
+            self._notifier.process_events()
+
+    def stop(self):
+        if self._notifier is not None:
+            self._notifier.stop()
+            self._notifier = None
+
+
+class PollingWatcher(Watcher):
+    """
+    Finds changes by comparing snapshots of the wiki.
+
+    Stat-ing every file on every tick doesn't scale to big wikis, so instead:
+
+    - Every directory is stat-ed each tick, and only directories whose mtime
+      changed (i.e. something was added, removed or renamed inside them,
+      which is also how most editors save) get scanned again
+    - Files which changed recently are checked every tick
+    - The remaining files are checked a batch at a time, so each of them is
+      still looked at every few ticks
+
+    The delay between ticks grows while nothing is happening (up to
+    `max_interval`) and drops back down to `interval` as soon as something
+    changes. It also stretches so polling never takes more than about a
+    tenth of the time.
+    """
+
+    name = 'poll'
+
+    # How long a file counts as recently changed, in seconds
+    HOT_SECONDS = 30
+
+    def __init__(self, collector, interval=0.25, max_interval=2.0,
+                 files_per_tick=2000):
+        """
+        Parameters
+        ----------
+        collector: ChangeCollector
+            Where to send any changes to.
+        interval: float
+            The shortest time between ticks, in seconds.
+        max_interval: float
+            The longest time between ticks when nothing is changing.
+        files_per_tick: int
+            How many files which haven't changed recently to check each tick.
+        """
+        super().__init__(collector)
+        self.interval = interval
+        self.max_interval = max_interval
+        self.files_per_tick = files_per_tick
+
+        # directory -> (mtime_ns, {child name: is a directory})
+        self._dirs = {}
+        # file -> (mtime_ns, size)
+        self._files = {}
+        # Files waiting for their turn to be checked
+        self._queue = deque()
+        # file -> when it last changed
+        self._hot = {}
+
+        self._delay = interval
+        self._next_tick = None
+        self._ignore = None
+        self._found = 0
+
+    @property
+    def delay(self):
+        """
+        How long until the next tick after the last one.
+        """
+        return self._delay
+
+    def start(self):
+        self._ignore = self.collector.builder.ignore
+        self._scan_dir(self.root, report=False)
+        self._next_tick = time.monotonic() + self._delay
+
+    def _report(self, kind, path, is_dir=False):
+        self._found += 1
+        self.collector.record(kind, path, is_dir)
+
+    def _skip(self, entry, is_dir):
+        if entry.name.startswith('.'):
+            return True
+        # The ignore rules are fetched once per tick, rather than checking
+        # whether .markdocignore changed for every single entry
+        builder = self.collector.builder
+        if is_dir:
+            return builder.is_ignored(entry.path, self._ignore, is_dir=True)
+        return not builder.is_document(entry.path, self._ignore)
+
+    def _scan_dir(self, path, report=True):
+        """
+        Scan a directory, comparing its contents against the last snapshot
+        and scanning any new sub-directories.
+        """
+        listing = self._list_dir(path)
+        if listing is None:
+            # It's gone, which its parent will notice
+            return
+
+        mtime, children = listing
+        _, old = self._dirs.get(path, (None, {}))
+        self._dirs[path] = (mtime, children)
+
+        for name, was_dir in old.items():
+            if children.get(name) != was_dir:
+                self._forget(os.path.join(path, name), was_dir, report)
+
+        for name, is_dir in children.items():
+            self._scan_child(os.path.join(path, name), old.get(name), is_dir,
+                             report)
+
+    def _list_dir(self, path):
+        # Get a directory's mtime and {child name: is a directory}, or None
+        # if it can't be read
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            return None
+
+        children = {}
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if not self._skip(entry, is_dir):
+                children[entry.name] = is_dir
+        return mtime, children
+
+    def _scan_child(self, path, was_dir, is_dir, report):
+        # `was_dir` is None if the child wasn't there last time
+        if was_dir == is_dir:
+            if not is_dir:
+                # Saving by replacing the file changes the directory's
+                # mtime, so check the files in it straight away
+                self._check_file(path)
+        elif is_dir:
+            # A new directory gets built in one go (see
+            # `Builder.rebuild()`), so only it needs reporting
+            self._scan_dir(path, report=False)
+            if report:
+                self._report('created', path, True)
+        else:
+            self._add_file(path, report)
+
+    def _forget(self, path, is_dir, report):
+        if is_dir:
+            _, children = self._dirs.pop(path, (None, {}))
+            for name, child_is_dir in children.items():
+                self._forget(os.path.join(path, name), child_is_dir, False)
+        else:
+            self._files.pop(path, None)
+            self._hot.pop(path, None)
+
+        if report:
+            self._report('deleted', path, is_dir)
+
+    def _add_file(self, path, report):
+        try:
+            st = os.stat(path)
+        except OSError:
             return
-        self._build(event.pathname)
+
+        self._files[path] = (st.st_mtime_ns, st.st_size)
+        self._queue.append(path)
+        if report:
+            self._hot[path] = time.monotonic()
+            self._report('created', path)
+
+    def _check_file(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            # Deleted, which will show up when its directory is rescanned
+            return
+
+        snapshot = (st.st_mtime_ns, st.st_size)
+        if self._files.get(path) != snapshot:
+            self._files[path] = snapshot
+            self._hot[path] = time.monotonic()
+            self._report('modified', path)
+
+    def poll(self):
+        """
+        Check for changes once, returning how many were found.
+        """
+        self._found = 0
+        self._ignore = self.collector.builder.ignore
+        self._check_dirs()
+        self._check_hot_files()
+        self._check_batch()
+        return self._found
+
+    def _check_dirs(self):
+        # Rescan every directory whose mtime changed
+        for path, (mtime, _) in list(self._dirs.items()):
+            if path not in self._dirs:
+                # Removed while rescanning its parent
+                continue
+            try:
+                changed = os.stat(path).st_mtime_ns != mtime
+            except OSError:
+                continue
+            if changed:
+                self._scan_dir(path)
+
+    def _check_hot_files(self):
+        now = time.monotonic()
+        for path, changed_at in list(self._hot.items()):
+            if now - changed_at > self.HOT_SECONDS:
+                del self._hot[path]
+            else:
+                self._check_file(path)
+
+    def _check_batch(self):
+        # Check the next few files which haven't changed recently
+        for _ in range(min(self.files_per_tick, len(self._queue))):
+            path = self._queue.popleft()
+            if path in self._files:
+                self._check_file(path)
+                self._queue.append(path)
+
+    def wait(self, timeout):
+        now = time.monotonic()
+        if now >= self._next_tick:
+            found = self.poll()
+            elapsed = time.monotonic() - now
+
+            if found:
+                self._delay = self.interval
+            else:
+                self._delay = min(self._delay * 1.5, self.max_interval)
+            self._delay = max(self._delay, elapsed * 10)
+
+            now = time.monotonic()
+            self._next_tick = now + self._delay
+
+        time.sleep(max(0, min(timeout, self._next_tick - now)))
+
+
+WATCHERS = {watcher.name: watcher for watcher in
+            [InotifyWatcher, PollingWatcher]}
+
+
+def available_watchers():
+    """
+    Get the names of every watcher backend which can be used.
+    """
+    return [name for name, watcher in WATCHERS.items() if watcher.available()]
+
+
+def start_watcher(collector, backend='auto'):
+    """
+    Start watching the wiki with the named backend. "auto" uses inotify if
+    it's available and works, falling back to polling otherwise.
+    """
+    if backend == 'auto':
+        if InotifyWatcher.available():
+            watcher = InotifyWatcher(collector)
+            try:
+                watcher.start()
+                return watcher
+            except WatcherError as e:
+                print('{}, falling back to polling'.format(e))
+        backend = PollingWatcher.name
+
+    watcher = WATCHERS.get(backend)
+    if watcher is None:
+        raise WatcherError('Unknown watcher {!r} (expected auto or one of '
+                           '{})'.format(backend, ', '.join(WATCHERS)))
+
+    watcher = watcher(collector)
+    watcher.start()
+    return watcher
 
 
-def auto_build(builder):
-    path = builder.wiki_dir
-    mask = pyinotify.IN_CREATE | pyinotify.IN_CLOSE_WRITE | pyinotify.IN_DELETE
+def auto_build(builder, debounce=0.2, on_rebuild=None, backend='auto'):
+    """
+    Watch the wiki for changes, rebuilding the affected pages once things
+    have been quiet for `debounce` seconds.
 
-    wm = pyinotify.WatchManager()
-    handler = OnWriteHandler(builder=builder)
-    notifier = pyinotify.Notifier(wm, handler)
+    If given, `on_rebuild` is called with the output files which changed
+    after each rebuild. `backend` picks the watcher (see `start_watcher()`).
+    """
+    collector = ChangeCollector(builder, debounce=debounce,
+                                on_rebuild=on_rebuild)
+    watcher = start_watcher(collector, backend)
 
-    wm.add_watch(path, mask, rec=True, auto_add=True)
+    # Wake up regularly so pending changes get flushed
+    timeout = max(0.01, debounce / 2)
 
-    print('Started monitoring {} (type ctrl-C to exit)'.format(path))
-    notifier.loop()
+    print('Started monitoring {} using {} (type ctrl-C to exit)'.format(
+        builder.wiki_dir, watcher.name))
+    try:
+        while True:
+            watcher.wait(timeout)
+            collector.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
@@ -0,0 +1,354 @@
+"""
+Where rendered pages get written to.
+
+Every output sink is given the same absolute file names (under its `root`,
+i.e. the builder's `output_dir`) and the same bytes, and decides how to
+store them:
+
+- `OutputDir`: one file per page in a directory on disk
+- `MemoryOutput`: a dict of relative file names to bytes
+- `TarOutput` and `ZipOutput`: streamed straight into an archive
+- `SqliteOutput`: a single SQLite database, keyed by href
+
+Only `OutputDir` keeps its contents between builds, so it's the only sink
+which supports incremental builds. The others start again from scratch
+whenever they are `reset()`, and archives are only complete once they
+have been `close()`d.
+
+The archive modules are imported when an archive is first written to,
+since they noticeably slow down starting up otherwise.
+"""
+
+import io
+import os
+import time
+
+
+class OutputDir:
+    """
+    The directory rendered html gets written to.
+
+    Files whose contents haven't changed are left alone (so their mtimes
+    stay the same), and changed files are written to a temporary file
+    which is then renamed over the original, so anything serving the
+    directory never sees a half-written page.
+    """
+
+    incremental = True
+
+    # Separate files can be written from several threads at once
+    threadsafe = True
+
+    def __init__(self, root):
+        self.root = root
+        self._dirs = set()
+
+    def reset(self):
+        """
+        Forget which directories are known to exist (e.g. at the start of a
+        new build, in case someone deleted them in the meantime).
+        """
+        self._dirs.clear()
+
+    def makedirs(self, path):
+        if path not in self._dirs:
+            os.makedirs(path, exist_ok=True)
+            self._dirs.add(path)
+
+    def write(self, filename, data):
+        """
+        Write `data` (bytes) to `filename`, returning whether the file
+        actually changed.
+        """
+        if _has_contents(filename, data):
+            return False
+
+        self.makedirs(os.path.dirname(filename))
+
+        temp = '{}.{}.tmp'.format(filename, os.getpid())
+        try:
+            with open(temp, 'wb') as f:
+                f.write(data)
+            os.replace(temp, filename)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+
+        return True
+
+    def remove(self, filename):
+        """
+        Remove an output file (and any directories left empty), returning
+        whether there was anything to remove.
+        """
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            return False
+
+        parent = os.path.dirname(filename)
+        while parent != self.root and parent.startswith(self.root):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            self._dirs.discard(parent)
+            parent = os.path.dirname(parent)
+
+        return True
+
+    def exists(self, filename):
+        return os.path.exists(filename)
+
+    def read(self, filename):
+        """
+        Get the contents of an output file, or `None` if it doesn't exist.
+        """
+        try:
+            with open(filename, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def close(self):
+        pass
+
+
+class MemoryOutput:
+    """
+    Keeps every output file in a dict (`files`), keyed by its name relative
+    to `root` (using "/" as the separator).
+    """
+
+    incremental = False
+
+    def __init__(self, root=''):
+        self.root = os.path.abspath(root)
+        self.files = {}
+
+    def _key(self, filename):
+        return _relative(self.root, filename)
+
+    def reset(self):
+        self.files.clear()
+
+    def write(self, filename, data):
+        key = self._key(filename)
+        if self.files.get(key) == data:
+            return False
+        self.files[key] = bytes(data)
+        return True
+
+    def remove(self, filename):
+        return self.files.pop(self._key(filename), None) is not None
+
+    def exists(self, filename):
+        return self._key(filename) in self.files
+
+    def read(self, filename):
+        return self.files.get(self._key(filename))
+
+    def close(self):
+        pass
+
+
+class ArchiveOutput:
+    """
+    The base class for sinks which stream everything into a single file.
+
+    The file is created the first time something gets written, under a
+    temporary name which replaces `filename` when the sink is closed. Nothing
+    gets read back, so `read()` always returns `None`.
+    """
+
+    incremental = False
+
+    def __init__(self, filename, root=None):
+        """
+        Parameters
+        ----------
+        filename: str
+            Where to save the archive.
+        root: str
+            The directory output file names are relative to (defaults to
+            `filename` itself, which is what the builder uses).
+        """
+        self.filename = os.path.abspath(filename)
+        self.root = os.path.abspath(root) if root else self.filename
+
+        self._temp = None
+        self._names = set()
+
+    def _open(self, temp):
+        raise NotImplementedError
+
+    def _add(self, name, data):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+    def reset(self):
+        """
+        Throw away anything written since the sink was last closed, so the
+        next write starts a new archive.
+        """
+        if self._temp is not None:
+            self._close()
+            os.remove(self._temp)
+            self._temp = None
+        self._names.clear()
+
+    def write(self, filename, data):
+        if self._temp is None:
+            parent = os.path.dirname(self.filename)
+            os.makedirs(parent, exist_ok=True)
+            self._temp = '{}.{}.tmp'.format(self.filename, os.getpid())
+            self._open(self._temp)
+
+        name = _relative(self.root, filename)
+        self._add(name, data)
+        self._names.add(name)
+        return True
+
+    def remove(self, filename):
+        # Archives are always written from scratch, so there's never
+        # anything old to remove
+        return False
+
+    def exists(self, filename):
+        return _relative(self.root, filename) in self._names
+
+    def read(self, filename):
+        return None
+
+    def close(self):
+        """
+        Finish the archive and move it into place.
+        """
+        if self._temp is None:
+            return
+
+        self._close()
+        os.replace(self._temp, self.filename)
+        self._temp = None
+        self._names.clear()
+
+
+class TarOutput(ArchiveOutput):
+    """
+    Streams output files into a tarball, compressed according to its
+    extension (e.g. ".tar.gz").
+    """
+
+    def _open(self, temp):
+        import tarfile
+
+        mode = 'w'
+        for suffix, compression in TAR_SUFFIXES.items():
+            if self.filename.endswith(suffix):
+                mode = 'w:' + compression if compression else 'w'
+        self._tar = tarfile.open(temp, mode)
+
+    def _add(self, name, data):
+        import tarfile
+
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0o644
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def _close(self):
+        self._tar.close()
+
+
+class ZipOutput(ArchiveOutput):
+    """
+    Streams output files into a (deflated) zip file.
+    """
+
+    def _open(self, temp):
+        import zipfile
+
+        self._zip = zipfile.ZipFile(temp, 'w', zipfile.ZIP_DEFLATED)
+
+    def _add(self, name, data):
+        import zipfile
+
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        self._zip.writestr(info, data)
+
+    def _close(self):
+        self._zip.close()
+
+
+class SqliteOutput(ArchiveOutput):
+    """
+    Stores output files in a single SQLite database, in a `pages` table
+    with an `href` (e.g. "/subdir/index.html") and `content` column.
+    """
+
+    def _open(self, temp):
+        import sqlite3
+
+        # Pipelined builds write from a writer thread but close the sink on
+        # the main thread. Only one thread uses it at a time.
+        self._db = sqlite3.connect(temp, check_same_thread=False)
+        self._db.execute('CREATE TABLE pages '
+                         '(href TEXT PRIMARY KEY, content BLOB NOT NULL)')
+
+    def _add(self, name, data):
+        self._db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?)',
+                         ('/' + name, data))
+
+    def _close(self):
+        self._db.commit()
+        self._db.close()
+
+
+TAR_SUFFIXES = {
+        '.tar': None,
+        '.tar.gz': 'gz',
+        '.tgz': 'gz',
+        '.tar.bz2': 'bz2',
+        '.tar.xz': 'xz',
+        }
+
+SQLITE_SUFFIXES = ('.sqlite', '.sqlite3', '.db')
+
+
+def open_output(path):
+    """
+    Get the sink for an output path, based on its extension: a tarball,
+    zip file or SQLite database, otherwise a directory.
+    """
+    if path.endswith(tuple(TAR_SUFFIXES)):
+        return TarOutput(path)
+    if path.endswith('.zip'):
+        return ZipOutput(path)
+    if path.endswith(SQLITE_SUFFIXES):
+        return SqliteOutput(path)
+    return OutputDir(path)
+
+
+def _relative(root, filename):
+    return os.path.relpath(filename, root).replace(os.sep, '/')
+
+
+def _has_contents(filename, data):
+    """
+    Check whether a file already contains exactly `data`.
+    """
+    try:
+        if os.stat(filename).st_size != len(data):
+            return False
+        with open(filename, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
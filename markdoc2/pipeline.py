@@ -0,0 +1,399 @@
+"""
+A pipelined build, where reading, rendering and writing pages all happen at
+the same time in separate stages, each with its own threads:
+
+- readers read each page's markdown source, prefetching it ahead of the
+  renderers
+- renderers turn pages into html and run the middleware. When the builder
+  has more than one job, each renderer hands its pages to a pool of worker
+  processes, otherwise pages are rendered on the renderer's own thread
+- writers write the html to the output sink
+
+The stages are connected by bounded queues. When a stage falls behind, the
+queue in front of it fills up and everything feeding it waits until there's
+room again, so only a fixed number of pages are ever in flight.
+
+`Pipeline.stats` records how full each queue got and how busy each stage
+was, which is what to look at when picking the number of threads.
+"""
+
+import os
+import time
+import queue
+import threading
+
+from .render import Page
+from .builder import _detached, _init_worker, _render_in_worker
+
+
+DEFAULT_READERS = 2
+DEFAULT_WRITERS = 2
+DEFAULT_QUEUE_SIZE = 32
+
+# Tells a stage's threads that nothing else is coming
+_DONE = object()
+
+# What a stage gets back for an item it didn't manage to process
+_SKIPPED = object()
+
+
+def _ready():
+    # Run once by each worker process, to get it started
+    return os.getpid()
+
+
+class BoundedQueue(queue.Queue):
+    """
+    A queue between two stages, which keeps track of how full it gets.
+    """
+
+    def __init__(self, name, maxsize):
+        super().__init__(maxsize)
+        self.name = name
+        self.max_depth = 0
+        self._depth_total = 0
+        self._samples = 0
+
+    def _put(self, item):
+        # Called with the queue's mutex held
+        super()._put(item)
+        if item is not _DONE:
+            depth = len(self.queue)
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+            self._samples += 1
+
+    @property
+    def mean_depth(self):
+        """
+        The average number of items waiting, measured whenever one is added.
+        """
+        return self._depth_total / self._samples if self._samples else 0.0
+
+    def as_dict(self):
+        return {
+                'size': self.maxsize,
+                'max_depth': self.max_depth,
+                'mean_depth': self.mean_depth,
+                }
+
+
+class Stage:
+    """
+    The threads running one step of the pipeline, and how they spent their
+    time.
+    """
+
+    def __init__(self, name, threads, work, inbox, outbox=None,
+                 downstream=0):
+        """
+        Parameters
+        ----------
+        name: str
+            What to call the stage (and its threads).
+        threads: int
+            How many threads to run.
+        work: callable
+            Processes a single item, returning whatever gets passed on.
+        inbox: BoundedQueue
+            Where the stage gets its items from.
+        outbox: BoundedQueue
+            Where the stage's results go (if anywhere).
+        downstream: int
+            How many threads are reading from `outbox`, so each of them can
+            be told when the stage is done.
+        """
+        self.name = name
+        self.threads = threads
+        self.work = work
+        self.inbox = inbox
+        self.outbox = outbox
+        self.downstream = downstream
+
+        self.items = 0
+        # Seconds spent working, waiting for input and waiting for room in
+        # the next queue, summed over every thread
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+
+        self._lock = threading.Lock()
+        self._running = 0
+        self._threads = []
+
+    def start(self, pipeline):
+        self._running = self.threads
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._run, args=(pipeline,),
+                                      name='markdoc2-{}-{}'.format(self.name,
+                                                                   i),
+                                      daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self, pipeline):
+        clock = time.perf_counter
+        items = 0
+        busy = starved = blocked = 0.0
+
+        try:
+            while True:
+                start = clock()
+                item = self.inbox.get()
+                got = clock()
+                starved += got - start
+                if item is _DONE:
+                    break
+
+                result = pipeline.attempt(self.work, item)
+                if result is _SKIPPED:
+                    continue
+
+                done = clock()
+                busy += done - got
+                items += 1
+
+                if self.outbox is not None:
+                    self.outbox.put(result)
+                    blocked += clock() - done
+        finally:
+            self._finish(items, busy, starved, blocked)
+
+    def _finish(self, items, busy, starved, blocked):
+        # Called as each thread exits, with the thread's own statistics
+        with self._lock:
+            self.items += items
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+            self._running -= 1
+            last = self._running == 0
+
+        # The last thread out tells the next stage there's nothing left
+        if last and self.outbox is not None:
+            for _ in range(self.downstream):
+                self.outbox.put(_DONE)
+
+    def utilisation(self, wall):
+        """
+        The fraction of the stage's thread time spent doing actual work.
+        """
+        if wall <= 0:
+            return 0.0
+        return self.busy / (wall * self.threads)
+
+    def as_dict(self, wall):
+        return {
+                'threads': self.threads,
+                'items': self.items,
+                'busy': self.busy,
+                'starved': self.starved,
+                'blocked': self.blocked,
+                'utilisation': self.utilisation(wall),
+                }
+
+
+class PipelineStats:
+    """
+    How a pipelined build went: how full each queue got and how busy each
+    stage was.
+
+    A stage which is nearly always busy while the queue in front of it stays
+    full is the bottleneck, and the one to give more threads. A stage which
+    spends most of its time starved has more threads than it needs.
+    """
+
+    def __init__(self, wall, stages, queues):
+        self.wall = wall
+        self.stages = {stage.name: stage.as_dict(wall) for stage in stages}
+        self.queues = {q.name: q.as_dict() for q in queues}
+
+    def as_dict(self):
+        return {
+                'wall': self.wall,
+                'stages': self.stages,
+                'queues': self.queues,
+                }
+
+    def summary(self):
+        """
+        A human-readable table of the stage and queue statistics.
+        """
+        lines = ['Pipeline ({:.2f}s):'.format(self.wall)]
+        for name, stage in self.stages.items():
+            lines.append(
+                '    {:<8} {:>2} threads {:>6} items {:>6.1%} busy '
+                '{:>8.2f}s starved {:>8.2f}s blocked'.format(
+                    name, stage['threads'], stage['items'],
+                    stage['utilisation'], stage['starved'],
+                    stage['blocked']))
+        for name, q in self.queues.items():
+            lines.append(
+                '    {:<8} queue of {:>3}: max depth {:>3}, mean {:.1f}'
+                .format(name, q['size'], q['max_depth'], q['mean_depth']))
+        return '\n'.join(lines)
+
+
+class Pipeline:
+    """
+    Builds pages by passing them through reader, renderer and writer
+    threads.
+    """
+
+    def __init__(self, builder, readers=None, renderers=None, writers=None,
+                 queue_size=None):
+        """
+        Parameters
+        ----------
+        builder: Builder
+            The builder whose pages are being built.
+        readers: int
+            How many threads read markdown sources.
+        renderers: int
+            How many threads render pages. Defaults to the builder's `jobs`,
+            so there's one thread feeding each worker process.
+        writers: int
+            How many threads write to the output. Output sinks which aren't
+            `threadsafe` only ever get one.
+        queue_size: int
+            How many pages can wait between one stage and the next.
+        """
+        self.builder = builder
+
+        self.readers = readers or DEFAULT_READERS
+        self.renderers = renderers or builder.jobs
+        if getattr(builder.output, 'threadsafe', False):
+            self.writers = writers or DEFAULT_WRITERS
+        else:
+            self.writers = 1
+        self.queue_size = queue_size or DEFAULT_QUEUE_SIZE
+
+        self.error = None
+        self.stats = None
+
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def fail(self, error):
+        """
+        Record the first error raised by any stage, which stops the pipeline.
+        """
+        with self._lock:
+            if self.error is None:
+                self.error = error
+
+    def _start_pool(self):
+        """
+        Start the worker processes, before there are any other threads.
+        Otherwise they get forked the first time a renderer submits a page,
+        while the readers and writers are running, and can inherit a lock
+        which one of those threads held at the time (and deadlock on it).
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(self.builder.jobs,
+                                   initializer=_init_worker,
+                                   initargs=(self.builder,))
+        try:
+            ready = [pool.submit(_ready) for _ in range(self.builder.jobs)]
+            for future in ready:
+                future.result()
+        except BaseException:
+            pool.shutdown()
+            raise
+        return pool
+
+    def attempt(self, work, item):
+        """
+        Have a stage work on an item, recording any error it raises. Returns
+        `_SKIPPED` if it failed, or if anything has failed already (the
+        stages keep emptying their queues so earlier stages never get stuck
+        waiting for room).
+        """
+        if self.error is not None:
+            return _SKIPPED
+        try:
+            return work(item)
+        except BaseException as e:
+            self.fail(e)
+            return _SKIPPED
+
+    def _feed(self, to_read, pages):
+        # Hand every page to the readers, then tell them they're done
+        try:
+            for page in pages:
+                if self.error is not None:
+                    break
+                to_read.put(page)
+        except BaseException as e:
+            self.fail(e)
+        finally:
+            for _ in range(self.readers):
+                to_read.put(_DONE)
+
+    def _read(self, page):
+        if isinstance(page, Page):
+            return page, page.read()
+        return page, None
+
+    def _render(self, item):
+        page, text = item
+        if self._pool is None:
+            return page, self.builder.render_page(page, text)
+
+        future = self._pool.submit(_render_in_worker, _detached(page), text)
+        html, events, document = future.result()
+        self.builder.tracer.extend(events)
+        if document is not None:
+            self.builder._extracted[page.path] = document
+        return page, html
+
+    def _write(self, item):
+        page, html = item
+        return self.builder.write_page(page, html)
+
+    def run(self, pages):
+        """
+        Build every page, returning the names of their output files.
+        Statistics about the run are kept in `stats`.
+        """
+        pages = list(pages)
+        to_read = BoundedQueue('read', self.queue_size)
+        to_render = BoundedQueue('render', self.queue_size)
+        to_write = BoundedQueue('write', self.queue_size)
+
+        stages = [
+                Stage('read', self.readers, self._read, to_read, to_render,
+                      self.renderers),
+                Stage('render', self.renderers, self._render, to_render,
+                      to_write, self.writers),
+                Stage('write', self.writers, self._write, to_write),
+                ]
+
+        start = time.perf_counter()
+        try:
+            if self.builder.jobs > 1:
+                self._pool = self._start_pool()
+
+            for stage in stages:
+                stage.start(self)
+
+            self._feed(to_read, pages)
+
+            for stage in stages:
+                stage.join()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+            self.stats = PipelineStats(time.perf_counter() - start, stages,
+                                       [to_read, to_render, to_write])
+
+        if self.error is not None:
+            raise self.error
+
+        return [self.builder.output_filename(page) for page in pages]
@@ -3,9 +3,61 @@ Module for rendering an individual page from markdown to HTML.
 """
 
 import os
+import json
+import hashlib
 
-import markdown
-import jinja2
+from . import engines, trace
+from .templating import get_engine
+from .metadata import MetadataCache, strip_front_matter
+
+
+class PageContext:
+    """
+    Everything pages need to render themselves which is the same for every
+    page in a build, so each page only needs a reference to it instead of its
+    own copies.
+    """
+
+    __slots__ = ('template_dir', 'wiki_dir', 'md_extensions',
+                 'md_extension_configs', 'md_engine', 'metadata', '_engine')
+
+    def __init__(self, template_dir, wiki_dir, md_extensions=None,
+                 engine=None, md_extension_configs=None, md_engine=None,
+                 metadata=None):
+        """
+        Parameters
+        ----------
+        template_dir: str
+            The directory containing templates to use when rendering as html.
+        wiki_dir: str
+            The absolute location of the wiki's source files on disk.
+        md_extensions: list(str)
+            The markdown extensions to use (defaults to
+            `BasePage.MD_EXTENSIONS`).
+        engine: TemplateEngine
+            The template engine shared by every page in the build. If not
+            provided, the process-wide engine for `template_dir` is used.
+        md_extension_configs: dict
+            Options for the markdown extensions, keyed by extension name.
+        md_engine: str
+            The name of the markdown engine to render pages with (see
+            `markdoc2.engines`).
+        metadata: MetadataCache
+            Where to get each page's front matter metadata from.
+        """
+        self.template_dir = template_dir
+        self.wiki_dir = wiki_dir
+        self.md_extensions = md_extensions or BasePage.MD_EXTENSIONS
+        self.md_extension_configs = md_extension_configs or {}
+        self.md_engine = md_engine or engines.DEFAULT_ENGINE
+        self.metadata = metadata if metadata is not None else MetadataCache()
+        self._engine = engine
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = get_engine(self.template_dir)
+        return self._engine
 
 
 class BasePage:
@@ -18,7 +70,13 @@ class BasePage:
     """
     The base class containing functionality common to both Page and Directory.
     """
-    def __init__(self, path, crumbs, template_dir, wiki_dir, md_extensions=None):
+
+    # There can be an awful lot of pages, so don't give each one a __dict__
+    __slots__ = ('path', 'crumbs', 'context')
+
+    def __init__(self, path, crumbs, template_dir=None, wiki_dir=None,
+                 md_extensions=None, engine=None, md_extension_configs=None,
+                 context=None):
         """
         Parameters
         ----------
@@ -30,22 +88,57 @@ class BasePage:
             The directory containing templates to use when rendering as html.
         wiki_dir: str
             The absolute location of the wiki's source files on disk.
+        md_extensions: list(str)
+            The markdown extensions to use (defaults to `MD_EXTENSIONS`).
+        engine: TemplateEngine
+            The template engine shared by every page in the build. If not
+            provided, the process-wide engine for `template_dir` is used.
+        md_extension_configs: dict
+            Options for the markdown extensions, keyed by extension name.
+        context: PageContext
+            The settings shared by every page in the build. If given, it is
+            used instead of `template_dir`, `wiki_dir`, `md_extensions`,
+            `engine` and `md_extension_configs`.
         """
         self.path = path
-        self.template_dir = template_dir
         self.crumbs = crumbs
-        self.wiki_dir = wiki_dir
 
-        self.env = jinja2.Environment(
-            autoescape=False,
-            loader=jinja2.FileSystemLoader(self.template_dir),
-            trim_blocks=False)
-
-        self.md_extensions = md_extensions or self.MD_EXTENSIONS
+        if context is None:
+            context = PageContext(template_dir, wiki_dir, md_extensions,
+                                  engine, md_extension_configs)
+        self.context = context
 
     def render(self):
         raise NotImplementedError
 
+    @property
+    def template_dir(self):
+        return self.context.template_dir
+
+    @property
+    def wiki_dir(self):
+        return self.context.wiki_dir
+
+    @property
+    def md_extensions(self):
+        return self.context.md_extensions
+
+    @property
+    def md_extension_configs(self):
+        return self.context.md_extension_configs
+
+    @property
+    def md_engine(self):
+        return self.context.md_engine
+
+    @property
+    def engine(self):
+        return self.context.engine
+
+    @property
+    def env(self):
+        return self.engine.env
+
     @property
     def fullpath(self):
         return os.path.join(self.wiki_dir, self.path)
@@ -61,27 +154,84 @@ class BasePage:
         return result
 
     def __eq__(self, other):
+        if not isinstance(other, BasePage):
+            return NotImplemented
+
+        # Breadcrumbs are always in order from the root, so there's no need
+        # to sort them
         return (self.path == other.path and
                 self.template_dir == other.template_dir and
-                sorted(self.crumbs) == sorted(other.crumbs))
+                self.crumbs == other.crumbs)
 
 
 class Page(BasePage):
-    def render_markdown(self):
-        text = open(self.fullpath).read()
-        return markdown.markdown(text, extensions=self.md_extensions)
+    __slots__ = ()
 
-    def render(self):
-        md_text = self.render_markdown()
-        template = self.env.get_template('document.html')
+    def read(self):
+        """
+        Read the page's markdown source.
+        """
+        with trace.span('read', 'stage', page=self.path):
+            with open(self.fullpath) as f:
+                return f.read()
+
+    def render_markdown(self, text=None):
+        """
+        Render the page's markdown to html. The source is read from disk
+        unless it's given as `text`.
+        """
+        if text is None:
+            text = self.read()
+        text = strip_front_matter(text)
+        with trace.span('markdown', 'stage', page=self.path):
+            return engines.convert(text, self.md_engine, self.md_extensions,
+                                   self.md_extension_configs)
+
+    @property
+    def metadata(self):
+        """
+        The metadata from the page's front matter (see `markdoc2.metadata`),
+        which is empty if it doesn't have any.
+        """
+        return self.context.metadata.get(self.fullpath)
 
-        # Use the file's name (minus extension) as the page title
+    @property
+    def title(self):
+        title = self.metadata.get('title')
+        if title:
+            return str(title)
+
+        # Otherwise use the file's name (minus extension) as the page title
         title, _ = os.path.splitext(self.path)
-        title = os.path.basename(title).replace('-', ' ').title()
-        return template.render(
-                content=md_text,
-                title=title,
-                crumbs=self.crumbs)
+        return os.path.basename(title).replace('-', ' ').title()
+
+    @property
+    def display_crumbs(self):
+        """
+        The page's breadcrumbs, ending with its title if the front matter
+        gives it one.
+        """
+        title = self.metadata.get('title')
+        if not title or not self.crumbs:
+            return self.crumbs
+        return list(self.crumbs[:-1]) + [
+                self.crumbs[-1]._replace(name=str(title))]
+
+    def render(self, content=None):
+        """
+        Render the page as html. If the page's markdown has already been
+        rendered, it can be passed in as `content`.
+        """
+        if content is None:
+            content = self.render_markdown()
+        template = self.engine.get_template('document.html')
+
+        with trace.span('template', 'stage', page=self.path):
+            return template.render(
+                    content=content,
+                    title=self.title,
+                    metadata=self.metadata,
+                    crumbs=self.display_crumbs)
 
     def __repr__(self):
         return '<{}: {}>'.format(
@@ -90,7 +240,10 @@ class Page(BasePage):
 
 
 class Directory(BasePage):
-    def __init__(self, path, crumbs, template_dir, wiki_dir):
+    __slots__ = ('children',)
+
+    def __init__(self, path, crumbs, template_dir=None, wiki_dir=None,
+                 engine=None, context=None):
         """
         Parameters
         ----------
@@ -102,22 +255,46 @@ class Directory(BasePage):
             The directory containing templates to use when rendering as html.
         wiki_dir: str
             The absolute location of the wiki's source files on disk.
+        engine: TemplateEngine
+            The template engine shared by every page in the build.
+        context: PageContext
+            The settings shared by every page in the build.
         """
-        super().__init__(path, crumbs, template_dir, wiki_dir)
+        super().__init__(path, crumbs, template_dir, wiki_dir, engine=engine,
+                         context=context)
         self.children = []
 
     def add_child(self, child):
         self.children.append(child)
 
     def render(self):
-        template = self.env.get_template('listing.html')
+        template = self.engine.get_template('listing.html')
         files = list(filter(lambda p: isinstance(p, Page), self.children))
         directories = list(filter(lambda d: isinstance(d, Directory), self.children))
 
-        return template.render(
-                files=files,
-                directories=directories,
-                crumbs=self.crumbs)
+        with trace.span('template', 'stage', page=self.path):
+            return template.render(
+                    files=files,
+                    directories=directories,
+                    crumbs=self.crumbs)
+
+    def fingerprint(self):
+        """
+        A hash of everything which ends up in this directory's listing (its
+        breadcrumbs, and the names, links and metadata of its direct
+        children). Editing a child page's contents without touching its front
+        matter doesn't change it.
+        """
+        children = sorted(
+                (isinstance(c, Directory), c.name, c.href,
+                 json.dumps(c.metadata, sort_keys=True)
+                 if isinstance(c, Page) else '')
+                for c in self.children)
+
+        h = hashlib.sha1()
+        h.update(repr([tuple(c) for c in self.crumbs]).encode())
+        h.update(repr(children).encode())
+        return h.hexdigest()
 
     @property
     def href(self):
@@ -0,0 +1,298 @@
+"""
+A full-text search index, built from each page's rendered html as the wiki
+is built and written to the output directory for client-side search.
+
+The index is an inverted index split into shards by the first characters of
+each term, so a browser only needs to fetch the shards for the words being
+searched for:
+
+- `search/docs.json` maps document ids to `{"href": ..., "title": ...}`,
+  along with the `prefix_length` used for sharding
+- `search/shards/<prefix>.json` maps each term starting with `<prefix>` to
+  a list of `[doc_id, weight]` postings, best matches first. A prefix is the
+  first `prefix_length` characters of the term, with anything other than
+  `a-z` and `0-9` replaced by `_`
+
+Between builds the list of terms in each page is kept in a state file, so
+only the shards touched by changed pages get updated and unchanged pages
+never need to be tokenised again.
+"""
+
+import os
+import re
+import json
+from collections import namedtuple
+from html import unescape
+
+
+SEARCH_DIR = 'search'
+STATE_NAME = '.markdoc2-search.json'
+VERSION = 1
+
+DEFAULT_PREFIX_LENGTH = 2
+
+# How much more a word counts for when it's in a heading or the title
+HEADING_WEIGHT = 5
+TITLE_WEIGHT = 10
+
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 40
+
+
+Document = namedtuple('Document', ['href', 'title', 'terms'])
+
+_TAG = re.compile(r'<[^>]*>')
+_HEADING = re.compile(r'<h[1-6]\b[^>]*>(.*?)</h[1-6]\s*>',
+                      re.IGNORECASE | re.DOTALL)
+_WORD = re.compile(r'\w+')
+_UNSAFE = re.compile(r'[^a-z0-9]')
+
+
+def strip_tags(html):
+    """
+    Get the text from a snippet of html.
+    """
+    return unescape(_TAG.sub(' ', html))
+
+
+def tokenise(text):
+    """
+    Split some text into lowercase search terms.
+    """
+    return [word for word in _WORD.findall(text.lower())
+            if MIN_TERM_LENGTH <= len(word) <= MAX_TERM_LENGTH]
+
+
+def extract(page, content):
+    """
+    Extract a page's searchable text from the html its markdown was rendered
+    to, returning a `Document` whose terms are weighted by how often they
+    appear (words in headings and the title count for more).
+    """
+    terms = {}
+
+    def add(words, weight):
+        for word in words:
+            terms[word] = terms.get(word, 0) + weight
+
+    add(tokenise(strip_tags(content)), 1)
+    for heading in _HEADING.findall(content):
+        add(tokenise(strip_tags(heading)), HEADING_WEIGHT - 1)
+    add(tokenise(page.title), TITLE_WEIGHT)
+
+    return Document(page.href, page.title, terms)
+
+
+def shard_name(term, prefix_length=DEFAULT_PREFIX_LENGTH):
+    """
+    Get the name of the shard a term belongs in.
+    """
+    return _UNSAFE.sub('_', term[:prefix_length])
+
+
+class SearchIndex:
+    """
+    The search index for a wiki, along with the pages which have changed
+    since it was last saved.
+    """
+
+    def __init__(self, output_dir, prefix_length=DEFAULT_PREFIX_LENGTH):
+        """
+        Parameters
+        ----------
+        output_dir: str
+            The directory the wiki is built into.
+        prefix_length: int
+            How many characters of each term to shard the index by.
+        """
+        self.output_dir = output_dir
+        self.prefix_length = prefix_length
+
+        # source path -> {'id', 'href', 'title', 'terms'}
+        self.docs = {}
+        self.next_id = 0
+
+        # Postings to remove and add: (doc id, old terms, new terms)
+        self._changes = []
+        self._docs_changed = False
+
+    @property
+    def directory(self):
+        return os.path.join(self.output_dir, SEARCH_DIR)
+
+    @property
+    def state_filename(self):
+        return os.path.join(self.output_dir, STATE_NAME)
+
+    def _shard_filename(self, name):
+        return os.path.join(self.directory, 'shards', name + '.json')
+
+    @classmethod
+    def load(cls, output_dir, prefix_length=DEFAULT_PREFIX_LENGTH):
+        """
+        Load the index saved by a previous build. If it can't be used (it's
+        missing, was written by a different version or with different
+        settings, or some of the output got deleted) an empty index is
+        returned, and every page will need adding again.
+        """
+        index = cls(output_dir, prefix_length)
+
+        try:
+            with open(index.state_filename) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return index
+
+        if (state.get('version') != VERSION or
+                state.get('prefix_length') != prefix_length or
+                not os.path.exists(os.path.join(index.directory,
+                                                'docs.json'))):
+            return index
+
+        index.docs = state['docs']
+        index.next_id = state['next_id']
+        return index
+
+    def __contains__(self, path):
+        return path in self.docs
+
+    def __len__(self):
+        return len(self.docs)
+
+    def update(self, path, document):
+        """
+        Add (or replace) the `Document` for a page.
+        """
+        old = self.docs.get(path)
+        terms = sorted(document.terms)
+
+        if old is None:
+            doc_id = self.next_id
+            self.next_id += 1
+            old_terms = []
+        else:
+            doc_id = old['id']
+            old_terms = old['terms']
+
+        self.docs[path] = {
+                'id': doc_id,
+                'href': document.href,
+                'title': document.title,
+                'terms': terms,
+                }
+        self._changes.append((doc_id, old_terms, document.terms))
+
+        if (old is None or old['href'] != document.href or
+                old['title'] != document.title):
+            self._docs_changed = True
+
+    def remove(self, path):
+        """
+        Remove a page from the index.
+        """
+        old = self.docs.pop(path, None)
+        if old is not None:
+            self._changes.append((old['id'], old['terms'], {}))
+            self._docs_changed = True
+
+    def prune(self, paths):
+        """
+        Remove every page which isn't in `paths`.
+        """
+        keep = set(paths)
+        for path in [path for path in self.docs if path not in keep]:
+            self.remove(path)
+
+    def save(self, output):
+        """
+        Write out every shard affected by the changes since the index was
+        loaded, using an output sink (see `markdoc2.output`). Returns the
+        names of the files which were written or removed.
+        """
+        shards = self._apply_changes(output)
+        changed = self._write_shards(output, shards)
+
+        docs_filename = os.path.join(self.directory, 'docs.json')
+        if self._docs_changed or not output.exists(docs_filename):
+            if output.write(docs_filename, self._dump_docs()):
+                changed.append(docs_filename)
+
+        # Sinks which start from scratch every build don't need to remember
+        # anything for the next one
+        if output.incremental and (self._changes or self._docs_changed):
+            state = {
+                    'version': VERSION,
+                    'prefix_length': self.prefix_length,
+                    'next_id': self.next_id,
+                    'docs': self.docs,
+                    }
+            output.write(self.state_filename, _dump(state))
+
+        self._changes = []
+        self._docs_changed = False
+        return changed
+
+    def _read_shard(self, output, name):
+        data = output.read(self._shard_filename(name))
+        if data is None:
+            return {}
+        try:
+            return json.loads(data.decode('utf-8'))
+        except ValueError:
+            return {}
+
+    def _apply_changes(self, output):
+        """
+        Apply the changes since the index was loaded to the shards they
+        affect, returning those shards (keyed by name).
+        """
+        shards = {}
+
+        def shard(term):
+            name = shard_name(term, self.prefix_length)
+            if name not in shards:
+                shards[name] = self._read_shard(output, name)
+            return shards[name]
+
+        for doc_id, old_terms, new_terms in self._changes:
+            for term in old_terms:
+                postings = shard(term)
+                if term in postings:
+                    postings[term] = [p for p in postings[term]
+                                      if p[0] != doc_id]
+
+            for term, weight in new_terms.items():
+                shard(term).setdefault(term, []).append([doc_id, weight])
+
+        return shards
+
+    def _write_shards(self, output, shards):
+        """
+        Write out (or remove, once they're empty) a set of shards, returning
+        the names of the files which changed.
+        """
+        changed = []
+        for name, postings in sorted(shards.items()):
+            filename = self._shard_filename(name)
+            postings = {term: sorted(p, key=lambda p: (-p[1], p[0]))
+                        for term, p in postings.items() if p}
+
+            if postings:
+                if output.write(filename, _dump(postings)):
+                    changed.append(filename)
+            elif output.remove(filename):
+                changed.append(filename)
+        return changed
+
+    def _dump_docs(self):
+        return _dump({
+                'prefix_length': self.prefix_length,
+                'docs': {doc['id']: {'href': doc['href'],
+                                     'title': doc['title']}
+                         for doc in self.docs.values()},
+                })
+
+
+def _dump(data):
+    return json.dumps(data, sort_keys=True,
+                      separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,293 @@
+"""
+A small development server which serves the rendered wiki and tells any
+open browsers to reload when the page they are looking at gets rebuilt.
+"""
+
+import io
+import os
+import json
+import queue
+import hashlib
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import unquote
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+EVENTS_PATH = '/__markdoc2__/events'
+
+RELOAD_SCRIPT = b'''<script>
+(function() {
+    var source = new EventSource("''' + EVENTS_PATH.encode() + b'''");
+    source.onmessage = function(e) {
+        var here = window.location.pathname;
+        if (here.charAt(here.length - 1) === "/") {
+            here += "index.html";
+        }
+        if (JSON.parse(e.data).indexOf(here) !== -1) {
+            window.location.reload();
+        }
+    };
+})();
+</script>
+'''
+
+
+class ReloadHub:
+    """
+    Keeps track of every browser listening for reload notifications.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def subscribe(self):
+        q = queue.Queue()
+        with self._lock:
+            self._listeners.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            if q in self._listeners:
+                self._listeners.remove(q)
+
+    def notify(self, hrefs):
+        """
+        Tell every listener that the pages at `hrefs` have changed.
+        """
+        hrefs = sorted(hrefs)
+        if not hrefs:
+            return
+        with self._lock:
+            for q in self._listeners:
+                q.put(hrefs)
+
+    def close(self):
+        with self._lock:
+            for q in self._listeners:
+                q.put(None)
+            self._listeners = []
+
+
+class DevRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves files from the output directory, with support for conditional
+    requests and a server-sent events stream of reload notifications.
+    """
+
+    # How often to send a keep-alive on an idle event stream
+    keep_alive = 15
+
+    def __init__(self, request, client_address, server):
+        super().__init__(request, client_address, server,
+                         directory=server.output_dir)
+
+    def do_GET(self):
+        if self.path == EVENTS_PATH:
+            self.send_events()
+        else:
+            super().do_GET()
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        hub = self.server.hub
+        q = hub.subscribe()
+        try:
+            while True:
+                try:
+                    hrefs = q.get(timeout=self.keep_alive)
+                except queue.Empty:
+                    self.wfile.write(b': keep-alive\n\n')
+                else:
+                    if hrefs is None:
+                        break
+                    data = 'data: {}\n\n'.format(json.dumps(hrefs))
+                    self.wfile.write(data.encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            hub.unsubscribe(q)
+
+    def send_head(self):
+        renderer = self.server.renderer
+        if renderer is not None:
+            data = renderer.get(unquote(self.path))
+            if data is not None:
+                return self.send_rendered(data)
+
+        path = self.translate_path(self.path)
+
+        if os.path.isdir(path):
+            if not self.path.split('?', 1)[0].endswith('/'):
+                # Let the base class redirect to the trailing slash
+                return super().send_head()
+            path = os.path.join(path, 'index.html')
+
+        return self.send_file(path)
+
+    def send_file(self, path):
+        """
+        Send a file from the output directory, with the reload script added
+        to html pages.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.send_error(404, 'File not found')
+            return None
+
+        etag = '"{:x}-{:x}"'.format(st.st_mtime_ns, st.st_size)
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+
+        if self._not_modified(etag, st.st_mtime):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            return None
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        content_type = self.guess_type(path)
+        if content_type == 'text/html':
+            data = inject_reload_script(data)
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        return io.BytesIO(data)
+
+    def send_rendered(self, data):
+        """
+        Send a page which was rendered on demand. These are always up to
+        date, so they don't need the reload script.
+        """
+        etag = '"{}"'.format(hashlib.sha1(data).hexdigest()[:20])
+
+        if self._not_modified(etag, None):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        return io.BytesIO(data)
+
+    def _not_modified(self, etag, mtime):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [t.strip() for t in if_none_match.split(',')]
+            return '*' in tags or etag in tags
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None and mtime is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+            return since is not None and int(mtime) <= since.timestamp()
+
+        return False
+
+
+class DevServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, output_dir, hub=None, renderer=None):
+        self.output_dir = output_dir
+        self.hub = hub or ReloadHub()
+        self.renderer = renderer
+        super().__init__(address, DevRequestHandler)
+
+    def server_close(self):
+        self.hub.close()
+        super().server_close()
+
+
+def inject_reload_script(html):
+    """
+    Add the live reload script to a page just before its closing body tag.
+    """
+    index = html.lower().rfind(b'</body>')
+    if index == -1:
+        return html + RELOAD_SCRIPT
+    return html[:index] + RELOAD_SCRIPT + html[index:]
+
+
+def hrefs_for(builder, filenames):
+    """
+    Turn output file names into the paths a browser would request them by.
+    """
+    return ['/' + os.path.relpath(f, builder.output_dir).replace(os.sep, '/')
+            for f in filenames]
+
+
+def serve(builder, host='127.0.0.1', port=8000, debounce=0.2,
+          watcher='auto'):
+    """
+    Serve the wiki's output directory, rebuilding pages as their sources
+    change and reloading any browsers looking at them. `watcher` picks how
+    changes are noticed (see `markdoc2.notify.start_watcher()`).
+    """
+    from . import notify
+
+    server = DevServer((host, port), builder.output_dir)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    print('Serving {} at http://{}:{}/'.format(
+        builder.output_dir, host, server.server_address[1]))
+
+    def on_rebuild(written):
+        server.hub.notify(hrefs_for(builder, written))
+
+    try:
+        notify.auto_build(builder, debounce=debounce, on_rebuild=on_rebuild,
+                          backend=watcher)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def serve_lazy(builder, host='127.0.0.1', port=8000, max_bytes=None):
+    """
+    Serve the wiki without building it first, rendering each page the first
+    time it is requested.
+
+    Cached pages are validated against their sources on every request, so
+    there is no need to watch for changes (just refresh the page).
+    """
+    from .lazy import LazyRenderer
+
+    renderer = LazyRenderer(builder)
+    if max_bytes is not None:
+        renderer.max_bytes = max_bytes
+
+    server = DevServer((host, port), builder.output_dir, renderer=renderer)
+
+    print('Serving {} at http://{}:{}/ (type ctrl-C to exit)'.format(
+        builder.wiki_dir, host, server.server_address[1]))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
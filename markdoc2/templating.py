@@ -0,0 +1,92 @@
+"""
+A shared template engine, so each template only gets loaded and compiled
+once per build instead of once per page.
+"""
+
+import os
+
+
+_engines = {}
+
+
+class TemplateEngine:
+    """
+    A thin wrapper around a single `jinja2.Environment` which is shared
+    between every page in a build.
+
+    Compiled templates are kept in memory for the lifetime of the engine. If
+    a `cache_dir` is given, jinja2's bytecode is also stored on disk so
+    subsequent runs can skip compiling the templates altogether.
+    """
+
+    def __init__(self, template_dir, cache_dir=None):
+        """
+        Parameters
+        ----------
+        template_dir: str
+            The directory containing templates to use when rendering as html.
+        cache_dir: str
+            An (optional) directory to store compiled template bytecode in.
+        """
+        self.template_dir = template_dir
+        self.cache_dir = cache_dir
+
+        self._env = None
+        self._templates = {}
+
+    @property
+    def env(self):
+        """
+        The `jinja2.Environment`, created (and jinja2 imported) the first time
+        a template is needed, so builds which don't render anything never pay
+        for it.
+        """
+        if self._env is None:
+            import jinja2
+
+            bytecode_cache = None
+            if self.cache_dir is not None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(
+                        self.cache_dir)
+
+            self._env = jinja2.Environment(
+                autoescape=False,
+                loader=jinja2.FileSystemLoader(self.template_dir),
+                bytecode_cache=bytecode_cache,
+                auto_reload=False,
+                trim_blocks=False)
+        return self._env
+
+    def get_template(self, name):
+        """
+        Get a compiled template, loading it the first time it is asked for.
+        """
+        try:
+            return self._templates[name]
+        except KeyError:
+            template = self.env.get_template(name)
+            self._templates[name] = template
+            return template
+
+    def render(self, name, **context):
+        return self.get_template(name).render(**context)
+
+    def __reduce__(self):
+        # Jinja environments can't be pickled, so when an engine is sent to
+        # another process we rebuild (or reuse) that process's engine instead
+        return get_engine, (self.template_dir, self.cache_dir)
+
+    def __repr__(self):
+        return '<{}: {}>'.format(self.__class__.__name__, self.template_dir)
+
+
+def get_engine(template_dir, cache_dir=None):
+    """
+    Get the `TemplateEngine` for a particular template directory, creating it
+    if necessary. Engines are shared within a process.
+    """
+    key = (template_dir, cache_dir)
+    if key not in _engines:
+        _engines[key] = TemplateEngine(template_dir, cache_dir)
+    return _engines[key]
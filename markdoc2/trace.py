@@ -0,0 +1,191 @@
+"""
+Lightweight tracing of where the time goes during a build, written out in
+the Chrome trace-event format (which chrome://tracing and Perfetto can open).
+
+When tracing is turned off, `span()` hands back a shared do-nothing context
+manager, so instrumented code costs next to nothing.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.monotonic_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.cat, self.start, time.monotonic_ns(),
+                        self.args)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullTracer:
+    """
+    A tracer which doesn't record anything.
+    """
+
+    enabled = False
+
+    def span(self, name, cat='build', **args):
+        return _NULL_SPAN
+
+    def add(self, name, cat, start, end, args):
+        pass
+
+    def extend(self, events):
+        pass
+
+    def drain(self):
+        return []
+
+
+class Tracer:
+    """
+    Records complete ("X") trace events for each span.
+
+    Timestamps come from the system-wide monotonic clock, so events recorded
+    by worker processes line up with the ones recorded here.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # A copy sent to a worker process starts off empty, its events get
+        # sent back separately
+        return (Tracer, ())
+
+    def span(self, name, cat='build', **args):
+        return _Span(self, name, cat, args)
+
+    def add(self, name, cat, start, end, args):
+        event = {
+                'name': name,
+                'cat': cat,
+                'ph': 'X',
+                'ts': start / 1000,
+                'dur': (end - start) / 1000,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': args,
+                }
+        with self._lock:
+            self.events.append(event)
+
+    def extend(self, events):
+        """
+        Add events recorded somewhere else (e.g. by a worker process).
+        """
+        with self._lock:
+            self.events.extend(events)
+
+    def drain(self):
+        """
+        Remove and return every event recorded so far.
+        """
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'}, f)
+
+    def _totals(self, key):
+        totals = defaultdict(float)
+        for event in self.events:
+            if event['cat'] == 'stage':
+                totals[key(event)] += event['dur'] / 1e6
+
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+    def slowest_pages(self, n=10):
+        """
+        Get the `n` pages which took the longest, as `(path, seconds)`
+        tuples. A page's time is the sum of its stages (reading, markdown,
+        templates, middleware and writing).
+        """
+        return self._totals(lambda event: event['args'].get('page'))[:n]
+
+    def stages(self):
+        """
+        Get the total time spent in each stage across every page, as
+        `(stage, seconds)` tuples.
+        """
+        return self._totals(lambda event: event['name'])
+
+    def summary(self, n=10):
+        """
+        A human-readable summary of the slowest pages and stages.
+        """
+        lines = ['Slowest pages:']
+        for path, seconds in self.slowest_pages(n):
+            lines.append('    {:>10.2f}ms  {}'.format(seconds * 1000, path))
+
+        lines.append('Time per stage:')
+        for stage, seconds in self.stages():
+            lines.append('    {:>10.2f}ms  {}'.format(seconds * 1000, stage))
+        return '\n'.join(lines)
+
+
+_tracer = NullTracer()
+
+
+def get_tracer():
+    return _tracer
+
+
+def set_tracer(tracer):
+    global _tracer
+    _tracer = tracer
+
+
+@contextmanager
+def activate(tracer):
+    """
+    Make `tracer` the current tracer for the duration of a `with` block.
+    """
+    previous = get_tracer()
+    set_tracer(tracer)
+    try:
+        yield tracer
+    finally:
+        set_tracer(previous)
+
+
+def span(name, cat='build', **args):
+    """
+    Time a block of code using the current tracer.
+    """
+    return _tracer.span(name, cat, **args)
@@ -20,6 +20,12 @@ setup(
             'docopt',
             'bs4',
             ],
+        extras_require={
+            'brotli': ['brotli'],
+            'markdown-it': ['markdown-it-py'],
+            'mistune': ['mistune>=2'],
+            'cmark': ['cmarkgfm'],
+            },
 
         entry_points={
             'console_scripts': [
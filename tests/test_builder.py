@@ -1,10 +1,12 @@
 import os
+import shutil
 from bs4 import BeautifulSoup
 import pytest
 
 from markdoc2.builder import Builder, Crumb
 from markdoc2.render import Page, Directory
-from markdoc2.exceptions import MarkdocError
+from markdoc2.exceptions import MarkdocError, InvalidFileName
+from markdoc2.middleware import relative_paths, relative_paths_soup
 import markdoc2
 
 
@@ -31,6 +33,12 @@ class TestBuilder:
         assert b.wiki_dir == os.path.abspath('stuff')
         assert b.output_dir == os.path.abspath('outdir')
 
+    def test_link_rewriter(self):
+        assert Builder().middleware == [relative_paths]
+
+        b = Builder({'link-rewriter': 'soup'})
+        assert b.middleware == [relative_paths_soup]
+
     def test_valid_filename(self, builder):
         good_filenames = ['stuff.md', '/path/to/page.md']
         for filename in good_filenames:
@@ -57,6 +65,58 @@ class TestBuilder:
         got = list(builder.walk())
         assert got == should_be
 
+    def test_walk_shares_parent_crumbs(self, builder):
+        with open(os.path.join(builder.wiki_dir, 'subdir', 'more.md'),
+                  'w') as f:
+            f.write('More stuff')
+
+        crumbs = [crumbs for name, crumbs in builder.walk()
+                  if len(crumbs) == 3]
+        first, second = crumbs
+        assert first[1] is second[1]
+        assert first[0] is builder.directory_crumbs([])[0]
+
+    def test_pages_share_a_context(self, builder):
+        directories, pages = builder.paths_to_pages()
+
+        assert all(p.context is builder.page_context for p in pages)
+        assert all(d.context is builder.page_context
+                   for d in directories.values())
+
+        # Swapping out a setting gives new pages a new context
+        builder.md_extensions = []
+        assert builder.page_context is not pages[0].context
+
+    def test_walk_skips_hidden_trees(self, builder):
+        nested = os.path.join(builder.wiki_dir, '.git', 'objects')
+        os.makedirs(nested)
+        with open(os.path.join(nested, 'packed.md'), 'w') as f:
+            f.write('Not part of the wiki')
+
+        names = [name for name, _ in builder.walk()]
+        assert 'packed.md' not in names
+        assert 'ignored.md' not in names
+
+    def test_markdocignore(self, builder):
+        vendor = os.path.join(builder.wiki_dir, 'node_modules', 'pkg')
+        os.makedirs(vendor)
+        with open(os.path.join(vendor, 'README.md'), 'w') as f:
+            f.write('Vendored')
+        with open(os.path.join(builder.wiki_dir, '.markdocignore'), 'w') as f:
+            f.write('node_modules/\n/another_page.md\n')
+
+        names = sorted(name for name, _ in builder.walk())
+        assert names == ['home.md', 'stuff.md']
+
+        assert builder.is_ignored(os.path.join(vendor, 'README.md'))
+        assert not builder.is_document(
+                os.path.join(builder.wiki_dir, 'another_page.md'))
+        assert builder.directory_for('node_modules') is None
+        assert 'node_modules' not in builder.directory_for('.').render()
+
+        filenames = builder.build()
+        assert len(filenames) == 4
+
     def test_walk_with_index_md(self, builder):
         index_file = os.path.join(builder.wiki_dir, 'index.md')
         with open(index_file, 'w') as f:
@@ -157,4 +217,339 @@ class TestBuilder:
         for thing in filenames:
             assert os.path.exists(thing)
 
+    def test_parallel_build(self, builder):
+        serial = builder.build()
+        should_be = {name: open(name).read() for name in serial}
+
+        builder.jobs = 2
+        builder.force = True
+        got = builder.build()
+
+        assert got == serial
+        for name in got:
+            assert open(name).read() == should_be[name]
+
+    def test_parallel_build_raises_markdoc_errors(self, builder):
+        builder.jobs = 2
+        builder.middleware.append(_explode)
+
+        with pytest.raises(InvalidFileName):
+            builder.build()
+
+
+class TestIncrementalBuild:
+    def _count_renders(self, builder):
+        rendered = []
+        render_page = builder.render_page
+
+        def spy(page):
+            rendered.append(page.path)
+            return render_page(page)
+
+        builder.render_page = spy
+        return rendered
+
+    def test_unchanged_pages_are_skipped(self, builder):
+        builder.build()
+        rendered = self._count_renders(builder)
+
+        filenames = builder.build()
+
+        assert rendered == []
+        assert len(filenames) == 5
+
+    def test_changed_pages_are_rebuilt(self, builder):
+        builder.build()
+        rendered = self._count_renders(builder)
+
+        with open(os.path.join(builder.wiki_dir, 'home.md'), 'a') as f:
+            f.write('\nMore text')
+        builder.build()
+
+        # Editing a page's body doesn't touch any listings
+        assert rendered == ['home.md']
+
+    def test_front_matter_changes_rebuild_the_parent_listing(self, builder):
+        builder.build()
+        rendered = self._count_renders(builder)
+
+        filename = os.path.join(builder.wiki_dir, 'home.md')
+        with open(filename) as f:
+            text = f.read()
+        with open(filename, 'w') as f:
+            f.write('---\ntitle: Welcome Home\n---\n' + text)
+        builder.build()
+
+        assert sorted(rendered) == ['.', 'home.md']
+        with open(os.path.join(builder.output_dir, 'index.html')) as f:
+            assert 'Welcome Home' in f.read()
+
+    def test_metadata_is_cached(self, builder, tmpdir):
+        builder = Builder({'wiki-dir': builder.wiki_dir,
+                           'output-dir': builder.output_dir,
+                           'cache-dir': str(tmpdir)})
+        builder.build()
+
+        assert os.path.exists(builder.metadata.filename)
+
+    def test_missing_outputs_are_rebuilt(self, builder):
+        filenames = builder.build()
+        rendered = self._count_renders(builder)
+
+        os.remove(filenames[0])
+        builder.build()
+
+        assert os.path.exists(filenames[0])
+        assert len(rendered) == 1
+
+    def test_new_file_only_rebuilds_its_parent_listing(self, builder):
+        builder.build()
+        rendered = self._count_renders(builder)
+
+        filename = os.path.join(builder.wiki_dir, 'subdir', 'new.md')
+        with open(filename, 'w') as f:
+            f.write('New page')
+        builder.build()
+
+        assert sorted(rendered) == ['subdir', 'subdir/new.md']
+
+    def test_deleted_file_only_rebuilds_its_parent_listing(self, builder):
+        builder.build()
+        rendered = self._count_renders(builder)
+
+        os.remove(os.path.join(builder.wiki_dir, 'another_page.md'))
+        builder.build()
+
+        assert rendered == ['.']
 
+    def test_nested_directory_without_documents(self, builder):
+        nested = os.path.join(builder.wiki_dir, 'a', 'b')
+        os.makedirs(nested)
+        with open(os.path.join(nested, 'deep.md'), 'w') as f:
+            f.write('Deep page')
+
+        directories, pages = builder.paths_to_pages()
+
+        assert directories['a'].children == [directories['a/b']]
+        assert directories['a'] in directories['.'].children
+
+    def test_force(self, builder):
+        builder.build()
+        rendered = self._count_renders(builder)
+
+        builder.force = True
+        builder.build()
+
+        assert len(rendered) == 5
+
+    def test_identical_outputs_are_not_rewritten(self, builder):
+        filenames = builder.build()
+        for name in filenames:
+            os.utime(name, ns=(0, 0))
+
+        builder.force = True
+        builder.build()
+
+        assert builder.written == []
+        for name in filenames:
+            assert os.stat(name).st_mtime_ns == 0
+
+    def test_extension_changes_rebuild_everything(self, builder):
+        builder.build()
+        rendered = self._count_renders(builder)
+
+        builder.md_extensions = []
+        builder.build()
+
+        assert len(rendered) == 5
+
+
+class TestIterBuild:
+    def test_matches_build(self, builder):
+        filenames = builder.build()
+        should_be = _read_output(builder)
+
+        builder.force = True
+        got = list(builder.iter_build())
+
+        assert sorted(got) == sorted(filenames)
+        assert _read_output(builder) == should_be
+
+    def test_is_lazy(self, builder):
+        results = builder.iter_build()
+        first = next(results)
+
+        assert os.path.exists(first)
+        assert not os.path.exists(os.path.join(builder.output_dir,
+                                               'index.html'))
+        list(results)
+
+    def test_listings_come_after_their_subtree(self, builder):
+        got = [os.path.relpath(name, builder.output_dir)
+               for name in builder.iter_build()]
+
+        assert got.index('subdir/stuff.html') < got.index('subdir/index.html')
+        assert got[-1] == 'index.html'
+
+    def test_unchanged_pages_are_skipped(self, builder):
+        list(builder.iter_build())
+        list(builder.iter_build())
+        assert builder.written == []
+
+        builder.build()
+        assert builder.written == []
+
+
+class TestRebuild:
+    def test_modified_page(self, builder):
+        builder.build()
+        home = os.path.join(builder.wiki_dir, 'home.md')
+        with open(home, 'a') as f:
+            f.write('\nMore text')
+
+        written = builder.rebuild(modified=[home])
+
+        assert written == [os.path.join(builder.output_dir, 'home.html')]
+
+    def test_modified_front_matter(self, builder):
+        builder.build()
+        home = os.path.join(builder.wiki_dir, 'home.md')
+        with open(home) as f:
+            text = f.read()
+        with open(home, 'w') as f:
+            f.write('---\ntitle: Welcome Home\n---\n' + text)
+
+        written = builder.rebuild(modified=[home])
+
+        listing = os.path.join(builder.output_dir, 'index.html')
+        assert sorted(written) == [
+                os.path.join(builder.output_dir, 'home.html'),
+                listing,
+                ]
+        assert 'Welcome Home' in open(listing).read()
+
+    def test_created_page(self, builder):
+        builder.build()
+        new = os.path.join(builder.wiki_dir, 'subdir', 'new.md')
+        with open(new, 'w') as f:
+            f.write('New page')
+
+        written = builder.rebuild(created=[new])
+
+        listing = os.path.join(builder.output_dir, 'subdir', 'index.html')
+        assert sorted(written) == [
+                listing,
+                os.path.join(builder.output_dir, 'subdir', 'new.html'),
+                ]
+        assert 'new.html' in open(listing).read()
+
+    def test_deleted_page(self, builder):
+        builder.build()
+        stuff = os.path.join(builder.wiki_dir, 'subdir', 'stuff.md')
+        os.remove(stuff)
+
+        written = builder.rebuild(deleted=[stuff])
+
+        # The subdir is now empty, so it disappears from the root listing
+        root_listing = os.path.join(builder.output_dir, 'index.html')
+        assert sorted(written) == [
+                root_listing,
+                os.path.join(builder.output_dir, 'subdir', 'index.html'),
+                os.path.join(builder.output_dir, 'subdir', 'stuff.html'),
+                ]
+        assert not os.path.exists(os.path.join(builder.output_dir, 'subdir'))
+        assert 'subdir' not in open(root_listing).read()
+
+    def test_edited_while_rendering(self, builder, monkeypatch):
+        builder.build()
+        home = os.path.join(builder.wiki_dir, 'home.md')
+        with open(home, 'a') as f:
+            f.write('\nFirst edit')
+
+        render_page = builder.render_page
+
+        def render_then_edit(page, text=None):
+            html = render_page(page, text)
+            with open(home, 'a') as f:
+                f.write('\nSecond edit')
+            return html
+
+        monkeypatch.setattr(builder, 'render_page', render_then_edit)
+        builder.rebuild(modified=[home])
+        monkeypatch.undo()
+
+        # The second edit came after the page was read, so it still needs
+        # rendering
+        written = builder.rebuild(modified=[home])
+        output = os.path.join(builder.output_dir, 'home.html')
+        assert written == [output]
+        assert 'Second edit' in open(output).read()
+
+    def test_force_is_ignored(self, builder):
+        # Rebuilding part of the wiki mustn't forget about the rest of it
+        builder.search = True
+        builder.build()
+        entries = set(builder.load_manifest(force=False).entries)
+        docs = set(builder.load_search_index(force=False).docs)
+
+        builder.force = True
+        home = os.path.join(builder.wiki_dir, 'home.md')
+        with open(home, 'a') as f:
+            f.write('\nMore text')
+        builder.rebuild(modified=[home])
+
+        assert set(builder.load_manifest(force=False).entries) == entries
+        assert set(builder.load_search_index(force=False).docs) == docs
+
+        subdir = os.path.join(builder.wiki_dir, 'subdir')
+        shutil.rmtree(subdir)
+        builder.rebuild(deleted=[subdir])
+        assert not os.path.exists(os.path.join(builder.output_dir, 'subdir'))
+
+    def test_matches_a_full_build(self, builder):
+        builder.build()
+        new_dir = os.path.join(builder.wiki_dir, 'new', 'nested')
+        os.makedirs(new_dir)
+        new = os.path.join(new_dir, 'page.md')
+        with open(new, 'w') as f:
+            f.write('Nested page')
+
+        builder.rebuild(created=[new])
+        incremental = _read_output(builder)
+
+        builder.force = True
+        builder.build()
+        assert _read_output(builder) == incremental
+
+    def test_created_directory_matches_a_full_build(self, builder):
+        # Watchers report a directory which was moved or copied in, rather
+        # than everything inside it
+        builder.build()
+        new_dir = os.path.join(builder.wiki_dir, 'new')
+        os.makedirs(os.path.join(new_dir, 'nested'))
+        # Nothing directly inside "new", it still needs a listing
+        with open(os.path.join(new_dir, 'nested', 'page.md'), 'w') as f:
+            f.write('A new page')
+
+        builder.rebuild(created=[new_dir])
+        incremental = _read_output(builder)
+
+        builder.force = True
+        builder.build()
+        assert _read_output(builder) == incremental
+
+
+def _read_output(builder):
+    contents = {}
+    for dirpath, _, files in os.walk(builder.output_dir):
+        for name in files:
+            filename = os.path.join(dirpath, name)
+            if name.endswith('.html'):
+                contents[filename] = open(filename).read()
+    return contents
+
+
+def _explode(page, html):
+    # Middleware needs to be a module-level function so it can be sent to
+    # worker processes
+    raise InvalidFileName(page.path)
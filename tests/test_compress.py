@@ -0,0 +1,126 @@
+import os
+import gzip
+
+import pytest
+
+from markdoc2 import Builder
+from markdoc2.output import MemoryOutput
+from markdoc2 import compress
+from markdoc2.compress import CompressedOutput, available_formats
+
+
+@pytest.fixture
+def compressed(builder):
+    builder.config['compress'] = ['gz']
+    return Builder(builder.config)
+
+
+class TestCompressedOutput:
+    def test_write(self, tmpdir):
+        output = CompressedOutput(MemoryOutput(str(tmpdir)), ['gz'])
+        filename = str(tmpdir.join('page.html'))
+
+        assert output.write(filename, b'hello world')
+        output.close()
+
+        assert gzip.decompress(output.read(filename + '.gz')) == b'hello world'
+
+    def test_unchanged_files_are_not_compressed_again(self, tmpdir,
+                                                      monkeypatch):
+        output = CompressedOutput(MemoryOutput(str(tmpdir)), ['gz'])
+        filename = str(tmpdir.join('page.html'))
+        output.write(filename, b'hello')
+        output.flush()
+
+        compressed = []
+        monkeypatch.setitem(
+            compress.FORMATS, 'gz',
+            lambda data: compressed.append(data) or gzip.compress(data))
+
+        output.write(filename, b'hello')
+        output.flush()
+        assert compressed == []
+
+        # Unless the compressed copy has gone missing
+        output.output.remove(filename + '.gz')
+        output.write(filename, b'hello')
+        output.flush()
+        assert compressed == [b'hello']
+
+    def test_only_text_is_compressed(self, tmpdir):
+        output = CompressedOutput(MemoryOutput(str(tmpdir)), ['gz'])
+        output.write(str(tmpdir.join('image.png')), b'png')
+        output.write(str(tmpdir.join('.manifest.json')), b'{}')
+        output.close()
+
+        assert sorted(output.output.files) == ['.manifest.json', 'image.png']
+
+    def test_exists_needs_every_sibling(self, tmpdir):
+        output = CompressedOutput(MemoryOutput(str(tmpdir)), ['gz'])
+        filename = str(tmpdir.join('page.html'))
+        output.write(filename, b'hello')
+        output.flush()
+        assert output.exists(filename)
+
+        output.output.remove(filename + '.gz')
+        assert not output.exists(filename)
+
+    def test_remove_takes_siblings_too(self, tmpdir):
+        output = CompressedOutput(MemoryOutput(str(tmpdir)), ['gz'])
+        filename = str(tmpdir.join('page.html'))
+        output.write(filename, b'hello')
+        output.flush()
+
+        assert output.remove(filename)
+        assert output.output.files == {}
+
+    def test_unknown_format(self, tmpdir):
+        with pytest.raises(ValueError):
+            CompressedOutput(MemoryOutput(str(tmpdir)), ['zstd'])
+
+    def test_gzip_is_always_available(self):
+        assert 'gz' in available_formats()
+
+
+class TestBuilderCompression:
+    def test_build(self, compressed):
+        filenames = compressed.build()
+
+        for filename in filenames:
+            with open(filename, 'rb') as f:
+                html = f.read()
+            with gzip.open(filename + '.gz') as f:
+                assert f.read() == html
+
+    def test_enabled_on_an_existing_build(self, builder, compressed):
+        filenames = builder.build()
+        assert not os.path.exists(filenames[0] + '.gz')
+
+        compressed.build()
+        for filename in filenames:
+            assert os.path.exists(filename + '.gz')
+
+    def test_missing_siblings_are_restored(self, compressed):
+        filenames = compressed.build()
+        os.remove(filenames[0] + '.gz')
+
+        compressed.build()
+        assert os.path.exists(filenames[0] + '.gz')
+
+    def test_deterministic(self, compressed):
+        filenames = compressed.build()
+        gz = filenames[0] + '.gz'
+        os.utime(gz, ns=(0, 0))
+
+        compressed.force = True
+        compressed.build()
+        assert os.stat(gz).st_mtime_ns == 0
+
+    def test_removed_pages(self, compressed):
+        compressed.build()
+        home = os.path.join(compressed.wiki_dir, 'home.md')
+        os.remove(home)
+        compressed.rebuild(deleted=[home])
+
+        assert not os.path.exists(
+                os.path.join(compressed.output_dir, 'home.html.gz'))
@@ -0,0 +1,57 @@
+import threading
+
+from markdoc2.converters import ConverterPool
+from markdoc2.render import BasePage
+
+
+EXTENSIONS = BasePage.MD_EXTENSIONS
+
+
+class TestConverterPool:
+    def test_convert(self):
+        pool = ConverterPool()
+        html = pool.convert('Heading\n=======', EXTENSIONS)
+        assert html == '<h1>Heading</h1>'
+
+    def test_converters_are_reused(self):
+        pool = ConverterPool()
+        with pool.converter(EXTENSIONS) as first:
+            pass
+        with pool.converter(EXTENSIONS) as second:
+            pass
+        assert first is second
+
+    def test_different_extensions_get_different_converters(self):
+        pool = ConverterPool()
+        with pool.converter(EXTENSIONS) as first:
+            pass
+        with pool.converter([]) as second:
+            pass
+        assert first is not second
+
+    def test_converters_are_reset_between_documents(self):
+        pool = ConverterPool()
+        text = 'Some text[^1]\n\n[^1]: A footnote'
+        extensions = ['markdown.extensions.footnotes']
+
+        first = pool.convert(text, extensions)
+        second = pool.convert(text, extensions)
+        assert first == second
+
+    def test_concurrent_use(self):
+        pool = ConverterPool()
+        results = []
+
+        def convert(i):
+            html = pool.convert('Page {}\n=='.format(i), EXTENSIONS)
+            results.append((i, html))
+
+        threads = [threading.Thread(target=convert, args=(i,))
+                   for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for i, html in results:
+            assert html == '<h1>Page {}</h1>'.format(i)
@@ -0,0 +1,98 @@
+import pytest
+
+from markdoc2 import Builder
+from markdoc2 import engines
+from markdoc2.exceptions import UnsupportedEngine
+
+
+# Markdown which every engine should turn into the same html
+CONFORMANCE = {
+    'headings': '# One\n\n## Two\n\nThree\n=====\n',
+    'paragraphs': 'First paragraph\nstill first.\n\nSecond.\n',
+    'emphasis': 'Some *emphasis*, **strong** and `code` text.\n',
+    'lists': '- one\n- two\n\nbetween\n\n1. first\n2. second\n',
+    'links': '[a link](http://example.com "Title") and '
+             '![an image](image.png)\n',
+    'blockquotes': '> quoted\n> text\n',
+    'code blocks': 'Code:\n\n    x = "<y>" & z\n',
+    'html': '<div class="note">raw html</div>\n\nafter\n',
+    'entities': 'A & B < C, &copy;\n',
+    'rules': 'above\n\n---\n\nbelow\n',
+    'line breaks': 'line  \nbreak\n',
+}
+
+
+@pytest.fixture(params=sorted(engines.ENGINES))
+def engine(request):
+    pytest.importorskip(engines.ENGINES[request.param].module)
+    return engines.get_engine(request.param)
+
+
+class TestEngines:
+    @pytest.mark.parametrize('name', sorted(CONFORMANCE))
+    def test_conformance(self, engine, name):
+        text = CONFORMANCE[name]
+        expected = engines.convert(text, engines.DEFAULT_ENGINE)
+
+        got = engine.convert(text)
+
+        assert engines.normalise_html(got) == engines.normalise_html(expected)
+
+    def test_shared_instances(self, engine):
+        assert engines.get_engine(engine.name) is engine
+
+    def test_unknown_engine(self):
+        with pytest.raises(UnsupportedEngine):
+            engines.get_engine('not-an-engine')
+
+    def test_missing_library(self, monkeypatch):
+        monkeypatch.setattr(engines.MarkdownIt, 'module',
+                            'markdoc2_no_such_module')
+        assert 'markdown-it' not in engines.available_engines()
+        with pytest.raises(UnsupportedEngine):
+            engines.check_engine('markdown-it')
+
+
+class TestNormaliseHtml:
+    def test_equivalent_html(self):
+        a = '<p>a&copy; &quot;b&quot;<br />\n<img src="x" alt="y" /></p>\n'
+        b = '<p>a© "b"<br>\n<img alt="y" src="x"></p>'
+        assert engines.normalise_html(a) == engines.normalise_html(b)
+
+    def test_different_html(self):
+        assert (engines.normalise_html('<p>&lt;b&gt;</p>') !=
+                engines.normalise_html('<p><b></b></p>'))
+
+
+class TestBuilderEngine:
+    def test_default(self, page):
+        assert Builder().md_engine == engines.DEFAULT_ENGINE
+        assert page.md_engine == engines.DEFAULT_ENGINE
+
+    def test_unknown_engine(self):
+        with pytest.raises(UnsupportedEngine):
+            Builder({'markdown-engine': 'not-an-engine'})
+
+    def test_build(self, builder, engine):
+        builder.md_engine = engine.name
+        builder.build()
+
+        context = builder.page_context
+        assert context.md_engine == engine.name
+
+    def test_changing_engine_rebuilds_everything(self, builder):
+        pytest.importorskip('markdown_it')
+        filenames = builder.build()
+
+        rendered = []
+        render_page = builder.render_page
+
+        def spy(page, text=None):
+            rendered.append(page.path)
+            return render_page(page, text)
+
+        builder.render_page = spy
+        builder.md_engine = 'markdown-it'
+        builder.build()
+
+        assert len(rendered) == len(filenames)
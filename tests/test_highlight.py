@@ -0,0 +1,133 @@
+import os
+import sys
+import tempfile
+import subprocess
+import shutil
+
+import pytest
+
+from markdoc2.converters import ConverterPool
+from markdoc2.highlight import HighlightCache
+from markdoc2.render import BasePage
+
+
+TEST_DIR = os.path.abspath(os.path.dirname(__file__))
+PROJECT_ROOT = os.path.dirname(TEST_DIR)
+
+CODE = '''Some code:
+
+    :::python
+    def foo(x):
+        return x + 1
+'''
+
+
+@pytest.fixture
+def cache_dir(request):
+    directory = tempfile.mkdtemp()
+    request.addfinalizer(lambda: shutil.rmtree(directory))
+    return directory
+
+
+def cached_extensions(cache_dir, **options):
+    extensions = ['markdoc2.highlight', 'markdown.extensions.def_list']
+    options['cache_dir'] = cache_dir
+    return extensions, {'markdoc2.highlight': options}
+
+
+def cache_files(cache_dir):
+    return [os.path.join(dirpath, name)
+            for dirpath, _, files in os.walk(cache_dir)
+            for name in files]
+
+
+class TestHighlightExtension:
+    def test_same_output_as_codehilite(self, cache_dir):
+        pool = ConverterPool()
+        should_be = pool.convert(CODE, BasePage.MD_EXTENSIONS)
+
+        extensions, configs = cached_extensions(cache_dir)
+        assert pool.convert(CODE, extensions, configs) == should_be
+        # And again, this time out of the cache
+        assert pool.convert(CODE, extensions, configs) == should_be
+
+    def test_blocks_are_cached(self, cache_dir):
+        pool = ConverterPool()
+        extensions, configs = cached_extensions(cache_dir)
+
+        pool.convert(CODE, extensions, configs)
+        assert len(cache_files(cache_dir)) == 1
+
+        # The same snippet on a different page is a cache hit
+        pool.convert('Another page\n\n' + CODE, extensions, configs)
+        assert len(cache_files(cache_dir)) == 1
+
+    def test_cache_is_shared_between_processes(self, cache_dir):
+        # Keys mustn't depend on anything which differs between processes
+        # (e.g. object ids), or separate builds and workers never get a hit
+        script = (
+            'import sys, markdown\n'
+            'markdown.markdown(sys.stdin.read(),\n'
+            '                  extensions=["markdoc2.highlight"],\n'
+            '                  extension_configs={"markdoc2.highlight": '
+            '{"cache_dir": sys.argv[1]}})\n'
+            )
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', script, cache_dir],
+                           input=CODE, text=True, check=True,
+                           cwd=PROJECT_ROOT)
+
+        assert len(cache_files(cache_dir)) == 1
+
+    def test_options_are_part_of_the_key(self, cache_dir):
+        pool = ConverterPool()
+
+        extensions, configs = cached_extensions(cache_dir)
+        pool.convert(CODE, extensions, configs)
+        extensions, configs = cached_extensions(cache_dir, linenums=True)
+        pool.convert(CODE, extensions, configs)
+
+        assert len(cache_files(cache_dir)) == 2
+
+
+class TestHighlightCache:
+    def test_get_and_set(self, cache_dir):
+        cache = HighlightCache(cache_dir)
+        assert cache.get('abcdef') is None
+
+        cache.set('abcdef', '<pre>code</pre>')
+        assert cache.get('abcdef') == '<pre>code</pre>'
+
+    def test_least_recently_used_are_evicted(self, cache_dir):
+        cache = HighlightCache(cache_dir, max_bytes=350)
+        for i, key in enumerate(['aa', 'bb', 'cc']):
+            cache.set(key, 'x' * 100)
+            # Make sure the mtimes are distinct
+            os.utime(cache._filename(key), ns=(i, i))
+
+        # Touch "aa" so "bb" becomes the least recently used
+        cache.get('aa')
+        cache.set('dd', 'x' * 100)
+
+        assert cache.get('bb') is None
+        assert cache.get('aa') is not None
+        assert cache.get('dd') is not None
+
+
+class TestBuilderHighlightCache:
+    def test_enabled_with_a_cache_dir(self, builder, cache_dir):
+        from markdoc2 import Builder
+
+        b = Builder({
+            'wiki-dir': builder.wiki_dir,
+            'output-dir': builder.output_dir,
+            'cache-dir': cache_dir,
+            })
+        assert 'markdoc2.highlight' in b.md_extensions
+        assert 'markdown.extensions.codehilite' not in b.md_extensions
+
+        assert b.build()
+
+    def test_disabled_by_default(self, builder):
+        assert builder.md_extensions == BasePage.MD_EXTENSIONS
+        assert builder.md_extension_configs == {}
@@ -0,0 +1,52 @@
+import pytest
+
+from markdoc2.ignore import IgnoreRules, translate
+
+
+class TestIgnoreRules:
+    @pytest.mark.parametrize('pattern, path, is_dir, ignored', [
+        ('node_modules', 'node_modules', True, True),
+        ('node_modules', 'a/b/node_modules', True, True),
+        ('*.tmp.md', 'notes/draft.tmp.md', False, True),
+        ('*.tmp.md', 'notes/draft.md', False, False),
+        ('/drafts', 'drafts', True, True),
+        ('/drafts', 'notes/drafts', True, False),
+        ('notes/*.md', 'notes/a.md', False, True),
+        ('notes/*.md', 'notes/sub/a.md', False, False),
+        ('notes/**/a.md', 'notes/sub/deeper/a.md', False, True),
+        ('notes/**/a.md', 'notes/a.md', False, True),
+        ('build/', 'build', True, True),
+        ('build/', 'build', False, False),
+        ('page-?.md', 'page-1.md', False, True),
+        ('page-[0-9].md', 'page-x.md', False, False),
+        ('page-[!0-9].md', 'page-x.md', False, True),
+        ])
+    def test_match(self, pattern, path, is_dir, ignored):
+        rules = IgnoreRules([pattern])
+        assert rules.match(path, is_dir) == ignored
+
+    def test_comments_and_blank_lines(self):
+        rules = IgnoreRules(['# a comment', '', '   '])
+        assert not rules
+        assert not rules.match('# a comment')
+
+    def test_last_matching_rule_wins(self):
+        rules = IgnoreRules(['*.md', '!keep.md'])
+        assert rules.match('drop.md')
+        assert not rules.match('keep.md')
+
+        rules = IgnoreRules(['!keep.md', '*.md'])
+        assert rules.match('keep.md')
+
+    def test_match_path_checks_parents(self):
+        rules = IgnoreRules(['vendor/', '!vendor/keep.md'])
+        assert rules.match_path('vendor/keep.md')
+        assert not rules.match_path('docs/keep.md')
+
+    def test_load_missing_file(self, tmpdir):
+        rules = IgnoreRules.load(str(tmpdir.join('.markdocignore')))
+        assert not rules
+
+    def test_translate_escapes(self):
+        assert translate('a.b') == r'a\.b'
+        assert translate(r'\*') == r'\*'
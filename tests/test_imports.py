@@ -0,0 +1,63 @@
+"""
+Make sure the command line stays quick to start by checking which heavy
+dependencies get imported. Each check runs in a fresh interpreter, since
+other tests will already have imported everything.
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+import markdoc2
+
+
+TEST_DIR = os.path.abspath(os.path.dirname(__file__))
+PROJECT_ROOT = os.path.dirname(TEST_DIR)
+HEAVY = ['markdown', 'jinja2', 'bs4', 'pygments']
+
+
+def imported_after(code):
+    script = (code + '\nimport sys, json\n'
+              'print(json.dumps(sorted(sys.modules)))')
+    output = subprocess.check_output([sys.executable, '-c', script],
+                                     cwd=PROJECT_ROOT)
+    modules = json.loads(output.decode().splitlines()[-1])
+    return {name for name in HEAVY if name in modules}
+
+
+class TestLazyImports:
+    @pytest.mark.parametrize('code', [
+        'import markdoc2',
+        'import markdoc2.__main__',
+        'from markdoc2 import Builder, Crumb, Page, Directory',
+        ])
+    def test_no_heavy_imports(self, code):
+        assert imported_after(code) == set()
+
+    def test_up_to_date_build_skips_heavy_imports(self, builder):
+        builder.build()
+
+        code = 'import markdoc2; markdoc2.Builder({!r}).build()'.format({
+            'wiki-dir': builder.wiki_dir,
+            'output-dir': builder.output_dir,
+            })
+        assert imported_after(code) == set()
+
+    def test_rendering_imports_what_it_needs(self, builder):
+        code = 'import markdoc2; markdoc2.Builder({!r}).build()'.format({
+            'wiki-dir': builder.wiki_dir,
+            'output-dir': builder.output_dir,
+            })
+        assert {'markdown', 'jinja2'} <= imported_after(code)
+
+    def test_public_names(self):
+        for name in markdoc2.__all__:
+            assert getattr(markdoc2, name) is not None
+        assert set(markdoc2.__all__) <= set(dir(markdoc2))
+
+    def test_unknown_name(self):
+        with pytest.raises(AttributeError):
+            markdoc2.DoesNotExist
@@ -0,0 +1,63 @@
+import os
+
+from markdoc2.lazy import LazyRenderer
+
+
+class TestLazyRenderer:
+    def test_matches_a_full_build(self, builder):
+        renderer = LazyRenderer(builder)
+
+        for filename in builder.build():
+            href = '/' + os.path.relpath(filename, builder.output_dir)
+            assert renderer.get(href) == open(filename, 'rb').read()
+
+    def test_directory_hrefs(self, builder):
+        renderer = LazyRenderer(builder)
+        assert renderer.get('/') == renderer.get('/index.html')
+        assert renderer.get('/subdir/') == renderer.get('/subdir/index.html')
+
+    def test_missing_pages(self, builder):
+        renderer = LazyRenderer(builder)
+        assert renderer.get('/nope.html') is None
+        assert renderer.get('/.hidden_file/ignored.html') is None
+        assert renderer.get('/../etc/passwd') is None
+        assert renderer.get('/codehilite.css') is None
+
+    def test_pages_are_cached(self, builder):
+        renderer = LazyRenderer(builder)
+        first = renderer.get('/home.html')
+        second = renderer.get('/home.html')
+
+        assert first is second
+        assert renderer.hits == 1
+        assert renderer.misses == 1
+
+    def test_edited_pages_are_rerendered(self, builder):
+        renderer = LazyRenderer(builder)
+        renderer.get('/home.html')
+
+        with open(os.path.join(builder.wiki_dir, 'home.md'), 'a') as f:
+            f.write('\nSome more text')
+
+        assert b'Some more text' in renderer.get('/home.html')
+
+    def test_new_pages_update_listings(self, builder):
+        renderer = LazyRenderer(builder)
+        renderer.get('/subdir/')
+
+        filename = os.path.join(builder.wiki_dir, 'subdir', 'new.md')
+        with open(filename, 'w') as f:
+            f.write('New page')
+
+        assert b'new.md' in renderer.get('/subdir/')
+
+    def test_cache_is_size_bounded(self, builder):
+        renderer = LazyRenderer(builder)
+        size = len(renderer.get('/home.html'))
+        renderer.clear()
+
+        renderer.max_bytes = size + 1
+        renderer.get('/home.html')
+        renderer.get('/another_page.html')
+
+        assert len(renderer) == 1
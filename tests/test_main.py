@@ -1,7 +1,7 @@
 import os
 from glob import glob
 
-from markdoc2.__main__ import build, main
+from markdoc2.__main__ import build, main, watch
 
 
 class TestMain:
@@ -40,3 +40,61 @@ class TestMain:
         with open(index_file, 'w') as f:
             f.write('')
         assert build(args) == 1
+
+    def test_build_with_jobs(self, builder):
+        args = {
+                '--source-dir': builder.wiki_dir,
+                '--output-dir': builder.output_dir,
+                '--jobs': '2',
+                'build': True,
+                '--browser': False,
+                }
+        assert 0 == build(args)
+        assert glob(builder.output_dir + '/*')
+
+    def test_build_with_trace(self, builder, tmpdir, capsys):
+        trace_file = str(tmpdir.join('trace.json'))
+        args = {
+                '--source-dir': builder.wiki_dir,
+                '--output-dir': builder.output_dir,
+                '--trace': trace_file,
+                'build': True,
+                '--browser': False,
+                }
+        assert 0 == build(args)
+        assert os.path.exists(trace_file)
+        assert 'Slowest pages:' in capsys.readouterr().out
+
+    def test_build_with_pipeline(self, builder, capsys):
+        args = {
+                '--source-dir': builder.wiki_dir,
+                '--output-dir': builder.output_dir,
+                '--pipeline': True,
+                'build': True,
+                '--browser': False,
+                }
+        assert 0 == build(args)
+        assert glob(builder.output_dir + '/*')
+        assert 'Pipeline' in capsys.readouterr().out
+
+    def test_build_with_unknown_engine(self, builder, capsys):
+        args = {
+                '--source-dir': builder.wiki_dir,
+                '--output-dir': builder.output_dir,
+                '--markdown-engine': 'not-an-engine',
+                'build': True,
+                '--browser': False,
+                }
+        assert build(args) == 1
+        assert 'not-an-engine' in capsys.readouterr().out
+
+    def test_watch_with_unknown_watcher(self, builder, capsys):
+        args = {
+                '--source-dir': builder.wiki_dir,
+                '--output-dir': builder.output_dir,
+                '--watcher': 'not-a-watcher',
+                'watch': True,
+                '--browser': False,
+                }
+        assert watch(args) == 1
+        assert 'not-a-watcher' in capsys.readouterr().out
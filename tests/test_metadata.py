@@ -0,0 +1,142 @@
+import os
+import json
+
+import pytest
+
+from markdoc2 import metadata
+from markdoc2.metadata import (MetadataCache, read_metadata,
+                               split_front_matter, strip_front_matter,
+                               parse)
+
+
+YAML_PAGE = '''---
+title: Getting Started
+tags: [setup, install]
+date: 2024-01-31
+---
+# Heading
+
+Some text.
+'''
+
+TOML_PAGE = '''+++
+title = "Getting Started"
+tags = ["setup", "install"]
+date = 2024-01-31
++++
+# Heading
+'''
+
+EXPECTED = {
+        'title': 'Getting Started',
+        'tags': ['setup', 'install'],
+        'date': '2024-01-31',
+        }
+
+
+@pytest.fixture
+def write(tmpdir):
+    def write(name, text):
+        filename = str(tmpdir.join(name))
+        with open(filename, 'w') as f:
+            f.write(text)
+        return filename
+    return write
+
+
+class TestFrontMatter:
+    def test_split(self):
+        delimiter, front_matter, body = split_front_matter(YAML_PAGE)
+
+        assert delimiter == '---'
+        assert front_matter.startswith('title: Getting Started\n')
+        assert body == '# Heading\n\nSome text.\n'
+
+    def test_no_front_matter(self):
+        text = '# Heading\n\n---\n\nMore\n'
+        assert split_front_matter(text) == (None, None, text)
+
+    def test_unclosed_front_matter(self):
+        text = '---\n\nJust a horizontal rule\n'
+        assert split_front_matter(text) == (None, None, text)
+
+    def test_strip(self):
+        assert strip_front_matter(YAML_PAGE) == '# Heading\n\nSome text.\n'
+
+    @pytest.mark.parametrize('text', [
+        '---\n\nIntro paragraph.\n\n---\n\nRest of page.\n',
+        '---\n- a list\n---\n',
+        '+++\n\n+++\n',
+        ])
+    def test_strip_leaves_non_metadata_alone(self, text):
+        assert strip_front_matter(text) == text
+
+    @pytest.mark.parametrize('text', [YAML_PAGE, TOML_PAGE])
+    def test_read_metadata(self, write, text):
+        assert read_metadata(write('page.md', text)) == EXPECTED
+
+    def test_only_reads_the_header(self, write):
+        # The body isn't even valid utf-8, but it never gets read
+        filename = write('page.md', '---\ntitle: Hi\n---\n')
+        with open(filename, 'ab') as f:
+            f.write(b'\xff\xfe' * 100000)
+
+        assert read_metadata(filename) == {'title': 'Hi'}
+
+    def test_invalid_front_matter(self, write):
+        filename = write('page.md', '---\ntitle: [unclosed\n---\n')
+        assert read_metadata(filename) == {}
+
+    def test_not_a_mapping(self):
+        assert parse('- just\n- a list\n') == {}
+
+    def test_simple_parser(self, monkeypatch):
+        monkeypatch.setattr(metadata, '_parse_yaml',
+                            lambda text: metadata._parse_simple(text, ':'))
+
+        got = parse('title: "Hello: World"\ntags: [a, b]\n# comment\n')
+        assert got == {'title': 'Hello: World', 'tags': ['a', 'b']}
+
+
+class TestMetadataCache:
+    def test_cached_until_modified(self, write, monkeypatch):
+        filename = write('page.md', YAML_PAGE)
+        cache = MetadataCache()
+        assert cache.get(filename) == EXPECTED
+
+        reads = []
+        monkeypatch.setattr(metadata, 'read_metadata',
+                            lambda f: reads.append(f) or {'title': 'New'})
+        assert cache.get(filename) == EXPECTED
+        assert reads == []
+
+        st = os.stat(filename)
+        os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert cache.get(filename) == {'title': 'New'}
+        assert reads == [filename]
+
+    def test_missing_file(self, tmpdir):
+        assert MetadataCache().get(str(tmpdir.join('missing.md'))) == {}
+
+    def test_saved_between_builds(self, write, tmpdir, monkeypatch):
+        filename = write('page.md', YAML_PAGE)
+        cache_file = str(tmpdir.join('cache', metadata.CACHE_NAME))
+
+        cache = MetadataCache(cache_file)
+        cache.get(filename)
+        cache.save()
+        with open(cache_file) as f:
+            assert filename in json.load(f)['entries']
+
+        monkeypatch.setattr(metadata, 'read_metadata', None)
+        assert MetadataCache(cache_file).get(filename) == EXPECTED
+
+    def test_prune(self, write):
+        first = write('first.md', YAML_PAGE)
+        second = write('second.md', YAML_PAGE)
+        cache = MetadataCache()
+        cache.get(first)
+        cache.get(second)
+
+        cache.prune([second])
+        assert list(cache._entries) == [second]
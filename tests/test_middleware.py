@@ -0,0 +1,152 @@
+import os
+import re
+from bs4 import BeautifulSoup
+
+from markdoc2.middleware import (relative_paths, relative_paths_soup,
+                                 relative_paths_tree, tree_middleware, parse)
+from markdoc2.builder import Builder, Crumb
+from markdoc2.render import Page
+import markdoc2
+
+
+HTML = '''<html>
+<head>
+<link rel="stylesheet" href="/codehilite.css" type="text/css">
+<link rel="stylesheet" href="https://example.com/style.css">
+<!-- <a href="/commented/out.html"> -->
+<script>var link = '<a href="/not/a/link.html">';</script>
+</head>
+<body>
+<a href="/index.html">Home</a>
+<a class='x' href='/subdir/stuff.html'>Stuff</a>
+<a href=/subdir/>Subdir</a>
+<a data-href="/ignored.html" href="/another_page.html">Another</a>
+<a title="see href=/ignored.html" download href="/titled.html">Titled</a>
+<a href="#heading">Heading</a>
+<a href="mailto:someone@example.com">Mail</a>
+<a name="anchor">No href</a>
+<abbr href="/not/an/anchor.html">abbr</abbr>
+</body>
+</html>'''
+
+
+def make_page(path):
+    crumbs = [Crumb('index', '/'), Crumb(path, None)]
+    return Page(path, crumbs, markdoc2.TEMPLATE_DIR, '.')
+
+
+def strip_hrefs(html):
+    return re.sub(r'''href=("[^"]*"|'[^']*'|[^\s>]+)''', 'href=', html)
+
+
+def links(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    return [(tag.name, tag.get('href'))
+            for tag in soup.find_all(['a', 'link'])]
+
+
+class TestRelativePaths:
+    def test_links_are_rewritten(self):
+        page = make_page('subdir/page.md')
+        got = links(relative_paths(page, HTML))
+
+        assert got == [
+                ('link', '../codehilite.css'),
+                ('link', 'https://example.com/style.css'),
+                ('a', '../index.html'),
+                ('a', 'stuff.html'),
+                ('a', './index.html'),
+                ('a', '../another_page.html'),
+                ('a', '../titled.html'),
+                ('a', '#heading'),
+                ('a', 'mailto:someone@example.com'),
+                ('a', None),
+                ]
+
+    def test_everything_else_is_untouched(self):
+        page = make_page('home.md')
+        got = relative_paths(page, HTML)
+
+        assert '<!-- <a href="/commented/out.html"> -->' in got
+        assert '<a href="/not/a/link.html">' in got
+        assert 'data-href="/ignored.html"' in got
+        assert 'title="see href=/ignored.html"' in got
+        assert '<abbr href="/not/an/anchor.html">' in got
+        assert "<a class='x' href='subdir/stuff.html'>" in got
+
+        # Apart from the links themselves, the page is byte-for-byte the same
+        assert strip_hrefs(got) == strip_hrefs(HTML)
+
+    def test_same_links_as_beautifulsoup(self):
+        for path in ['home.md', 'subdir/page.md', 'a/b/c.md']:
+            page = make_page(path)
+            fast = relative_paths(page, HTML)
+            slow = relative_paths_soup(page, HTML)
+            assert links(fast) == links(slow)
+
+    def test_rendered_page(self, page):
+        html = page.render()
+        assert links(relative_paths(page, html)) == \
+            links(relative_paths_soup(page, html))
+
+
+@tree_middleware
+def _heading_anchors(page, soup):
+    for heading in soup.find_all(['h1', 'h2']):
+        heading['id'] = heading.get_text().lower()
+
+
+@tree_middleware
+def _external_links(page, soup):
+    for a in soup.find_all('a', href=True):
+        if a['href'].startswith('http'):
+            a['class'] = 'external'
+
+
+def _shout(page, html):
+    return html.replace('Heading', 'HEADING')
+
+
+class TestTreeMiddleware:
+    def test_same_links_as_relative_paths(self):
+        for path in ['home.md', 'subdir/page.md', 'a/b/c.md']:
+            page = make_page(path)
+            soup = parse(HTML)
+            relative_paths_tree(page, soup)
+            assert links(str(soup)) == links(relative_paths(page, HTML))
+
+    def test_tree_middlewares_share_one_parse(self, builder, page,
+                                              monkeypatch):
+        parsed = []
+
+        def counting_parse(html):
+            parsed.append(html)
+            return parse(html)
+
+        monkeypatch.setattr('markdoc2.builder.parse', counting_parse)
+        b = Builder(dict(builder.config,
+                         middleware=[_heading_anchors, _external_links]))
+        assert b.middleware[-1] is relative_paths_tree
+
+        html = b.apply_middleware(page, page.render())
+
+        assert len(parsed) == 1
+        assert '<h1 id="heading">' in html
+        assert links(html) == links(relative_paths(page, page.render()))
+
+    def test_mixed_with_string_middleware(self, builder, page):
+        b = Builder(dict(builder.config,
+                         middleware=[_heading_anchors, _shout]))
+        html = b.apply_middleware(page, page.render())
+
+        # The string middleware sees the tree middleware's changes, and the
+        # tree middleware ran before the string one
+        assert '<h1 id="heading">HEADING</h1>' in html
+
+    def test_parallel_build(self, builder):
+        b = Builder(dict(builder.config, middleware=[_heading_anchors],
+                         jobs=2))
+        b.build()
+
+        with open(os.path.join(b.output_dir, 'home.html')) as f:
+            assert '<h1 id="heading">' in f.read()
@@ -0,0 +1,262 @@
+import os
+import sys
+import time
+import subprocess
+from collections import namedtuple
+
+import pytest
+
+from markdoc2 import notify
+from markdoc2.exceptions import WatcherError
+from markdoc2.ignore import IGNORE_FILE
+from markdoc2.notify import (ChangeSet, ChangeCollector, OnWriteHandler,
+                             PollingWatcher, start_watcher)
+
+
+Event = namedtuple('Event', ['pathname', 'dir'])
+
+
+class TestChangeSet:
+    def test_add(self):
+        changes = ChangeSet()
+        changes.add('created', 'a.md')
+        changes.add('modified', 'b.md')
+        changes.add('deleted', 'c.md')
+
+        assert changes.created == {'a.md'}
+        assert changes.modified == {'b.md'}
+        assert changes.deleted == {'c.md'}
+        assert len(changes) == 3
+
+    def test_created_then_modified_is_still_created(self):
+        changes = ChangeSet()
+        changes.add('created', 'a.md')
+        changes.add('modified', 'a.md')
+
+        assert changes.created == {'a.md'}
+        assert not changes.modified
+
+    def test_created_then_deleted_cancels_out(self):
+        changes = ChangeSet()
+        changes.add('created', 'a.md')
+        changes.add('deleted', 'a.md')
+
+        assert len(changes) == 0
+
+    def test_deleted_then_created_is_modified(self):
+        changes = ChangeSet()
+        changes.add('deleted', 'a.md')
+        changes.add('created', 'a.md')
+
+        assert changes.modified == {'a.md'}
+        assert not changes.created and not changes.deleted
+
+    def test_modified_then_deleted_is_deleted(self):
+        changes = ChangeSet()
+        changes.add('modified', 'a.md')
+        changes.add('deleted', 'a.md')
+
+        assert changes.deleted == {'a.md'}
+        assert not changes.modified
+
+
+class TestOnWriteHandler:
+    def test_events_are_debounced(self, builder):
+        builder.build()
+        handler = OnWriteHandler(builder=builder, debounce=10)
+        home = os.path.join(builder.wiki_dir, 'home.md')
+
+        for _ in range(5):
+            handler.process_IN_CLOSE_WRITE(Event(home, False))
+        assert handler.changes.modified == {home}
+
+        # Still inside the debounce window
+        assert handler.flush() is None
+
+        with open(home, 'a') as f:
+            f.write('\nMore text')
+        written = handler.flush(now=handler.last_event + 10)
+
+        assert written == [os.path.join(builder.output_dir, 'home.html')]
+        assert len(handler.changes) == 0
+
+    def test_ignored_files(self, builder):
+        handler = OnWriteHandler(builder=builder)
+        hidden = os.path.join(builder.wiki_dir, '.hidden_file', 'ignored.md')
+        not_a_doc = os.path.join(builder.wiki_dir, 'image.png')
+
+        handler.process_IN_CLOSE_WRITE(Event(hidden, False))
+        handler.process_IN_CLOSE_WRITE(Event(not_a_doc, False))
+
+        assert len(handler.changes) == 0
+
+
+@pytest.fixture
+def watcher(builder):
+    builder.build()
+    collector = ChangeCollector(builder, debounce=0)
+    watcher = PollingWatcher(collector)
+    watcher.start()
+    return watcher
+
+
+def _wiki(builder, *parts):
+    return os.path.join(builder.wiki_dir, *parts)
+
+
+class TestPollingWatcher:
+    def test_changes(self, builder, watcher):
+        with open(_wiki(builder, 'home.md'), 'a') as f:
+            f.write('\nMore text')
+        with open(_wiki(builder, 'subdir', 'new.md'), 'w') as f:
+            f.write('New page')
+        os.remove(_wiki(builder, 'another_page.md'))
+
+        assert watcher.poll() == 3
+
+        changes = watcher.collector.changes
+        assert changes.modified == {_wiki(builder, 'home.md')}
+        assert changes.created == {_wiki(builder, 'subdir', 'new.md')}
+        assert changes.deleted == {_wiki(builder, 'another_page.md')}
+
+    def test_nothing_changed(self, watcher):
+        assert watcher.poll() == 0
+        assert len(watcher.collector.changes) == 0
+
+    def test_new_directory(self, builder, watcher):
+        os.makedirs(_wiki(builder, 'new', 'nested'))
+        with open(_wiki(builder, 'new', 'nested', 'page.md'), 'w') as f:
+            f.write('New page')
+
+        watcher.poll()
+
+        # Everything inside gets built along with the directory
+        assert watcher.collector.changes.created == {_wiki(builder, 'new')}
+        assert _wiki(builder, 'new', 'nested', 'page.md') in watcher._files
+
+    def test_deleted_directory(self, builder, watcher):
+        subdir = _wiki(builder, 'subdir')
+        for name in os.listdir(subdir):
+            os.remove(os.path.join(subdir, name))
+        os.rmdir(subdir)
+
+        watcher.poll()
+
+        assert watcher.collector.changes.deleted == {subdir}
+        assert not any(path.startswith(subdir) for path in watcher._files)
+
+    def test_skips_hidden_and_other_files(self, builder, watcher):
+        os.makedirs(_wiki(builder, '.hidden'))
+        with open(_wiki(builder, '.hidden', 'page.md'), 'w') as f:
+            f.write('Hidden page')
+        with open(_wiki(builder, 'image.png'), 'wb') as f:
+            f.write(b'not really a png')
+
+        assert watcher.poll() == 0
+        assert _wiki(builder, '.hidden') not in watcher._dirs
+
+    def test_idle_ticks_only_stat_directories(self, watcher, monkeypatch):
+        watcher.files_per_tick = 0
+        stats = []
+        real_stat = os.stat
+
+        def counting_stat(path, *args, **kwargs):
+            stats.append(path)
+            return real_stat(path, *args, **kwargs)
+
+        monkeypatch.setattr(notify.os, 'stat', counting_stat)
+        watcher.poll()
+
+        # Plus checking once whether the ignore rules changed
+        ignore_file = _wiki(watcher.collector.builder, IGNORE_FILE)
+        assert sorted(stats) == sorted(list(watcher._dirs) + [ignore_file])
+
+    def test_ignore_rules_are_loaded_once_per_scan(self, builder,
+                                                   monkeypatch):
+        with open(_wiki(builder, IGNORE_FILE), 'w') as f:
+            f.write('drafts/\n')
+        for i in range(5):
+            with open(_wiki(builder, 'page{}.md'.format(i)), 'w') as f:
+                f.write('A page')
+
+        ignore_file = _wiki(builder, IGNORE_FILE)
+        stats = []
+        real_stat = os.stat
+
+        def counting_stat(path, *args, **kwargs):
+            stats.append(path)
+            return real_stat(path, *args, **kwargs)
+
+        monkeypatch.setattr(os, 'stat', counting_stat)
+        monkeypatch.setattr(os.path, 'isdir',
+                            lambda path: pytest.fail('isdir called'))
+        watcher = PollingWatcher(ChangeCollector(builder, debounce=0))
+        watcher.start()
+
+        assert stats.count(ignore_file) == 1
+
+    def test_files_are_checked_in_batches(self, builder, watcher):
+        watcher.files_per_tick = 1
+        home = _wiki(builder, 'home.md')
+        directory = os.stat(builder.wiki_dir)
+
+        # Change a file without its directory's mtime changing
+        with open(home, 'a') as f:
+            f.write('\nMore text')
+        os.utime(builder.wiki_dir, ns=(directory.st_atime_ns,
+                                       directory.st_mtime_ns))
+
+        for _ in range(len(watcher._files)):
+            if watcher.poll():
+                break
+        assert watcher.collector.changes.modified == {home}
+
+    def test_adaptive_interval(self, builder, watcher, monkeypatch):
+        monkeypatch.setattr(notify.time, 'sleep', lambda seconds: None)
+
+        def tick():
+            watcher._next_tick = 0
+            watcher.wait(0)
+
+        for _ in range(20):
+            tick()
+        assert watcher.delay == watcher.max_interval
+
+        with open(_wiki(builder, 'home.md'), 'a') as f:
+            f.write('\nMore text')
+        tick()
+        assert watcher.delay == watcher.interval
+
+
+class TestWatchers:
+    def test_unknown_backend(self, builder):
+        with pytest.raises(WatcherError):
+            start_watcher(ChangeCollector(builder), 'nope')
+
+    def test_import_without_pyinotify(self):
+        code = ('import sys; sys.modules["pyinotify"] = None\n'
+                'from markdoc2 import notify\n'
+                'print(notify.available_watchers())')
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=os.path.dirname(
+                                             os.path.dirname(__file__)))
+        assert output.decode().strip() == "['poll']"
+
+    def test_inotify(self, builder):
+        pytest.importorskip('pyinotify')
+        builder.build()
+        collector = ChangeCollector(builder, debounce=0)
+        watcher = start_watcher(collector, 'inotify')
+
+        try:
+            home = _wiki(builder, 'home.md')
+            with open(home, 'a') as f:
+                f.write('\nMore text')
+
+            deadline = time.monotonic() + 5
+            while not collector.changes and time.monotonic() < deadline:
+                watcher.wait(0.05)
+        finally:
+            watcher.stop()
+
+        assert collector.changes.modified == {home}
@@ -0,0 +1,184 @@
+import os
+import tarfile
+import zipfile
+import sqlite3
+import tempfile
+import shutil
+
+import pytest
+
+from markdoc2 import Builder
+from markdoc2.output import (OutputDir, MemoryOutput, TarOutput, ZipOutput,
+                             SqliteOutput, open_output)
+
+
+@pytest.fixture
+def output_dir(request):
+    root = tempfile.mkdtemp()
+    request.addfinalizer(lambda: shutil.rmtree(root))
+    return OutputDir(root)
+
+
+class TestOutputDir:
+    def test_write(self, output_dir):
+        filename = os.path.join(output_dir.root, 'a', 'b', 'page.html')
+
+        assert output_dir.write(filename, b'hello')
+        assert open(filename, 'rb').read() == b'hello'
+
+        # No temporary files are left lying around
+        assert os.listdir(os.path.dirname(filename)) == ['page.html']
+
+    def test_identical_writes_are_skipped(self, output_dir):
+        filename = os.path.join(output_dir.root, 'page.html')
+        output_dir.write(filename, b'hello')
+        os.utime(filename, ns=(0, 0))
+
+        assert not output_dir.write(filename, b'hello')
+        assert os.stat(filename).st_mtime_ns == 0
+
+    def test_changed_writes(self, output_dir):
+        filename = os.path.join(output_dir.root, 'page.html')
+        output_dir.write(filename, b'hello')
+
+        assert output_dir.write(filename, b'world')
+        assert open(filename, 'rb').read() == b'world'
+
+    def test_reset_forgets_directories(self, output_dir):
+        filename = os.path.join(output_dir.root, 'sub', 'page.html')
+        output_dir.write(filename, b'hello')
+        shutil.rmtree(os.path.dirname(filename))
+
+        output_dir.reset()
+        assert output_dir.write(filename, b'hello')
+
+
+class TestMemoryOutput:
+    def test_write(self, tmpdir):
+        output = MemoryOutput(str(tmpdir))
+        filename = str(tmpdir.join('sub', 'page.html'))
+
+        assert output.write(filename, b'hello')
+        assert not output.write(filename, b'hello')
+        assert output.files == {'sub/page.html': b'hello'}
+        assert output.exists(filename)
+        assert output.read(filename) == b'hello'
+
+        assert output.remove(filename)
+        assert not output.remove(filename)
+        assert output.read(filename) is None
+
+
+def _read_tar(filename):
+    with tarfile.open(filename) as tar:
+        return {member.name: tar.extractfile(member).read()
+                for member in tar.getmembers()}
+
+
+def _read_zip(filename):
+    with zipfile.ZipFile(filename) as z:
+        return {name: z.read(name) for name in z.namelist()}
+
+
+def _read_sqlite(filename):
+    db = sqlite3.connect(filename)
+    try:
+        return {href.lstrip('/'): content for href, content in
+                db.execute('SELECT href, content FROM pages')}
+    finally:
+        db.close()
+
+
+ARCHIVES = [
+        ('wiki.tar', TarOutput, _read_tar),
+        ('wiki.tar.gz', TarOutput, _read_tar),
+        ('wiki.zip', ZipOutput, _read_zip),
+        ('wiki.sqlite', SqliteOutput, _read_sqlite),
+        ]
+
+
+class TestArchives:
+    @pytest.mark.parametrize('name, cls, read', ARCHIVES)
+    def test_write(self, tmpdir, name, cls, read):
+        archive = str(tmpdir.join(name))
+        output = open_output(archive)
+        assert isinstance(output, cls)
+
+        output.write(os.path.join(archive, 'index.html'), b'home')
+        output.write(os.path.join(archive, 'sub', 'page.html'), b'page')
+        assert output.exists(os.path.join(archive, 'sub', 'page.html'))
+
+        # Nothing shows up until the archive is finished
+        assert not os.path.exists(archive)
+        output.close()
+
+        assert read(archive) == {'index.html': b'home',
+                                 'sub/page.html': b'page'}
+        assert os.listdir(str(tmpdir)) == [name]
+
+    def test_reset_discards_the_archive(self, tmpdir):
+        archive = str(tmpdir.join('wiki.zip'))
+        output = ZipOutput(archive)
+        output.write(os.path.join(archive, 'old.html'), b'old')
+        output.reset()
+        output.write(os.path.join(archive, 'new.html'), b'new')
+        output.close()
+
+        assert _read_zip(archive) == {'new.html': b'new'}
+        assert os.listdir(str(tmpdir)) == ['wiki.zip']
+
+    def test_open_output_defaults_to_a_directory(self, tmpdir):
+        assert isinstance(open_output(str(tmpdir)), OutputDir)
+
+
+class TestBuilderSinks:
+    def _build_to_directory(self, builder):
+        builder.config['search'] = True
+        b = Builder(builder.config)
+        b.build()
+
+        contents = {}
+        for dirpath, _, files in os.walk(b.output_dir):
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                filename = os.path.join(dirpath, name)
+                rel = os.path.relpath(filename, b.output_dir)
+                with open(filename, 'rb') as f:
+                    contents[rel.replace(os.sep, '/')] = f.read()
+        return contents
+
+    def test_memory(self, builder):
+        should_be = self._build_to_directory(builder)
+
+        output = MemoryOutput(builder.output_dir)
+        config = dict(builder.config, output=output)
+        Builder(config).build()
+
+        assert output.files == should_be
+
+    @pytest.mark.parametrize('name, cls, read', ARCHIVES)
+    def test_archives(self, builder, tmpdir, name, cls, read):
+        should_be = self._build_to_directory(builder)
+
+        archive = str(tmpdir.join(name))
+        config = dict(builder.config, **{'output-dir': archive})
+        b = Builder(config)
+        b.build()
+        assert read(archive) == should_be
+
+        # Building again starts a fresh archive
+        b.build()
+        assert read(archive) == should_be
+
+    @pytest.mark.parametrize('name, cls, read', ARCHIVES)
+    def test_archives_with_pipeline(self, builder, tmpdir, name, cls, read):
+        # Pages get written on the pipeline's writer thread, but the archive
+        # is finished on the main thread
+        should_be = self._build_to_directory(builder)
+
+        archive = str(tmpdir.join(name))
+        config = dict(builder.config, pipeline=True,
+                      **{'output-dir': archive})
+        Builder(config).build()
+        assert read(archive) == should_be
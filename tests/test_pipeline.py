@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from markdoc2.exceptions import InvalidFileName
+from markdoc2.output import MemoryOutput
+from markdoc2.pipeline import Pipeline, Stage, BoundedQueue, _DONE
+
+
+class TestBoundedQueue:
+    def test_tracks_depth(self):
+        q = BoundedQueue('read', 4)
+        for i in range(3):
+            q.put(i)
+        q.get()
+        q.put(3)
+        q.put(_DONE)
+
+        assert q.max_depth == 3
+        assert q.mean_depth == pytest.approx((1 + 2 + 3 + 3) / 4)
+        assert q.as_dict()['size'] == 4
+
+
+class TestPipeline:
+    def _outputs(self, filenames):
+        return {name: open(name).read() for name in filenames}
+
+    def test_matches_build(self, builder):
+        should_be = self._outputs(builder.build())
+
+        builder.pipeline = {'readers': 3, 'writers': 2, 'queue-size': 1}
+        builder.force = True
+        got = builder.build()
+
+        assert self._outputs(got) == should_be
+
+    def test_stats(self, builder):
+        builder.pipeline = True
+        filenames = builder.build()
+
+        stats = builder.pipeline_stats
+        assert set(stats.stages) == {'read', 'render', 'write'}
+        for stage in stats.stages.values():
+            assert stage['items'] == len(filenames)
+            assert 0 <= stage['utilisation'] <= 1
+        for q in stats.queues.values():
+            assert q['max_depth'] <= q['size']
+        assert 'render' in stats.summary()
+
+    def test_only_stale_pages(self, builder):
+        builder.build()
+
+        with open(os.path.join(builder.wiki_dir, 'home.md'), 'a') as f:
+            f.write('\nMore text\n')
+
+        builder.pipeline = True
+        builder.build()
+        assert builder.pipeline_stats.stages['read']['items'] == 1
+
+    def test_single_writer_for_other_outputs(self, builder):
+        builder.output = MemoryOutput(builder.output_dir)
+        pipeline = Pipeline(builder, writers=4)
+        assert pipeline.writers == 1
+
+    def test_with_worker_processes(self, builder):
+        should_be = self._outputs(builder.build())
+
+        builder.pipeline = True
+        builder.jobs = 2
+        builder.force = True
+        got = builder.build()
+
+        assert builder.pipeline_stats.stages['render']['threads'] == 2
+        assert self._outputs(got) == should_be
+
+    def test_workers_start_before_the_stages(self, builder, monkeypatch):
+        # Forking once the stage threads are running can deadlock a worker
+        started = []
+        start = Stage.start
+
+        def record(stage, pipeline):
+            started.append(len(pipeline._pool._processes))
+            start(stage, pipeline)
+
+        monkeypatch.setattr(Stage, 'start', record)
+        builder.pipeline = True
+        builder.jobs = 2
+        builder.build()
+
+        assert started == [2, 2, 2]
+
+    def test_errors_are_raised(self, builder):
+        builder.middleware.append(_explode)
+        builder.pipeline = {'queue-size': 1}
+
+        with pytest.raises(InvalidFileName):
+            builder.build()
+
+
+def _explode(page, html):
+    raise InvalidFileName(page.path)
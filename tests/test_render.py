@@ -1,7 +1,7 @@
 import os
 import jinja2
 
-from markdoc2.render import Page, Directory
+from markdoc2.render import Page, Directory, PageContext
 from markdoc2.builder import Crumb
 import markdoc2
 
@@ -56,6 +56,21 @@ class TestPage:
         assert p1 == p2
         assert p1 != p3
 
+    def test_is_slotted(self, page):
+        assert not hasattr(page, '__dict__')
+
+    def test_shared_context(self):
+        context = PageContext(markdoc2.TEMPLATE_DIR, DUMMY_WIKI)
+        p1 = Page('main.md', [Crumb('index', '/'), Crumb('main.md', None)],
+                  context=context)
+        p2 = Page('stuff.md', [Crumb('index', '/'), Crumb('stuff.md', None)],
+                  context=context)
+
+        assert p1.wiki_dir == DUMMY_WIKI
+        assert p1.template_dir == markdoc2.TEMPLATE_DIR
+        assert p1.md_extensions == Page.MD_EXTENSIONS
+        assert p1.engine is p2.engine
+
     def test_href(self):
         crumbs = [Crumb('index', '/'),
                   Crumb('subdir', '/subdir/'),
@@ -109,3 +124,51 @@ class TestDirectory:
         p = Directory('subdir/', crumbs, markdoc2.TEMPLATE_DIR, DUMMY_WIKI)
 
         assert p.href == '/subdir/index.html'
+
+
+class TestFrontMatter:
+    def _page(self, tmpdir, text):
+        tmpdir.join('getting-started.md').write(text)
+        crumbs = [Crumb('index', '/'), Crumb('getting-started.md', None)]
+        return Page('getting-started.md', crumbs, markdoc2.TEMPLATE_DIR,
+                    str(tmpdir))
+
+    def test_title(self, tmpdir):
+        page = self._page(tmpdir, '---\ntitle: Welcome\n---\nHello\n')
+
+        assert page.metadata == {'title': 'Welcome'}
+        assert page.title == 'Welcome'
+        assert page.display_crumbs[-1] == Crumb('Welcome', None)
+
+    def test_without_front_matter(self, tmpdir):
+        page = self._page(tmpdir, 'Hello\n')
+
+        assert page.metadata == {}
+        assert page.title == 'Getting Started'
+        assert page.display_crumbs == page.crumbs
+
+    def test_not_rendered(self, tmpdir):
+        page = self._page(tmpdir, '---\ntitle: Welcome\n---\nHello\n')
+        assert page.render_markdown() == '<p>Hello</p>'
+
+    def test_starts_with_a_horizontal_rule(self, tmpdir):
+        # Not front matter, so none of the page gets thrown away
+        page = self._page(tmpdir, '---\n\nIntro paragraph.\n\n---\n\n'
+                                  'Rest of page.\n')
+
+        assert page.metadata == {}
+        html = page.render_markdown()
+        assert 'Intro paragraph.' in html
+        assert html.count('<hr') == 2
+
+    def test_shown_in_listing(self, tmpdir):
+        page = self._page(tmpdir, '---\ntitle: Welcome\ntags: [intro]\n'
+                                  'date: 2024-01-31\n---\nHello\n')
+        d = Directory('.', [Crumb('index', '/')], markdoc2.TEMPLATE_DIR,
+                      str(tmpdir))
+        d.add_child(page)
+
+        html = d.render()
+        assert 'Welcome' in html
+        assert 'intro' in html
+        assert '2024-01-31' in html
@@ -0,0 +1,158 @@
+import os
+import json
+
+import pytest
+
+from markdoc2 import Builder
+from markdoc2.search import (SearchIndex, Document, extract, shard_name,
+                             tokenise, STATE_NAME)
+
+
+def _search(builder, term):
+    """
+    Look a term up the way a browser would, returning the matching hrefs.
+    """
+    search_dir = os.path.join(builder.output_dir, 'search')
+    with open(os.path.join(search_dir, 'docs.json')) as f:
+        docs = json.load(f)
+
+    shard = os.path.join(search_dir, 'shards',
+                         shard_name(term, docs['prefix_length']) + '.json')
+    if not os.path.exists(shard):
+        return []
+    with open(shard) as f:
+        postings = json.load(f).get(term, [])
+    return [docs['docs'][str(doc_id)]['href'] for doc_id, _ in postings]
+
+
+@pytest.fixture
+def searchable(builder):
+    builder.config['search'] = True
+    return Builder(builder.config)
+
+
+class TestExtract:
+    def test_tokenise(self):
+        assert tokenise('Hello, World! a 42') == ['hello', 'world', '42']
+
+    def test_headings_and_title_count_for_more(self, page):
+        document = extract(page, '<h1>Heading</h1>\n<p>Heading &amp; '
+                                 '<em>text</em></p>')
+        assert document.href == page.href
+        assert document.title == 'Home'
+        assert document.terms['text'] == 1
+        assert document.terms['heading'] > 2
+        assert document.terms['home'] > document.terms['heading']
+
+    def test_shard_name(self):
+        assert shard_name('markdown') == 'ma'
+        assert shard_name('x') == 'x'
+        assert shard_name('über') == '_b'
+
+
+class TestSearchIndex:
+    def test_update_and_remove(self, tmpdir, builder):
+        index = SearchIndex(str(tmpdir))
+        index.update('a.md', Document('/a.html', 'A', {'apple': 1}))
+        index.update('b.md', Document('/b.html', 'B',
+                                      {'apple': 3, 'banana': 1}))
+        index.save(builder.output)
+
+        shard = tmpdir.join('search', 'shards', 'ap.json')
+        assert json.loads(shard.read()) == {'apple': [[1, 3], [0, 1]]}
+
+        index = SearchIndex.load(str(tmpdir))
+        assert 'a.md' in index
+        index.remove('b.md')
+        index.update('a.md', Document('/a.html', 'A', {'avocado': 2}))
+        index.save(builder.output)
+
+        assert not shard.exists()
+        assert not tmpdir.join('search', 'shards', 'ba.json').exists()
+        assert json.loads(tmpdir.join('search', 'shards', 'av.json')
+                          .read()) == {'avocado': [[0, 2]]}
+
+    def test_load_without_output(self, tmpdir):
+        tmpdir.join(STATE_NAME).write('{"version": 1}')
+        assert len(SearchIndex.load(str(tmpdir))) == 0
+
+
+class TestBuilderSearch:
+    def _count_extractions(self, builder, monkeypatch):
+        extracted = []
+        real_extract = extract
+
+        def spy(page, content):
+            extracted.append(page.path)
+            return real_extract(page, content)
+
+        monkeypatch.setattr('markdoc2.search.extract', spy)
+        return extracted
+
+    def test_search_is_off_by_default(self, builder):
+        builder.build()
+        assert not os.path.exists(os.path.join(builder.output_dir, 'search'))
+
+    def test_build(self, searchable):
+        searchable.build()
+
+        assert _search(searchable, 'heading') == ['/home.html']
+        assert _search(searchable, 'stuff') == ['/subdir/stuff.html']
+        assert _search(searchable, 'nothing') == []
+
+    def test_unchanged_pages_are_not_retokenised(self, searchable,
+                                                 monkeypatch):
+        searchable.build()
+        extracted = self._count_extractions(searchable, monkeypatch)
+
+        searchable.build()
+        assert extracted == []
+
+        with open(os.path.join(searchable.wiki_dir, 'home.md'), 'w') as f:
+            f.write('Completely different words')
+        searchable.build()
+
+        assert extracted == ['home.md']
+        assert _search(searchable, 'heading') == []
+        assert _search(searchable, 'different') == ['/home.html']
+
+    def test_deleted_pages_are_removed(self, searchable):
+        searchable.build()
+        os.remove(os.path.join(searchable.wiki_dir, 'home.md'))
+        searchable.build()
+
+        assert _search(searchable, 'heading') == []
+
+    def test_rebuild(self, searchable):
+        searchable.build()
+        home = os.path.join(searchable.wiki_dir, 'home.md')
+        with open(home, 'w') as f:
+            f.write('Some fresh content')
+        stuff = os.path.join(searchable.wiki_dir, 'subdir', 'stuff.md')
+        os.remove(stuff)
+
+        written = searchable.rebuild(modified=[home], deleted=[stuff])
+
+        assert _search(searchable, 'fresh') == ['/home.html']
+        assert _search(searchable, 'stuff') == []
+        assert any('search' in filename for filename in written)
+
+    def test_enabling_search_indexes_fresh_pages(self, builder):
+        builder.build()
+
+        builder.config['search'] = True
+        b = Builder(builder.config)
+        b.build()
+
+        assert _search(b, 'heading') == ['/home.html']
+
+    def test_parallel_build(self, searchable):
+        searchable.jobs = 2
+        searchable.build()
+
+        assert _search(searchable, 'heading') == ['/home.html']
+
+    def test_iter_build(self, searchable):
+        list(searchable.iter_build())
+
+        assert _search(searchable, 'heading') == ['/home.html']
@@ -0,0 +1,115 @@
+import os
+import threading
+import urllib.request
+import urllib.error
+
+import pytest
+
+from markdoc2.server import (DevServer, ReloadHub, inject_reload_script,
+                             hrefs_for, RELOAD_SCRIPT)
+from markdoc2.lazy import LazyRenderer
+
+
+@pytest.fixture
+def server(request, builder):
+    builder.build()
+    s = DevServer(('127.0.0.1', 0), builder.output_dir)
+    thread = threading.Thread(target=s.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        s.shutdown()
+        s.server_close()
+    request.addfinalizer(stop)
+    return s
+
+
+def get(server, path, headers=None):
+    url = 'http://127.0.0.1:{}{}'.format(server.server_address[1], path)
+    req = urllib.request.Request(url, headers=headers or {})
+    try:
+        return urllib.request.urlopen(req)
+    except urllib.error.HTTPError as e:
+        return e
+
+
+class TestDevServer:
+    def test_pages_get_the_reload_script(self, server):
+        response = get(server, '/home.html')
+        assert response.status == 200
+        assert RELOAD_SCRIPT in response.read()
+
+    def test_directories_serve_their_index(self, server):
+        response = get(server, '/subdir/')
+        assert response.status == 200
+        assert b'stuff.md' in response.read()
+
+    def test_etag(self, server):
+        etag = get(server, '/home.html').headers['ETag']
+        assert etag
+
+        response = get(server, '/home.html', {'If-None-Match': etag})
+        assert response.status == 304
+
+    def test_last_modified(self, server):
+        last_modified = get(server, '/home.html').headers['Last-Modified']
+
+        response = get(server, '/home.html',
+                       {'If-Modified-Since': last_modified})
+        assert response.status == 304
+
+    def test_missing_page(self, server):
+        assert get(server, '/nope.html').status == 404
+
+
+class TestLazyServer:
+    def test_pages_are_rendered_on_demand(self, request, builder):
+        s = DevServer(('127.0.0.1', 0), builder.output_dir,
+                      renderer=LazyRenderer(builder))
+        thread = threading.Thread(target=s.serve_forever, daemon=True)
+        thread.start()
+        request.addfinalizer(s.server_close)
+        request.addfinalizer(s.shutdown)
+
+        # Nothing has been built
+        assert not os.listdir(builder.output_dir)
+
+        response = get(s, '/subdir/stuff.html')
+        assert response.status == 200
+        etag = response.headers['ETag']
+
+        response = get(s, '/subdir/stuff.html', {'If-None-Match': etag})
+        assert response.status == 304
+
+
+class TestReloadHub:
+    def test_notify(self):
+        hub = ReloadHub()
+        q = hub.subscribe()
+
+        hub.notify(['/b.html', '/a.html'])
+        assert q.get_nowait() == ['/a.html', '/b.html']
+
+        hub.unsubscribe(q)
+        hub.notify(['/a.html'])
+        assert q.empty()
+
+    def test_close_wakes_listeners(self):
+        hub = ReloadHub()
+        q = hub.subscribe()
+        hub.close()
+        assert q.get_nowait() is None
+
+
+def test_inject_reload_script():
+    html = b'<html><body><p>Hi</p></body></html>'
+    got = inject_reload_script(html)
+    assert got == (b'<html><body><p>Hi</p>' + RELOAD_SCRIPT +
+                   b'</body></html>')
+
+
+def test_hrefs_for(builder):
+    filenames = builder.build()
+    hrefs = hrefs_for(builder, filenames)
+    assert '/subdir/stuff.html' in hrefs
+    assert '/index.html' in hrefs
@@ -0,0 +1,44 @@
+import os
+import pickle
+import tempfile
+import shutil
+
+from markdoc2.templating import TemplateEngine, get_engine
+import markdoc2
+
+
+class TestTemplateEngine:
+    def test_templates_are_only_compiled_once(self):
+        engine = TemplateEngine(markdoc2.TEMPLATE_DIR)
+        first = engine.get_template('document.html')
+        second = engine.get_template('document.html')
+        assert first is second
+
+    def test_render(self):
+        engine = TemplateEngine(markdoc2.TEMPLATE_DIR)
+        crumbs = [markdoc2.Crumb('index', '/')]
+        html = engine.render('document.html',
+                             content='<p>Hello</p>',
+                             title='Home',
+                             crumbs=crumbs)
+        assert '<p>Hello</p>' in html
+
+    def test_bytecode_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            engine = TemplateEngine(markdoc2.TEMPLATE_DIR, cache_dir)
+            engine.get_template('document.html')
+            assert os.listdir(cache_dir)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_pickling_reuses_engine(self):
+        engine = get_engine(markdoc2.TEMPLATE_DIR)
+        assert pickle.loads(pickle.dumps(engine)) is engine
+
+
+class TestBuilderTemplates:
+    def test_pages_share_the_builders_engine(self, builder):
+        directories, pages = builder.paths_to_pages()
+        for thing in pages + list(directories.values()):
+            assert thing.engine is builder.templates
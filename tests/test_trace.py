@@ -0,0 +1,87 @@
+import os
+import json
+import pickle
+
+from markdoc2 import trace, Builder
+
+
+class TestTracer:
+    def test_span_records_event(self):
+        tracer = trace.Tracer()
+        with tracer.span('markdown', 'stage', page='home.md'):
+            pass
+
+        event, = tracer.events
+        assert event['name'] == 'markdown'
+        assert event['ph'] == 'X'
+        assert event['dur'] >= 0
+        assert event['args'] == {'page': 'home.md'}
+
+    def test_null_tracer_records_nothing(self):
+        tracer = trace.NullTracer()
+        with tracer.span('markdown', 'stage', page='home.md'):
+            pass
+        assert tracer.drain() == []
+
+    def test_module_span_uses_active_tracer(self):
+        tracer = trace.Tracer()
+        with trace.activate(tracer):
+            with trace.span('something'):
+                pass
+
+        assert len(tracer.events) == 1
+        assert isinstance(trace.get_tracer(), trace.NullTracer)
+
+    def test_slowest_pages(self):
+        tracer = trace.Tracer()
+        tracer.add('read', 'stage', 0, 1000, {'page': 'a.md'})
+        tracer.add('markdown', 'stage', 1000, 5000, {'page': 'b.md'})
+        tracer.add('write', 'stage', 0, 2000, {'page': 'a.md'})
+        # Containers don't get counted twice
+        tracer.add('build_page', 'page', 0, 9000, {'page': 'a.md'})
+
+        assert tracer.slowest_pages(1) == [('b.md', 4e-6)]
+        assert dict(tracer.slowest_pages()) == {'a.md': 3e-6, 'b.md': 4e-6}
+
+    def test_pickled_copy_is_empty(self):
+        tracer = trace.Tracer()
+        tracer.add('read', 'stage', 0, 1000, {'page': 'a.md'})
+
+        copy = pickle.loads(pickle.dumps(tracer))
+        assert isinstance(copy, trace.Tracer)
+        assert copy.events == []
+
+
+class TestBuildTracing:
+    def traced(self, builder, **config):
+        builder.config.update(config, trace=True)
+        return Builder(builder.config)
+
+    def test_untraced_build(self, builder):
+        builder.build()
+        assert builder.tracer.drain() == []
+
+    def test_build_records_each_stage(self, builder, tmpdir):
+        b = self.traced(builder)
+        b.build()
+
+        names = {event['name'] for event in b.tracer.events}
+        assert {'read', 'markdown', 'template', 'relative_paths', 'write',
+                'build_page'} <= names
+
+        filename = str(tmpdir.join('trace.json'))
+        b.tracer.save(filename)
+        with open(filename) as f:
+            assert json.load(f)['traceEvents'] == b.tracer.events
+
+        assert 'Slowest pages:' in b.tracer.summary()
+
+    def test_parallel_build_collects_worker_events(self, builder):
+        b = self.traced(builder, jobs=2)
+        b.build()
+
+        pids = {event['pid'] for event in b.tracer.events
+                if event['name'] == 'markdown'}
+        # Pages were rendered by the workers, not this process
+        assert pids and os.getpid() not in pids
+        assert b.tracer.slowest_pages()